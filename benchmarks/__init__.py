@@ -0,0 +1,6 @@
+"""Benchmarks, load tests and query-plan checks for v8.py.
+
+Every module is a standalone script (``python benchmarks/<name>.py`` or
+``python -m benchmarks.<name>``) that works on temporary databases and talks to
+the in-process stub Bot API in benchmarks.stub_bot rather than to Telegram.
+"""
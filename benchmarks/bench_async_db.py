@@ -0,0 +1,99 @@
+"""Shows what the async data-access layer buys the event loop.
+
+Usage:
+    python benchmarks/bench_async_db.py [--writes 2000]
+
+1. Event-loop stall: a deliberately slow query runs while a ticker coroutine
+   (standing in for other updates) measures how late it gets woken up.
+2. Group commit: many concurrent single-row writes, once through the sync
+   db_query and once through the batching writer task.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import v8  # noqa: E402
+
+SLOW_QUERY = """
+    WITH RECURSIVE n(i) AS (SELECT 1 UNION ALL SELECT i + 1 FROM n WHERE i < 3000000)
+    SELECT COUNT(*) FROM n
+"""
+
+
+async def ticker(stop: asyncio.Event, interval: float = 0.01) -> float:
+    """Returns the worst lateness (in seconds) of a periodic 10 ms wake-up."""
+    worst = 0.0
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        worst = max(worst, time.perf_counter() - start - interval)
+    return worst
+
+
+async def measure_stall(run_query) -> float:
+    stop = asyncio.Event()
+    tick = asyncio.create_task(ticker(stop))
+    await asyncio.sleep(0.05)
+    await run_query()
+    stop.set()
+    return await tick
+
+
+async def sync_slow_query():
+    v8.db_query(SLOW_QUERY)
+
+
+async def async_slow_query():
+    await v8.db_read(SLOW_QUERY)
+
+
+async def sync_writes(count):
+    for uid in range(count):
+        v8.db_query("UPDATE subscribers SET remaining_days = remaining_days - 1 WHERE user_id = ?", (uid,))
+
+
+async def async_writes(count):
+    await asyncio.gather(*(
+        v8.db_write("UPDATE subscribers SET remaining_days = remaining_days - 1 WHERE user_id = ?", (uid,))
+        for uid in range(count)
+    ))
+
+
+async def run(args):
+    print("Event-loop stall while a slow query runs:")
+    print(f"  sync db_query:  worst tick delay {await measure_stall(sync_slow_query) * 1000:8.1f} ms")
+    print(f"  await db_read:  worst tick delay {await measure_stall(async_slow_query) * 1000:8.1f} ms")
+
+    print(f"\n{args.writes:,} single-row writes:")
+    for label, fn in (("sync db_query", sync_writes), ("await db_write", async_writes)):
+        start = time.perf_counter()
+        await fn(args.writes)
+        elapsed = time.perf_counter() - start
+        print(f"  {label:<15} {elapsed * 1000:8.1f} ms  ({args.writes / elapsed:,.0f} writes/s)")
+
+    await v8.async_db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writes", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        v8.db = v8.Database(os.path.join(tmp, "bench.db"))
+        v8.setup_database()
+        v8.db.write_many(
+            "INSERT INTO subscribers (user_id, first_name, plan_days, remaining_days) VALUES (?, ?, 30, 30)",
+            ((uid, f"User {uid}") for uid in range(args.writes)),
+        )
+        asyncio.run(run(args))
+        v8.db.close()
+
+
+if __name__ == "__main__":
+    main()
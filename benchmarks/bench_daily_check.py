@@ -0,0 +1,156 @@
+"""Benchmark: per-row daily_subscription_check vs. the ledger-based apply_daily_check.
+
+The per-row variant decrements remaining_days and keeps no-post days in the legacy
+JSON columns; the ledger variant records the posting day (as admin_post_handler
+does) and only looks up the rows at a threshold. Both start from the same balances.
+
+Usage:
+    python benchmarks/bench_daily_check.py [--managed 100000] [--offline 100000]
+
+Both variants run the database work of one day of accounting on identical copies
+of a synthetic database: once for a day on which the admin posted and once for a
+day without a post. Telegram sends are not timed.
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import v8  # noqa: E402
+
+TODAY = "2024-06-01"
+
+
+def load_days(no_post_days_json):
+    """The legacy no_post_days column: a JSON list of dates, '[]' or NULL when empty."""
+    try:
+        return json.loads(no_post_days_json) if no_post_days_json else []
+    except (ValueError, TypeError):
+        return []
+
+
+def legacy_daily_check(today):
+    """The pre-set-based job: one UPDATE (and commit) per row, plus a SELECT per expiry."""
+    last_post_result = v8.db_query("SELECT last_post_date FROM admin_activity WHERE id = 1")
+    admin_posted_today = bool(last_post_result) and last_post_result[0][0] == today
+    reminders, expired = [], []
+
+    managed_users = v8.db_query(
+        "SELECT user_id, remaining_days, no_post_days FROM subscribers WHERE is_active = 1 AND plan_days != -1"
+    )
+    for user_id, remaining_days, no_post_days_json in managed_users:
+        no_post_days = load_days(no_post_days_json)
+        new_remaining_days = remaining_days
+        if admin_posted_today:
+            new_remaining_days = max(0, remaining_days - 1)
+            v8.db_query("UPDATE subscribers SET remaining_days = ? WHERE user_id = ?", (new_remaining_days, user_id))
+        elif today not in no_post_days:
+            no_post_days.append(today)
+            v8.db_query(
+                "UPDATE subscribers SET no_post_days = ? WHERE user_id = ?",
+                (json.dumps(no_post_days), user_id)
+            )
+        if new_remaining_days in [1, 2, 3]:
+            reminders.append((user_id, new_remaining_days))
+        if new_remaining_days <= 0:
+            expired.append(v8.db_query("SELECT first_name FROM subscribers WHERE user_id = ?", (user_id,)))
+            v8.db_query("UPDATE subscribers SET is_active = 0 WHERE user_id = ?", (user_id,))
+
+    offline_records = v8.db_query(
+        "SELECT id, remaining_days, no_post_days FROM offline_subscribers WHERE plan_days != -1"
+    )
+    for rec_id, remaining_days, no_post_days_json in offline_records:
+        no_post_days = load_days(no_post_days_json)
+        if admin_posted_today:
+            v8.db_query("UPDATE offline_subscribers SET remaining_days = ? WHERE id = ?", (max(0, remaining_days - 1), rec_id))
+        elif today not in no_post_days:
+            no_post_days.append(today)
+            v8.db_query("UPDATE offline_subscribers SET no_post_days = ? WHERE id = ?", (json.dumps(no_post_days), rec_id))
+
+    return reminders, expired
+
+
+def ledger_daily_check(today):
+    with v8.db.transaction() as conn:
+        last_post = conn.execute("SELECT last_post_date FROM admin_activity WHERE id = 1").fetchone()
+        if last_post[0] == today:
+            v8.record_posting_day(conn, today)
+        return v8.apply_daily_check(conn)
+
+
+def build_database(path, managed, offline):
+    v8.db = v8.Database(path)
+    v8.setup_database()
+    rng = random.Random(42)
+    history = '["2024-05-01", "2024-05-02", "2024-05-03"]'
+
+    def plan():
+        return rng.choice((7, 14, 30, 30, 90, -1))
+
+    managed_rows = []
+    for uid in range(1, managed + 1):
+        plan_days = plan()
+        remaining = -1 if plan_days == -1 else rng.randint(0, plan_days)
+        managed_rows.append((uid, f"user{uid}", f"User {uid}", plan_days, remaining, history))
+    v8.db.write_many(
+        "INSERT INTO subscribers (user_id, username, first_name, plan_days, remaining_days, start_date, is_active, no_post_days) "
+        "VALUES (?, ?, ?, ?, ?, '2024-05-01', 1, ?)",
+        managed_rows
+    )
+
+    offline_rows = []
+    for rec in range(offline):
+        plan_days = plan()
+        remaining = -1 if plan_days == -1 else rng.randint(0, plan_days)
+        offline_rows.append((f"Offline {rec}", plan_days, remaining, history))
+    v8.db.write_many(
+        "INSERT INTO offline_subscribers (identifier, plan_days, remaining_days, start_date, no_post_days) "
+        "VALUES (?, ?, ?, '2024-05-01', ?)",
+        offline_rows
+    )
+    # The same balances in the ledger columns, adopted the way the ledger migration does it.
+    with v8.db.transaction() as conn:
+        v8.audit_balances(conn, repair=True)
+    v8.db.close()
+
+
+def time_variant(label, fn, template, workdir, posted):
+    path = os.path.join(workdir, f"{label}.db")
+    shutil.copyfile(template, path)
+    v8.db = v8.Database(path)
+    v8.db.write("UPDATE admin_activity SET last_post_date = ? WHERE id = 1", (TODAY if posted else None,))
+    start = time.perf_counter()
+    reminders, expired = fn(TODAY)
+    elapsed = time.perf_counter() - start
+    v8.db.close()
+    return elapsed, len(reminders), len(expired)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--managed", type=int, default=100000)
+    parser.add_argument("--offline", type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        template = os.path.join(tmp, "template.db")
+        build_database(template, args.managed, args.offline)
+        print(f"{args.managed:,} managed + {args.offline:,} offline rows\n")
+
+        for posted in (True, False):
+            day = "admin posted" if posted else "no post"
+            legacy = time_variant("legacy", legacy_daily_check, template, tmp, posted)
+            new = time_variant("ledger", ledger_daily_check, template, tmp, posted)
+            assert legacy[1:] == new[1:], (legacy, new)
+            print(f"{day:<13} per-row: {legacy[0]:8.2f} s   ledger: {new[0]:8.3f} s   "
+                  f"speedup: {legacy[0] / new[0]:6.1f}x   ({new[1]} reminders, {new[2]} expired)")
+
+
+if __name__ == "__main__":
+    main()
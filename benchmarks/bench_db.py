@@ -0,0 +1,78 @@
+"""Micro-benchmark: per-call sqlite3.connect() vs. the persistent Database layer.
+
+Usage:
+    python benchmarks/bench_db.py [--rows 10000] [--iterations 5000]
+
+Both variants run the same point lookups and single-row updates against a
+temporary copy of the subscribers schema.
+"""
+import argparse
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import v8  # noqa: E402
+
+SELECT_ONE = "SELECT * FROM subscribers WHERE user_id = ?"
+UPDATE_ONE = "UPDATE subscribers SET remaining_days = ? WHERE user_id = ?"
+
+
+def legacy_db_query(path, query, params=()):
+    """The original db_query: a fresh connection and commit for every statement."""
+    with sqlite3.connect(path) as conn:
+        cursor = conn.cursor()
+        cursor.execute(query, params)
+        conn.commit()
+        return cursor.fetchall()
+
+
+def populate(rows):
+    v8.setup_database()
+    v8.db.write_many(
+        "INSERT INTO subscribers (user_id, username, first_name, plan_days, remaining_days, start_date, payment_info) "
+        "VALUES (?, ?, ?, 30, 30, '2024-01-01', 'bench')",
+        ((uid, f"user{uid}", f"User {uid}") for uid in range(1, rows + 1)),
+    )
+
+
+def timed(label, fn, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    elapsed = time.perf_counter() - start
+    print(f"{label:<32} {iterations / elapsed:>12,.0f} ops/s  {elapsed / iterations * 1e6:>9.1f} us/op")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--iterations", type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        v8.db = v8.Database(path)
+        populate(args.rows)
+
+        ids = [random.randint(1, args.rows) for _ in range(args.iterations)]
+        picks = iter(ids * 4)
+
+        print(f"{args.rows:,} rows, {args.iterations:,} iterations\n")
+        legacy_read = timed("read: connect per call", lambda: legacy_db_query(path, SELECT_ONE, (next(picks),)), args.iterations)
+        pooled_read = timed("read: persistent reader", lambda: v8.db_query(SELECT_ONE, (next(picks),)), args.iterations)
+        legacy_write = timed("write: connect per call", lambda: legacy_db_query(path, UPDATE_ONE, (7, next(picks))), args.iterations)
+        pooled_write = timed("write: persistent writer", lambda: v8.db_query(UPDATE_ONE, (7, next(picks))), args.iterations)
+
+        print(f"\nread speedup:  {legacy_read / pooled_read:.1f}x")
+        print(f"write speedup: {legacy_write / pooled_write:.1f}x")
+        v8.db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+"""Smoke test for pausing and resuming broadcast jobs.
+
+Usage:
+    python benchmarks/broadcast_smoke.py
+
+Runs real broadcast jobs against the in-process stub Bot API:
+
+1. a job (v8.create_broadcast_job + v8.Broadcast) is paused while the first sends
+   are in flight, so every worker parks on the pause, then resumed. It must finish
+   as 'completed' with every recipient delivered and none left pending,
+2. a paused job copying a source message, with no Broadcast running (as after a
+   restart), is resumed with the job list's resume button through the real
+   application. The remaining recipients must get copyMessage, not the preview text.
+
+Exits with status 1 on failure.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import v8  # noqa: E402
+from telegram import Update  # noqa: E402
+from telegram.ext import Application  # noqa: E402
+
+from benchmarks.stub_bot import STUB_TOKEN, StubRequest  # noqa: E402
+
+# More than one round of workers, but fewer than two: after the pause most workers
+# find the queue already drained.
+RECIPIENTS = v8.BROADCAST_CONCURRENCY + 4
+
+
+async def wait_for(predicate, timeout: float = 10.0) -> bool:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while asyncio.get_running_loop().time() < deadline:
+        if predicate():
+            return True
+        await asyncio.sleep(0.01)
+    return False
+
+
+async def pause_and_resume() -> list:
+    failures = []
+    application = Application.builder().token(STUB_TOKEN).request(StubRequest(latency=0.05)).build()
+    async with application:
+        job_id, _ = await v8.async_db.run_write(lambda conn: v8.create_broadcast_job(conn, "Smoke test"))
+        broadcast = v8.Broadcast(application.bot, job_id, "Smoke test", None, None)
+        task = asyncio.create_task(broadcast.run())
+        await asyncio.sleep(0.01)
+        broadcast.pause()
+        # Let the in-flight sends finish so every worker is parked on the pause.
+        await asyncio.sleep(0.3)
+        broadcast.resume()
+        try:
+            await asyncio.wait_for(task, timeout=10)
+        except Exception as e:
+            failures.append(f"broadcast run raised {type(e).__name__}: {e}")
+
+        await wait_for(lambda: not v8.active_broadcasts)
+        counts = await v8.fetch_broadcast_counts(job_id)
+        status = (await v8.db_read("SELECT status FROM broadcast_jobs WHERE id = ?", (job_id,)))[0][0]
+        print(f"pause/resume      -> status {status}, delivered {counts['delivered']}, "
+              f"failed {counts['failed']}, pending {counts['pending']}")
+        if status != 'completed':
+            failures.append(f"paused and resumed job ended as '{status}', expected 'completed'")
+        if counts['pending'] or counts['delivered'] != RECIPIENTS:
+            failures.append(f"paused and resumed job left {counts['pending']} recipients pending")
+    await v8.async_db.close()
+    return failures
+
+
+async def resume_paused_copy_job() -> list:
+    failures = []
+    source = (v8.ADMIN_ID, 99)
+    job_id, recipients = await v8.async_db.run_write(
+        lambda conn: v8.create_broadcast_job(conn, "[photo] Smoke test", source)
+    )
+    await v8.db_write("UPDATE broadcast_jobs SET status = 'paused' WHERE id = ?", (job_id,))
+
+    stub = StubRequest()
+    application = v8.build_application(
+        Application.builder().token(STUB_TOKEN).request(stub).get_updates_request(StubRequest())
+    )
+    admin = {"id": v8.ADMIN_ID, "is_bot": False, "first_name": "Admin"}
+    async with application:
+        await application.start()
+        await application.process_update(Update.de_json({"update_id": 1, "callback_query": {
+            "id": "1", "from": admin, "chat_instance": "smoke", "data": f"bjob:resume:{job_id}",
+            "message": {"message_id": 1, "date": int(time.time()), "text": "jobs",
+                        "chat": {"id": v8.ADMIN_ID, "type": "private", "first_name": "Admin"}},
+        }}, application.bot))
+        await wait_for(lambda: job_id in v8.active_broadcasts)
+        await wait_for(lambda: not v8.active_broadcasts)
+        await application.stop()
+
+    copies = [params for params in stub.calls_to("copyMessage")
+              if (params.get("from_chat_id"), params.get("message_id")) == source]
+    texts = [params for params in stub.calls_to("sendMessage") if params.get("chat_id") != v8.ADMIN_ID]
+    print(f"resume after restart -> {len(copies)} copyMessage, {len(texts)} sendMessage to subscribers")
+    if len(copies) != recipients or texts:
+        failures.append(f"resumed copy job sent {len(texts)} texts and {len(copies)}/{recipients} copies")
+    await v8.async_db.close()
+    return failures
+
+
+async def run() -> list:
+    return await pause_and_resume() + await resume_paused_copy_job()
+
+
+def main():
+    argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter).parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        v8.db = v8.Database(os.path.join(tmp, "broadcast.db"))
+        v8.setup_database()
+        v8.db.write_many(
+            "INSERT INTO subscribers (user_id, username, first_name, plan_days, start_date, is_active, "
+            "start_seq, expiry_seq) VALUES (?, ?, ?, 30, '2024-05-01', 1, -18, 12)",
+            ((uid, f"user{uid}", f"User {uid}") for uid in range(1, RECIPIENTS + 1)),
+        )
+        failures = asyncio.run(run())
+        v8.db.close()
+
+    for failure in failures:
+        print(f"FAIL  {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK    broadcast jobs survive pause and resume")
+
+
+if __name__ == "__main__":
+    main()
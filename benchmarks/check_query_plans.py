@@ -0,0 +1,54 @@
+"""Query-plan regression check for the bot's hot queries.
+
+Usage:
+    python benchmarks/check_query_plans.py [--db subscribers.db] [--verbose]
+
+Applies the schema migrations to a fresh temporary database (or to a copy of
+--db, so real statistics are used), runs EXPLAIN QUERY PLAN on every query
+listed by v8.hot_queries() and exits with status 1 if any of them falls back to
+a full table scan. Plans from SQLite before 3.36 ("SCAN TABLE ...") are
+recognised too; ordered index walks ("SCAN ... USING INDEX") are not counted.
+Suitable as a CI gate.
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import v8  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", help="check against a copy of this database instead of an empty one")
+    parser.add_argument("--verbose", action="store_true", help="print the plan of every query")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "plans.db")
+        if args.db:
+            shutil.copyfile(args.db, path)
+        v8.db = v8.Database(path)
+        v8.setup_database()
+
+        with v8.db.transaction() as conn:
+            if args.verbose:
+                for name, sql, params in v8.hot_queries():
+                    print(f"{name}:")
+                    for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params):
+                        print(f"    {row[3]}")
+            offenders = v8.find_full_scans(conn)
+        v8.db.close()
+
+    if offenders:
+        for name, step in offenders:
+            print(f"FAIL  {name}: {step}")
+        sys.exit(1)
+    print(f"OK    {len(v8.hot_queries())} hot queries use indexes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+"""A local HTTP stand-in for the Telegram Bot API.
+
+Usage:
+    python -m benchmarks.fake_bot_api [--port 8081] [--latency 0.05] [--jitter 0.02]
+                                      [--error-rate 0.01] [--blocked-rate 0.02]
+                                      [--global-rate 30] [--chat-rate 1] [--left-rate 0]
+
+Point the bot at it with BOT_API_BASE_URL = "http://127.0.0.1:8081/bot" (any
+token is accepted). It implements the methods the bot uses: getMe, getUpdates,
+sendMessage, copyMessage, editMessageText, answerCallbackQuery, getChat,
+getChatMember, getChatAdministrators, banChatMember, unbanChatMember,
+setWebhook and deleteWebhook.
+
+Realistic failure modes:
+  * latency plus uniform jitter on every call,
+  * flood control: message-sending methods draw from a global and a per-chat
+    token bucket, membership changes and lookups from the global one only. An empty bucket
+    answers 429 with parameters.retry_after and keeps refusing that scope until
+    the retry_after has elapsed, as Telegram does,
+  * --error-rate of calls fail with 502 Bad Gateway,
+  * --blocked-rate of users have "blocked the bot" and answer 403 to sends,
+  * --left-rate of users have left the channel (getChatMember status "left").
+
+Updates can be injected for getUpdates with POST /fake/updates (a JSON update
+or list of updates). GET /fake/stats returns call, 429 and error counters, and
+per method the calls answered 429 or 502 ("rejected").
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.stub_bot import STUB_BOT_USER  # noqa: E402
+
+RATE_LIMITED_METHODS = {"sendMessage", "copyMessage", "editMessageText"}
+GLOBALLY_LIMITED_METHODS = {"banChatMember", "unbanChatMember", "getChatMember"}
+
+
+class Bucket:
+    """Token bucket that, once emptied, refuses everything until its retry_after has passed."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def take(self, now: float) -> int:
+        """0 if a token was taken, otherwise the retry_after in whole seconds."""
+        if now < self.blocked_until:
+            return math.ceil(self.blocked_until - now)
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0
+        retry_after = max(1, math.ceil((1 - self.tokens) / self.rate))
+        self.blocked_until = now + retry_after
+        return retry_after
+
+
+class FakeBotAPI:
+    """The state behind the fake server: flood control, injected updates and counters."""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, blocked_rate=0.0,
+                 global_rate=30.0, chat_rate=1.0, chat_burst=3, seed=None, left_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.blocked_rate = blocked_rate
+        self.left_rate = left_rate
+        self.rng = random.Random(seed)
+        self.global_bucket = Bucket(global_rate, global_rate)
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.chat_buckets = {}
+        self.message_ids = {}
+        self.updates = []
+        self.updates_ready = threading.Condition()
+        self.stats = {"calls": {}, "rejected": {}, "429": 0, "403": 0, "502": 0}
+        self.lock = threading.Lock()
+
+    # --- helpers ---
+
+    def is_blocked(self, chat_id) -> bool:
+        """Deterministically marks a fraction of users as having blocked the bot."""
+        if not isinstance(chat_id, int) or chat_id <= 0:
+            return False
+        return zlib.crc32(str(chat_id).encode()) % 10_000 < self.blocked_rate * 10_000
+
+    def has_left(self, user_id: int) -> bool:
+        """Deterministically marks a fraction of users as no longer in the channel."""
+        return zlib.crc32(f"left:{user_id}".encode()) % 10_000 < self.left_rate * 10_000
+
+    def resolve_chat_id(self, chat_id):
+        if isinstance(chat_id, str) and chat_id.startswith("@"):
+            return zlib.crc32(chat_id.lower().encode()) % 1_000_000_000 + 1
+        return int(chat_id)
+
+    def chat(self, chat_id) -> dict:
+        if chat_id > 0:
+            return {"id": chat_id, "type": "private", "first_name": f"User {chat_id}"}
+        return {"id": chat_id, "type": "channel", "title": f"Channel {chat_id}"}
+
+    def message(self, chat_id, text="") -> dict:
+        with self.lock:
+            self.message_ids[chat_id] = self.message_ids.get(chat_id, 0) + 1
+            message_id = self.message_ids[chat_id]
+        return {"message_id": message_id, "date": int(time.time()), "chat": self.chat(chat_id), "text": text}
+
+    def throttle(self, chat_id, per_chat: bool = True) -> int:
+        now = time.monotonic()
+        with self.lock:
+            retry_after = self.global_bucket.take(now)
+            if retry_after or not per_chat:
+                return retry_after
+            bucket = self.chat_buckets.get(chat_id)
+            if bucket is None:
+                bucket = self.chat_buckets[chat_id] = Bucket(self.chat_rate, self.chat_burst)
+            return bucket.take(now)
+
+    def count(self, key: str, method: str = None):
+        with self.lock:
+            if method:
+                self.stats[key][method] = self.stats[key].get(method, 0) + 1
+            else:
+                self.stats[key] += 1
+
+    # --- update injection ---
+
+    def inject(self, updates: list):
+        with self.updates_ready:
+            self.updates.extend(updates)
+            self.updates_ready.notify_all()
+
+    def get_updates(self, offset: int, timeout: float, limit: int) -> list:
+        deadline = time.monotonic() + timeout
+        with self.updates_ready:
+            self.updates = [u for u in self.updates if u["update_id"] >= offset]
+            while not self.updates and time.monotonic() < deadline:
+                self.updates_ready.wait(deadline - time.monotonic())
+            return self.updates[:limit]
+
+    # --- the API ---
+
+    def call(self, method: str, params: dict) -> tuple:
+        """Returns (HTTP status, response body) for one Bot API call."""
+        self.count("calls", method)
+        if self.latency or self.jitter:
+            time.sleep(self.latency + self.rng.uniform(0, self.jitter))
+        if self.error_rate and self.rng.random() < self.error_rate:
+            self.count("502")
+            self.count("rejected", method)
+            return 502, {"ok": False, "error_code": 502, "description": "Bad Gateway"}
+
+        chat_id = self.resolve_chat_id(params["chat_id"]) if "chat_id" in params else None
+        if method in RATE_LIMITED_METHODS or method in GLOBALLY_LIMITED_METHODS:
+            retry_after = self.throttle(chat_id, per_chat=method in RATE_LIMITED_METHODS)
+            if retry_after:
+                self.count("429")
+                self.count("rejected", method)
+                return 429, {"ok": False, "error_code": 429,
+                             "description": f"Too Many Requests: retry after {retry_after}",
+                             "parameters": {"retry_after": retry_after}}
+            if method in RATE_LIMITED_METHODS and self.is_blocked(chat_id):
+                self.count("403")
+                return 403, {"ok": False, "error_code": 403, "description": "Forbidden: bot was blocked by the user"}
+
+        if method == "getMe":
+            result = STUB_BOT_USER
+        elif method == "getUpdates":
+            result = self.get_updates(int(params.get("offset", 0)), float(params.get("timeout", 0)),
+                                      int(params.get("limit", 100)))
+        elif method in ("sendMessage", "editMessageText"):
+            result = self.message(chat_id, params.get("text", ""))
+        elif method == "copyMessage":
+            result = {"message_id": self.message(chat_id)["message_id"]}
+        elif method == "getChat":
+            result = self.chat(chat_id)
+        elif method == "getChatMember":
+            user_id = int(params["user_id"])
+            result = {"status": "left" if self.has_left(user_id) else "member",
+                      "user": {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"}}
+        elif method == "getChatAdministrators":
+            result = []
+        elif method in ("answerCallbackQuery", "banChatMember", "unbanChatMember", "setWebhook", "deleteWebhook"):
+            result = True
+        else:
+            return 404, {"ok": False, "error_code": 404, "description": "Not Found: method not found"}
+        return 200, {"ok": True, "result": result}
+
+
+def parse_params(content_type: str, body: bytes) -> dict:
+    """Bot API parameters from a form-encoded (values JSON-encoded where needed) or JSON body."""
+    if not body:
+        return {}
+    if content_type.startswith("application/json"):
+        return json.loads(body)
+    params = {}
+    for key, value in parse_qsl(body.decode(), keep_blank_values=True):
+        try:
+            params[key] = json.loads(value)
+        except ValueError:
+            params[key] = value
+    return params
+
+
+def make_handler(api: FakeBotAPI):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _reply(self, status: int, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _handle(self, body: bytes):
+            path = urlparse(self.path).path
+            if path == "/fake/stats":
+                self._reply(200, api.stats)
+                return
+            if path == "/fake/updates":
+                updates = json.loads(body or b"[]")
+                api.inject(updates if isinstance(updates, list) else [updates])
+                self._reply(200, {"ok": True})
+                return
+            parts = path.strip("/").split("/")
+            if len(parts) != 2 or not parts[0].startswith("bot"):
+                self._reply(404, {"ok": False, "error_code": 404, "description": "Not Found"})
+                return
+            params = dict(parse_qsl(urlparse(self.path).query))
+            params.update(parse_params(self.headers.get("Content-Type", ""), body))
+            self._reply(*api.call(parts[1], params))
+
+        def do_GET(self):
+            self._handle(b"")
+
+        def do_POST(self):
+            self._handle(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+
+    return Handler
+
+
+def start_server(api: FakeBotAPI, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Serves `api` on a background thread; port 0 picks a free port (see server.server_port)."""
+    server = ThreadingHTTPServer((host, port), make_handler(api))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="fake-bot-api", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every call")
+    parser.add_argument("--jitter", type=float, default=0.02, help="up to this many extra seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of calls answered with 502")
+    parser.add_argument("--blocked-rate", type=float, default=0.0, help="fraction of users that blocked the bot")
+    parser.add_argument("--global-rate", type=float, default=30.0, help="messages per second across all chats")
+    parser.add_argument("--chat-rate", type=float, default=1.0, help="messages per second to one chat")
+    parser.add_argument("--left-rate", type=float, default=0.0, help="fraction of users no longer in the channel")
+    parser.add_argument("--seed", type=int)
+    args = parser.parse_args()
+
+    api = FakeBotAPI(args.latency, args.jitter, args.error_rate, args.blocked_rate,
+                     args.global_rate, args.chat_rate, seed=args.seed, left_rate=args.left_rate)
+    server = start_server(api, args.host, args.port)
+    print(f"Fake Bot API on http://{args.host}:{server.server_port}/bot<token>/<method>  (Ctrl+C to stop)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(json.dumps(api.stats, indent=2))
+
+
+if __name__ == "__main__":
+    main()
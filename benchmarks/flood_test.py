@@ -0,0 +1,96 @@
+"""Broadcast throughput and flood-control behaviour against the fake Bot API.
+
+Usage:
+    python -m benchmarks.flood_test [--recipients 300] [--latency 0.05] [--error-rate 0.01] [--blocked-rate 0.02]
+                                    [--copy]
+
+Starts benchmarks.fake_bot_api on a free local port and runs a real broadcast job
+(v8.create_broadcast_job + v8.Broadcast over HTTP through python-telegram-bot)
+twice: once with the bot's own rate limiter and once with the limiter effectively
+disabled. The server's 429/retry_after answers then have to be absorbed by
+send_with_retry. For each run it reports throughput, delivered and failed
+recipients, and what the server saw. With --copy the job copies a source message
+(copyMessage), as broadcasts from the dashboard do, instead of sending text.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import v8  # noqa: E402
+from telegram.ext import Application  # noqa: E402
+
+from benchmarks.fake_bot_api import FakeBotAPI, start_server  # noqa: E402
+from benchmarks.stub_bot import STUB_TOKEN  # noqa: E402
+
+
+async def broadcast_once(base_url: str, limiter: v8.TokenBucket, copy: bool) -> tuple:
+    """Runs one broadcast to every active subscriber; returns (seconds, counts)."""
+    v8.bot_rate_limiter = limiter
+    source = (v8.ADMIN_ID, 1) if copy else None
+    application = Application.builder().token(STUB_TOKEN).base_url(base_url).build()
+    async with application:
+        job_id, _ = await v8.async_db.run_write(lambda conn: v8.create_broadcast_job(conn, "Flood test", source))
+        start = time.perf_counter()
+        await v8.Broadcast(application.bot, job_id, "Flood test", None, None, source).run()
+        elapsed = time.perf_counter() - start
+    return elapsed, await v8.fetch_broadcast_counts(job_id)
+
+
+async def run(args):
+    scenarios = (
+        ("bot rate limiter", v8.TokenBucket(v8.BOT_API_RATE_PER_SECOND, v8.BOT_API_BURST)),
+        ("no client limiting", v8.TokenBucket(10_000, 10_000)),
+    )
+    for label, limiter in scenarios:
+        api = FakeBotAPI(args.latency, args.jitter, args.error_rate, args.blocked_rate,
+                         args.global_rate, args.chat_rate, seed=args.seed)
+        server = start_server(api)
+        try:
+            elapsed, counts = await broadcast_once(f"http://127.0.0.1:{server.server_port}/bot", limiter, args.copy)
+        finally:
+            server.shutdown()
+            server.server_close()
+        method = "copyMessage" if args.copy else "sendMessage"
+        sends = api.stats["calls"].get(method, 0)
+        print(f"{label}:")
+        print(f"  {elapsed:7.2f} s  {counts['delivered'] / elapsed:6.1f} delivered/s  "
+              f"delivered {counts['delivered']}, failed {counts['failed']}, pending {counts['pending']}")
+        print(f"  server: {sends} {method} calls, {api.stats['429']} answered 429, "
+              f"{api.stats['403']} blocked, {api.stats['502']} 502s\n")
+    await v8.async_db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recipients", type=int, default=300)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.01)
+    parser.add_argument("--blocked-rate", type=float, default=0.02)
+    parser.add_argument("--global-rate", type=float, default=30.0)
+    parser.add_argument("--chat-rate", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--copy", action="store_true", help="copy a source message instead of sending text")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        v8.db = v8.Database(os.path.join(tmp, "flood.db"))
+        v8.setup_database()
+        v8.db.write_many(
+            "INSERT INTO subscribers (user_id, username, first_name, plan_days, start_date, is_active, "
+            "start_seq, expiry_seq) VALUES (?, ?, ?, 30, '2024-05-01', 1, -18, 12)",
+            ((uid, f"user{uid}", f"User {uid}") for uid in range(1, args.recipients + 1)),
+        )
+        print(f"{args.recipients} recipients, server limit {args.global_rate:g} msg/s, "
+              f"{args.latency * 1000:.0f}+{args.jitter * 1000:.0f} ms latency\n")
+        asyncio.run(run(args))
+        v8.db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Load test: hundreds of simultaneous /status requests.
+
+Usage:
+    python benchmarks/load_status.py [--users 500] [--latency 0.05]
+
+Feeds one /status update per subscriber into the real application (built by
+v8.build_application against the in-process stub Bot API, which answers after
+--latency seconds) and measures how long it takes until every user got a reply:
+once with sequential processing and once with the keyed concurrent processor.
+A final run sends several updates from the same user to show that they are
+still handled one at a time and in order.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import v8  # noqa: E402
+from telegram import Update  # noqa: E402
+from telegram.ext import Application  # noqa: E402
+
+from benchmarks.stub_bot import STUB_TOKEN, StubRequest  # noqa: E402
+
+
+def status_update(bot, update_id: int, user_id: int) -> Update:
+    user = {"id": user_id, "is_bot": False, "first_name": f"User {user_id}"}
+    data = {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": int(time.time()), "from": user,
+            "chat": {"id": user_id, "type": "private", "first_name": user["first_name"]},
+            "text": "/status", "entities": [{"type": "bot_command", "offset": 0, "length": 7}],
+        },
+    }
+    return Update.de_json(data, bot)
+
+
+async def drive(concurrent: bool, latency: float, user_ids: list) -> float:
+    """Returns the seconds until every update was answered."""
+    stub = StubRequest(latency=latency)
+    application = v8.build_application(
+        Application.builder().token(STUB_TOKEN).request(stub).get_updates_request(StubRequest()),
+        concurrent=concurrent,
+    )
+    await application.initialize()
+    await application.start()
+    try:
+        start = time.perf_counter()
+        for update_id, user_id in enumerate(user_ids, 1):
+            await application.update_queue.put(status_update(application.bot, update_id, user_id))
+        while len(stub.calls_to("sendMessage")) < len(user_ids):
+            await asyncio.sleep(0.005)
+        return time.perf_counter() - start
+    finally:
+        await application.stop()
+        await application.shutdown()
+
+
+async def run(args):
+    user_ids = list(range(1, args.users + 1))
+    print(f"{args.users} simultaneous /status requests, {args.latency * 1000:.0f} ms Bot API latency\n")
+    results = {}
+    for label, concurrent in (("sequential", False), ("keyed concurrent", True)):
+        elapsed = await drive(concurrent, args.latency, user_ids)
+        results[label] = elapsed
+        print(f"  {label:<17} {elapsed:8.2f} s  ({args.users / elapsed:8.1f} updates/s)")
+    print(f"  speedup: {results['sequential'] / results['keyed concurrent']:.1f}x")
+
+    same_user = [1] * args.same_user
+    elapsed = await drive(True, args.latency, same_user)
+    print(f"\n{args.same_user} updates from one user (keyed concurrent): {elapsed:.2f} s "
+          f"(serialized would be ~{args.same_user * args.latency:.2f} s)")
+    await v8.async_db.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated Bot API latency in seconds")
+    parser.add_argument("--same-user", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        v8.db = v8.Database(os.path.join(tmp, "load.db"))
+        v8.setup_database()
+        v8.db.write_many(
+            "INSERT INTO subscribers (user_id, username, first_name, plan_days, start_date, is_active, "
+            "start_seq, expiry_seq) VALUES (?, ?, ?, 30, '2024-05-01', 1, -18, 12)",
+            ((uid, f"user{uid}", f"User {uid}") for uid in range(1, args.users + 1)),
+        )
+        asyncio.run(run(args))
+        v8.db.close()
+
+
+if __name__ == "__main__":
+    main()
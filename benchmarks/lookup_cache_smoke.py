@@ -0,0 +1,93 @@
+"""Smoke test for request coalescing in the Bot API lookup cache.
+
+Usage:
+    python benchmarks/lookup_cache_smoke.py
+
+Drives v8.AsyncLookupCache with a slow fake lookup:
+
+1. several callers ask for the same key at once; only one lookup may run and
+   every caller must get its result,
+2. the leading caller (the one running the lookup) is cancelled while others are
+   coalesced onto it. The others must not hang: they look the key up themselves
+   and get the value.
+
+Exits with status 1 on failure.
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import v8  # noqa: E402
+
+WAITERS = 5
+LOOKUP_SECONDS = 0.05
+
+
+class SlowLookup:
+    def __init__(self):
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        await asyncio.sleep(LOOKUP_SECONDS)
+        return "value"
+
+
+async def coalesced() -> list:
+    failures = []
+    cache = v8.AsyncLookupCache(100, 60)
+    lookup = SlowLookup()
+    results = await asyncio.gather(*(cache.get("key", lookup) for _ in range(WAITERS)))
+    print(f"coalesced         -> {lookup.calls} lookup(s), {cache.coalesced} coalesced")
+    if lookup.calls != 1 or results != ["value"] * WAITERS:
+        failures.append(f"{WAITERS} concurrent callers ran {lookup.calls} lookups and got {results}")
+    return failures
+
+
+async def leader_cancelled() -> list:
+    failures = []
+    cache = v8.AsyncLookupCache(100, 60)
+    lookup = SlowLookup()
+    leader = asyncio.create_task(cache.get("key", lookup))
+    await asyncio.sleep(0)
+    waiters = [asyncio.create_task(cache.get("key", lookup)) for _ in range(WAITERS)]
+    await asyncio.sleep(LOOKUP_SECONDS / 5)
+    leader.cancel()
+
+    done, hung = await asyncio.wait(waiters, timeout=10 * LOOKUP_SECONDS + 2)
+    for task in hung:
+        task.cancel()
+    results = [task.result() for task in done if not task.cancelled() and task.exception() is None]
+    print(f"leader cancelled  -> {len(results)}/{WAITERS} waiters got the value, {len(hung)} hung, "
+          f"{lookup.calls} lookup(s)")
+    if not leader.cancelled():
+        failures.append("the leading caller was not cancelled")
+    if hung:
+        failures.append(f"{len(hung)} coalesced callers hung after the leading caller was cancelled")
+    if results != ["value"] * WAITERS:
+        failures.append(f"coalesced callers got {results} after the leading caller was cancelled")
+    if cache._in_flight:
+        failures.append("a lookup was left in flight")
+    return failures
+
+
+async def run() -> list:
+    return await coalesced() + await leader_cancelled()
+
+
+def main():
+    argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter).parse_args()
+
+    failures = asyncio.run(run())
+    for failure in failures:
+        print(f"FAIL  {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK    lookup cache coalescing survives a cancelled caller")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""Membership reconciliation against the fake Bot API.
+
+Usage:
+    python -m benchmarks.reconcile_test [--subscribers 3000] [--left-rate 0.05] [--error-rate 0.01]
+
+Starts benchmarks.fake_bot_api on a free local port, where --left-rate of the users
+have left the channel, and runs v8.reconcile_memberships once over HTTP through
+python-telegram-bot for --subscribers active subscribers: one cached, rate-limited
+getChatMember per subscriber and batched corrections. Reports the time taken, how
+many subscribers were deactivated compared with how many the server says left,
+the roster corrections, and what the server saw.
+
+Exits with status 1 unless the deactivated subscribers are exactly the ones the
+server says left, the rows of everyone still in the channel are unchanged, the
+roster records who left and who stayed, and one admin report was queued.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import v8  # noqa: E402
+from telegram.ext import Application, CallbackContext  # noqa: E402
+
+from benchmarks.fake_bot_api import FakeBotAPI, start_server  # noqa: E402
+from benchmarks.stub_bot import STUB_TOKEN  # noqa: E402
+
+
+async def run(base_url: str) -> float:
+    application = Application.builder().token(STUB_TOKEN).base_url(base_url).build()
+    async with application:
+        start = time.perf_counter()
+        await v8.reconcile_memberships(CallbackContext(application))
+        elapsed = time.perf_counter() - start
+    await v8.async_db.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--subscribers", type=int, default=3000)
+    parser.add_argument("--left-rate", type=float, default=0.05)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.01)
+    parser.add_argument("--global-rate", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    api = FakeBotAPI(args.latency, args.jitter, args.error_rate, global_rate=args.global_rate,
+                     seed=args.seed, left_rate=args.left_rate)
+    user_ids = list(range(1, args.subscribers + 1))
+    left = {user_id for user_id in user_ids if api.has_left(user_id)}
+    expected = len(left)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        v8.db = v8.Database(os.path.join(tmp, "reconcile.db"))
+        v8.setup_database()
+        v8.db.write_many(
+            "INSERT INTO subscribers (user_id, username, first_name, plan_days, start_date, is_active, "
+            "start_seq, expiry_seq) VALUES (?, ?, ?, 30, '2024-05-01', 1, -18, 12)",
+            ((uid, f"user{uid}", f"User {uid}") for uid in user_ids),
+        )
+        before = {row[0]: row for row in v8.db.read("SELECT * FROM subscribers")}
+
+        server = start_server(api)
+        print(f"{args.subscribers} active subscribers, {expected} of them left the channel, "
+              f"server limit {args.global_rate:g} calls/s, {args.latency * 1000:.0f}+{args.jitter * 1000:.0f} ms latency\n")
+        try:
+            elapsed = asyncio.run(run(f"http://127.0.0.1:{server.server_port}/bot"))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        after = {row[0]: row for row in v8.db.read("SELECT * FROM subscribers")}
+        deactivated_ids = {row[0] for row in v8.db.read("SELECT user_id FROM subscribers WHERE is_active = 0")}
+        deactivated = len(deactivated_ids)
+        roster = dict(v8.db.read("SELECT status, COUNT(*) FROM channel_members GROUP BY status"))
+        reports = v8.db.read("SELECT COUNT(*) FROM outbox WHERE chat_id = ?", (v8.ADMIN_ID,))[0][0]
+        v8.db.close()
+
+    calls = api.stats["calls"].get("getChatMember", 0)
+    print(f"  {elapsed:7.2f} s  {args.subscribers / elapsed:6.1f} subscribers/s")
+    print(f"  deactivated {deactivated} (expected {expected}), "
+          f"roster: {', '.join(f'{status} {count}' for status, count in sorted(roster.items()))}, "
+          f"admin reports queued: {reports}")
+    print(f"  server: {calls} getChatMember calls, {api.stats['429']} answered 429, {api.stats['502']} 502s")
+
+    failures = []
+    if deactivated_ids != left:
+        failures.append(f"deactivated {len(deactivated_ids - left)} members still in the channel and missed "
+                        f"{len(left - deactivated_ids)} who left")
+    touched = [user_id for user_id in user_ids if user_id not in left and after.get(user_id) != before[user_id]]
+    if touched:
+        failures.append(f"{len(touched)} members still in the channel had their rows changed, e.g. {touched[:5]}")
+    if roster != ({'left': expected, 'member': args.subscribers - expected} if expected
+                  else {'member': args.subscribers}):
+        failures.append(f"roster is {roster}, expected left {expected}, member {args.subscribers - expected}")
+    if expected and reports != 1:
+        failures.append(f"{reports} admin reports queued, expected 1")
+    for failure in failures:
+        print(f"FAIL  {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK    exactly the departed subscribers were deactivated")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+"""Channel removal throughput against the fake Bot API.
+
+Usage:
+    python -m benchmarks.removal_test [--members 3000] [--latency 0.05] [--error-rate 0.01]
+
+Starts benchmarks.fake_bot_api on a free local port, queues --members expired
+subscribers for removal (v8.enqueue_removals) and drains the queue once with
+v8.process_removal_queue over HTTP through python-telegram-bot, i.e. one ban
+and one unban per member under the bot's shared rate limiter. Reports the time
+taken, the queue states and audit rows afterwards, and what the server saw.
+
+Exits with status 1 unless every member ends 'done' with exactly one successful
+ban and one successful unban in the audit, and every call the server rejected
+(429 or 502) was retried, i.e. the server saw one ban and one unban per member
+plus one per rejection.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import v8  # noqa: E402
+from telegram.ext import Application, CallbackContext  # noqa: E402
+
+from benchmarks.fake_bot_api import FakeBotAPI, start_server  # noqa: E402
+from benchmarks.stub_bot import STUB_TOKEN  # noqa: E402
+
+
+async def run(args, base_url: str) -> float:
+    application = Application.builder().token(STUB_TOKEN).base_url(base_url).build()
+    async with application:
+        start = time.perf_counter()
+        await v8.process_removal_queue(CallbackContext(application))
+        elapsed = time.perf_counter() - start
+    await v8.async_db.close()
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--members", type=int, default=3000)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.01)
+    parser.add_argument("--global-rate", type=float, default=30.0)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        v8.db = v8.Database(os.path.join(tmp, "removal.db"))
+        v8.setup_database()
+        user_ids = list(range(1, args.members + 1))
+        v8.db.write_many(
+            "INSERT INTO subscribers (user_id, username, first_name, plan_days, start_date, is_active, "
+            "start_seq, expiry_seq) VALUES (?, ?, ?, 30, '2024-05-01', 0, -30, 0)",
+            ((uid, f"user{uid}", f"User {uid}") for uid in user_ids),
+        )
+        with v8.db.transaction() as conn:
+            v8.enqueue_removals(conn, user_ids)
+
+        api = FakeBotAPI(args.latency, args.jitter, args.error_rate, global_rate=args.global_rate, seed=args.seed)
+        server = start_server(api)
+        print(f"{args.members} expired members, server limit {args.global_rate:g} calls/s, "
+              f"{args.latency * 1000:.0f}+{args.jitter * 1000:.0f} ms latency\n")
+        try:
+            elapsed = asyncio.run(run(args, f"http://127.0.0.1:{server.server_port}/bot"))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        states = dict(v8.db.read("SELECT state, COUNT(*) FROM removal_queue GROUP BY state"))
+        audit = v8.db.read("SELECT action, outcome, COUNT(*) FROM removal_audit GROUP BY action, outcome")
+        removed_once = v8.db.read("""
+            SELECT COUNT(*) FROM (
+                SELECT user_id FROM removal_audit WHERE outcome = 'ok' GROUP BY user_id
+                HAVING SUM(action = 'ban') = 1 AND SUM(action = 'unban') = 1 AND COUNT(*) = 2
+            )
+        """)[0][0]
+        v8.db.close()
+
+    calls, rejected = api.stats["calls"], api.stats["rejected"]
+    print(f"  {elapsed:7.2f} s  {states.get('done', 0) / elapsed:6.1f} members/s")
+    print(f"  queue: {', '.join(f'{state} {count}' for state, count in sorted(states.items()))}")
+    print(f"  audit: {', '.join(f'{action}/{outcome} {count}' for action, outcome, count in audit)}")
+    print(f"  server: {calls.get('banChatMember', 0)} bans, {calls.get('unbanChatMember', 0)} unbans, "
+          f"{api.stats['429']} answered 429, {api.stats['502']} 502s")
+
+    failures = []
+    if states != {'done': args.members}:
+        failures.append(f"queue ended as {states}, expected done {args.members}")
+    if removed_once != args.members:
+        failures.append(f"{removed_once}/{args.members} members have exactly one ban/ok and one unban/ok")
+    not_ok = [(action, outcome, count) for action, outcome, count in audit if outcome != 'ok']
+    if not_ok:
+        failures.append(f"audit has failed or retried removals: {not_ok}")
+    for method in ("banChatMember", "unbanChatMember"):
+        if calls.get(method, 0) != args.members + rejected.get(method, 0):
+            failures.append(f"server saw {calls.get(method, 0)} {method} calls for {args.members} members "
+                            f"and {rejected.get(method, 0)} rejections; a rejected call was not retried "
+                            f"or a member was handled twice")
+    if args.error_rate and not rejected:
+        failures.append("the server rejected no calls, so retries were not exercised")
+    for failure in failures:
+        print(f"FAIL  {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK    every expired member removed exactly once")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""Smoke test for finding channel members by first name in the local roster.
+
+Usage:
+    python benchmarks/roster_smoke.py
+
+Builds the real application (v8.build_application) against the in-process stub
+Bot API, puts a few members with punctuation in their names into the roster and
+walks the dashboard's "Add Manual Entry" conversation for each (first name, then
+/nousername). Names as typed by the admin, e.g. "O'Neil" or "Tom & Jerry", must
+find the member even though the conversation keeps the HTML-escaped form for
+display. Exits with status 1 on failure.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import v8  # noqa: E402
+
+from benchmarks.run_suite import ADMIN, Harness  # noqa: E402
+
+# (user_id, first_name, last_name, name typed into the conversation)
+MEMBERS = [
+    (5001, "O'Neil", "Byrne", "O'Neil"),
+    (5002, "Tom & Jerry", None, "Tom & Jerry"),
+    (5003, "Zoë", "Quotes", 'Zoë'),
+]
+
+
+async def run() -> list:
+    failures = []
+    async with Harness() as harness:
+        for user_id, _, _, typed in MEMBERS:
+            await harness.callback("add_manual_prompt")
+            await harness.message(ADMIN, typed)
+            sent_before = len(harness.stub.calls_to("sendMessage"))
+            await harness.message(ADMIN, "/nousername")
+            replies = [params.get("text", "") for params in harness.stub.calls_to("sendMessage")[sent_before:]]
+            found = any("User Found in Channel" in text and f"<code>{user_id}</code>" in text for text in replies)
+            print(f"{typed!r:<16} -> {'found' if found else 'not found'}")
+            if not found:
+                failures.append(f"roster search for {typed!r} did not find member {user_id}")
+            await harness.message(ADMIN, "/cancel")
+        await v8.async_db.close()
+    return failures
+
+
+def main():
+    argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter).parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        v8.db = v8.Database(os.path.join(tmp, "roster.db"))
+        v8.setup_database()
+        with v8.db.transaction() as conn:
+            for user_id, first_name, last_name, _ in MEMBERS:
+                v8.upsert_roster_member(conn, user_id, first_name, last_name, None, "member")
+        failures = asyncio.run(run())
+        v8.db.close()
+
+    for failure in failures:
+        print(f"FAIL  {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK    roster search matches names as typed")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""Benchmark suite for the bot's hot paths.
+
+Usage:
+    python -m benchmarks.run_suite [--sizes 1k,100k] [--output results.json] [--compare old.json]
+
+For every size a synthetic database is generated (see benchmarks.synthetic), the
+real application is built with v8.build_application against the in-process
+stub Bot API, and these paths are timed end to end through
+Application.process_update:
+
+    status_command            /status from random subscribers
+    display_user_list         the user list, then paging forward
+    display_detailed_stats    the stats screen, with a cold and a warm snapshot
+    handle_broadcast_message  creating a broadcast job for every active subscriber
+    daily_subscription_check  the nightly threshold check, with and without an admin post that day
+                              (reminders and the digest are only queued; the outbox delivers them)
+
+Results are written as JSON (timings in milliseconds). With --compare, the
+medians are printed next to those of an earlier run.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import v8  # noqa: E402
+from telegram import Update  # noqa: E402
+from telegram.ext import Application, CallbackContext  # noqa: E402
+
+from benchmarks import synthetic  # noqa: E402
+from benchmarks.stub_bot import STUB_TOKEN, StubRequest  # noqa: E402
+
+ADMIN = {"id": v8.ADMIN_ID, "is_bot": False, "first_name": "Admin"}
+
+
+def summarize(samples: list) -> dict:
+    """Timing statistics of a list of durations in seconds, reported in milliseconds."""
+    ms = sorted(s * 1000 for s in samples)
+    return {
+        "runs": len(ms),
+        "min_ms": round(ms[0], 3),
+        "median_ms": round(statistics.median(ms), 3),
+        "p95_ms": round(ms[min(len(ms) - 1, int(len(ms) * 0.95))], 3),
+        "max_ms": round(ms[-1], 3),
+    }
+
+
+class Harness:
+    """Feeds synthetic updates through a real application wired to the stub Bot API."""
+
+    def __init__(self):
+        self.stub = StubRequest()
+        # No job queue: notifications the timed paths queue in the outbox stay there
+        # instead of being delivered in the background while the next case is timed.
+        self.application = v8.build_application(
+            Application.builder().token(STUB_TOKEN).request(self.stub).get_updates_request(StubRequest()).job_queue(None)
+        )
+        self._update_ids = iter(range(1, 10**9))
+
+    async def __aenter__(self):
+        await self.application.initialize()
+        await self.application.start()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.application.stop()
+        await self.application.shutdown()
+
+    async def _process(self, data: dict) -> float:
+        update = Update.de_json({"update_id": next(self._update_ids), **data}, self.application.bot)
+        start = time.perf_counter()
+        await self.application.process_update(update)
+        return time.perf_counter() - start
+
+    async def message(self, user: dict, text: str) -> float:
+        entities = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}] if text.startswith("/") else []
+        return await self._process({"message": {
+            "message_id": 1, "date": int(time.time()), "from": user,
+            "chat": {"id": user["id"], "type": "private", "first_name": user["first_name"]},
+            "text": text, "entities": entities,
+        }})
+
+    async def callback(self, data: str) -> float:
+        return await self._process({"callback_query": {
+            "id": str(next(self._update_ids)), "from": ADMIN, "chat_instance": "bench", "data": data,
+            "message": {"message_id": 1, "date": int(time.time()),
+                        "chat": {"id": v8.ADMIN_ID, "type": "private", "first_name": "Admin"}, "text": "menu"},
+        }})
+
+    def last_buttons(self) -> list:
+        """callback_data of the buttons in the most recent edited message."""
+        edits = self.stub.calls_to("editMessageText")
+        markup = edits[-1].get("reply_markup") if edits else None
+        if isinstance(markup, str):
+            markup = json.loads(markup)
+        return [button.get("callback_data", "") for row in (markup or {}).get("inline_keyboard", []) for button in row]
+
+
+async def bench_status(harness: Harness, user_ids: list, runs: int) -> dict:
+    rng = random.Random(1)
+    samples = []
+    for _ in range(runs):
+        user_id = rng.choice(user_ids)
+        samples.append(await harness.message({"id": user_id, "is_bot": False, "first_name": "Bench"}, "/status"))
+    return summarize(samples)
+
+
+async def bench_user_list(harness: Harness, pages: int) -> dict:
+    first = [await harness.callback("check_user")]
+    samples = []
+    for _ in range(pages):
+        next_page = [data for data in harness.last_buttons() if data.startswith("user_page:n:")]
+        if not next_page:
+            break
+        samples.append(await harness.callback(next_page[0]))
+    return {"first_page": summarize(first), "next_page": summarize(samples) if samples else None}
+
+
+async def bench_stats(harness: Harness, runs: int) -> dict:
+    cold, warm = [], []
+    for _ in range(runs):
+        v8.stats_snapshot.invalidate()
+        cold.append(await harness.callback("stats"))
+        warm.append(await harness.callback("stats"))
+    return {"cold": summarize(cold), "warm": summarize(warm)}
+
+
+async def bench_broadcast(harness: Harness, runs: int) -> dict:
+    samples = []
+    for n in range(runs):
+        await harness.callback("broadcast")
+        samples.append(await harness.message(ADMIN, f"Benchmark broadcast {n}"))
+        for job in list(v8.active_broadcasts.values()):
+            job.cancel()
+        while v8.active_broadcasts:
+            await asyncio.sleep(0.01)
+    recipients = v8.db.read("SELECT COUNT(*) FROM broadcast_recipients")[0][0]
+    return {"handler": summarize(samples), "recipients_per_job": recipients // max(runs, 1)}
+
+
+async def bench_daily_check(harness: Harness, template: str, workdir: str) -> dict:
+    results = {}
+    today = datetime.now().strftime("%Y-%m-%d")
+    for label, posted in (("admin_posted", True), ("no_post", False)):
+        path = os.path.join(workdir, f"daily_{label}.db")
+        shutil.copyfile(template, path)
+        v8.db.close()
+        v8.db = v8.Database(path)
+        v8.subscriber_cache.clear()
+        v8.stats_snapshot.invalidate()
+        if posted:
+            with v8.db.transaction() as conn:
+                v8.record_posting_day(conn, today)
+        queued_before = v8.db.read("SELECT COUNT(*) FROM outbox")[0][0]
+        start = time.perf_counter()
+        await v8.daily_subscription_check(CallbackContext(harness.application))
+        results[label] = summarize([time.perf_counter() - start])
+        results[label]["messages_queued"] = v8.db.read("SELECT COUNT(*) FROM outbox")[0][0] - queued_before
+    return results
+
+
+async def run_size(label: str, rows: int, args, workdir: str) -> dict:
+    template = os.path.join(workdir, f"{label}.db")
+    v8.db = v8.Database(template)
+    v8.setup_database()
+    start = time.perf_counter()
+    generated = synthetic.populate(rows, rows, history_days=args.history_days, seed=args.seed)
+    build_seconds = time.perf_counter() - start
+    v8.db.close()
+    print(f"{label}: generated {rows:,} + {rows:,} rows in {build_seconds:.1f} s", flush=True)
+
+    work = os.path.join(workdir, f"{label}_work.db")
+    shutil.copyfile(template, work)
+    v8.db = v8.Database(work)
+    v8.subscriber_cache.clear()
+    v8.stats_snapshot.invalidate()
+    user_ids = [row[0] for row in v8.db.read("SELECT user_id FROM subscribers")]
+
+    results = {}
+    async with Harness() as harness:
+        results["status_command"] = await bench_status(harness, user_ids, args.runs)
+        results["display_user_list"] = await bench_user_list(harness, args.pages)
+        results["display_detailed_stats"] = await bench_stats(harness, max(1, args.runs // 10))
+        results["handle_broadcast_message"] = await bench_broadcast(harness, max(1, args.runs // 50))
+        results["daily_subscription_check"] = await bench_daily_check(harness, template, workdir)
+        await v8.async_db.close()
+    v8.db.close()
+    return {"rows": generated, "generate_seconds": round(build_seconds, 3), "results": results}
+
+
+def medians(results: dict, prefix: str = "") -> dict:
+    """Flattens a results tree into {'path.to.timing': median_ms}."""
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict) and "median_ms" in value:
+            flat[prefix + key] = value["median_ms"]
+        elif isinstance(value, dict):
+            flat.update(medians(value, f"{prefix}{key}."))
+    return flat
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1k,100k", help=f"comma-separated, from {', '.join(synthetic.SIZES)}")
+    parser.add_argument("--runs", type=int, default=200, help="iterations of the per-request benchmarks")
+    parser.add_argument("--pages", type=int, default=20, help="user list pages to walk")
+    parser.add_argument("--history-days", type=int, default=120)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="an earlier results file to compare medians against")
+    parser.add_argument("--verbose", action="store_true", help="keep the bot's INFO logging")
+    args = parser.parse_args()
+
+    if not args.verbose:
+        v8.logger.setLevel(logging.WARNING)
+        for name in ("telegram", "apscheduler"):
+            logging.getLogger(name).setLevel(logging.WARNING)
+    sizes = [size.strip().lower() for size in args.sizes.split(",") if size.strip()]
+    unknown = [size for size in sizes if size not in synthetic.SIZES]
+    if unknown:
+        parser.error(f"unknown size(s): {', '.join(unknown)}")
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "parameters": {"runs": args.runs, "pages": args.pages, "history_days": args.history_days, "seed": args.seed},
+        "sizes": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for size in sizes:
+            report["sizes"][size] = asyncio.run(run_size(size, synthetic.SIZES[size], args, tmp))
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+
+    previous = {}
+    if args.compare:
+        with open(args.compare) as f:
+            previous = json.load(f).get("sizes", {})
+    for size, data in report["sizes"].items():
+        print(f"\n{size}")
+        before = medians(previous.get(size, {}).get("results", {}))
+        for name, median in medians(data["results"]).items():
+            line = f"  {name:<52} {median:10.2f} ms"
+            if name in before and before[name]:
+                line += f"   was {before[name]:10.2f} ms ({median / before[name]:5.2f}x)"
+            print(line)
+    print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
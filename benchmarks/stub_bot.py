@@ -0,0 +1,75 @@
+"""An in-process stand-in for the Telegram Bot API.
+
+StubRequest plugs into ApplicationBuilder.request() and answers every Bot API
+method locally, optionally after a simulated network latency, while recording
+the calls it receives. It lets benchmarks and smoke tests drive the real
+handlers without a token or network access.
+"""
+import asyncio
+import itertools
+import json
+import time
+
+from telegram.request import BaseRequest
+
+STUB_TOKEN = "123456:STUB-TOKEN"
+STUB_BOT_USER = {"id": 123456, "is_bot": True, "first_name": "Stub", "username": "stub_bot"}
+
+
+class StubRequest(BaseRequest):
+    """Answers Bot API calls with plausible canned results and records them."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = []  # (bot API method, parameters, monotonic time)
+        self._message_ids = itertools.count(1)
+
+    @property
+    def read_timeout(self):
+        return None
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def calls_to(self, method: str) -> list:
+        return [params for name, params, _ in self.calls if name == method]
+
+    def _message(self, params: dict) -> dict:
+        chat_id = params.get("chat_id", 0)
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if int(chat_id) > 0 else "channel"},
+            "text": params.get("text", ""),
+        }
+
+    def _result(self, method: str, params: dict):
+        if method == "getMe":
+            return STUB_BOT_USER
+        if method in ("sendMessage", "editMessageText"):
+            return self._message(params)
+        if method == "copyMessage":
+            return {"message_id": next(self._message_ids)}
+        if method == "getChat":
+            chat_id = params.get("chat_id", 0)
+            return {"id": chat_id if isinstance(chat_id, int) else 1, "type": "private", "first_name": "Stub"}
+        if method == "getChatMember":
+            return {"status": "member", "user": {"id": int(params.get("user_id", 0)), "is_bot": False, "first_name": "Member"}}
+        if method == "getChatAdministrators":
+            return []
+        if method == "getUpdates":
+            return []
+        return True
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit("/", 1)[-1]
+        params = request_data.parameters if request_data else {}
+        self.calls.append((api_method, params, time.monotonic()))
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        body = {"ok": True, "result": self._result(api_method, params)}
+        return 200, json.dumps(body).encode()
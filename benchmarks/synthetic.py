@@ -0,0 +1,147 @@
+"""Synthetic subscriber data for benchmarks.
+
+Usage:
+    python -m benchmarks.synthetic [--db subscribers.db] [--size 100k] [--managed N] [--offline N]
+
+Fills a database (created and migrated through v8.setup_database) with managed
+and offline subscribers. Plans, remaining days, start dates and activity follow
+a fixed seed. Balances are consistent with the posting-day ledger: one admin
+posting calendar is generated for the last --history-days days, and every
+subscriber's start date is placed so that the posting days since then account
+for the days it has used up.
+"""
+import argparse
+import os
+import random
+import sys
+from bisect import bisect_left
+from datetime import date, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import v8  # noqa: E402
+
+SIZES = {"1k": 1_000, "10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+FIRST_NAMES = (
+    "Alex", "Maria", "José", "Anna", "Mohammed", "Wei", "Olga", "Liam", "Fatima", "Noah",
+    "Sofia", "Ivan", "Amélie", "Yusuf", "Chloé", "Arjun", "Emma", "Mateo", "Zoë", "Kenji",
+)
+PLANS = (7, 14, 30, 30, 30, 90, -1)
+MANAGED_ID_BASE = 100_000_000
+BATCH_SIZE = 20_000
+
+
+def posting_calendar(today: date, history_days: int, rng: random.Random, post_rate: float = 0.8) -> list:
+    """The days of the last `history_days` days on which the admin posted, oldest first."""
+    return [
+        (today - timedelta(days=offset)).isoformat()
+        for offset in range(history_days, 0, -1)
+        if rng.random() <= post_rate
+    ]
+
+
+def _subscription(rng: random.Random, posting: list, today: date, history_days: int) -> tuple:
+    """(plan_days, remaining_days, start_date, start_seq, expiry_seq) of one subscriber."""
+    plan_days = rng.choice(PLANS)
+    if plan_days == -1:
+        start = (today - timedelta(days=rng.randint(0, history_days))).isoformat()
+        start_seq = bisect_left(posting, start)
+        return plan_days, -1, start, start_seq, start_seq - 1
+    remaining = rng.randint(0, plan_days)
+    start_seq = len(posting) - (plan_days - remaining)
+    if start_seq >= len(posting):
+        start = today.isoformat()
+    elif start_seq >= 0:
+        start = posting[start_seq]  # joined on the first posting day it used
+    else:
+        start = (today - timedelta(days=history_days - start_seq)).isoformat()
+    return plan_days, remaining, start, start_seq, start_seq + plan_days
+
+
+def _batched(rows, size: int = BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def populate(managed: int, offline: int, history_days: int = 120, seed: int = 42, today: date = None) -> dict:
+    """Writes the synthetic rows into v8.db; returns a summary of what was generated."""
+    rng = random.Random(seed)
+    today = today or date.today()
+    posting = posting_calendar(today, history_days, rng)
+
+    def managed_rows():
+        for n in range(managed):
+            plan_days, remaining, start, start_seq, expiry_seq = _subscription(rng, posting, today, history_days)
+            name = f"{rng.choice(FIRST_NAMES)} {n}"
+            is_active = 0 if remaining == 0 or rng.random() < 0.05 else 1
+            yield (MANAGED_ID_BASE + n, f"@user{n}", name, plan_days, start, f"synthetic #{n}", is_active,
+                   start_seq, expiry_seq)
+
+    def offline_rows():
+        for n in range(offline):
+            plan_days, remaining, start, start_seq, expiry_seq = _subscription(rng, posting, today, history_days)
+            yield (f"{rng.choice(FIRST_NAMES)} offline {n}", plan_days, start, f"synthetic offline #{n}",
+                   start_seq, expiry_seq)
+
+    with v8.db.transaction() as conn:
+        conn.executemany("INSERT INTO posting_days (seq, day) VALUES (?, ?)", enumerate(posting, 1))
+        conn.execute("UPDATE admin_activity SET ledger_started = ? WHERE id = 1",
+                     ((today - timedelta(days=history_days)).isoformat(),))
+        for batch in _batched(managed_rows()):
+            conn.executemany(
+                "INSERT INTO subscribers (user_id, username, first_name, plan_days, start_date, payment_info, "
+                "is_active, start_seq, extension_days, expiry_seq) VALUES (?, ?, ?, ?, ?, ?, ?, ?, 0, ?)",
+                batch,
+            )
+        for batch in _batched(offline_rows()):
+            conn.executemany(
+                "INSERT INTO offline_subscribers (identifier, plan_days, start_date, payment_info, "
+                "start_seq, extension_days, expiry_seq) VALUES (?, ?, ?, ?, ?, 0, ?)",
+                batch,
+            )
+        conn.execute("ANALYZE")
+
+    return {"managed": managed, "offline": offline, "history_days": history_days,
+            "posting_days": len(posting), "seed": seed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--db", default=v8.DB_NAME)
+    parser.add_argument("--size", choices=SIZES, default="100k", help="rows of each kind unless overridden")
+    parser.add_argument("--managed", type=int)
+    parser.add_argument("--offline", type=int)
+    parser.add_argument("--history-days", type=int, default=120)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--force", action="store_true", help="delete existing subscribers first")
+    args = parser.parse_args()
+
+    v8.db = v8.Database(args.db)
+    v8.setup_database()
+    existing = v8.db.read("SELECT (SELECT COUNT(*) FROM subscribers) + (SELECT COUNT(*) FROM offline_subscribers)")[0][0]
+    if existing and not args.force:
+        sys.exit(f"{args.db} already holds {existing:,} subscribers; pass --force to replace them.")
+    if existing:
+        with v8.db.transaction() as conn:
+            for table in ("no_post_days", "posting_days", "subscription_extensions", "subscribers",
+                          "offline_subscribers", "channel_members", "channel_member_trigrams"):
+                conn.execute(f"DELETE FROM {table}")
+
+    summary = populate(
+        args.managed if args.managed is not None else SIZES[args.size],
+        args.offline if args.offline is not None else SIZES[args.size],
+        args.history_days, args.seed,
+    )
+    v8.db.close()
+    print(f"{args.db}: {summary['managed']:,} managed, {summary['offline']:,} offline, "
+          f"{summary['posting_days']} posting days in the last {summary['history_days']} days")
+
+
+if __name__ == "__main__":
+    main()
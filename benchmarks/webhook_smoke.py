@@ -0,0 +1,164 @@
+"""Smoke test for webhook intake.
+
+Usage:
+    python benchmarks/webhook_smoke.py
+
+Builds the real application (v8.build_application) against the in-process
+stub Bot API, starts the webhook listener on a free local port and POSTs
+synthetic updates to it:
+
+1. a request with the wrong secret token must be rejected with 403,
+2. a /start message must be answered,
+3. a chat_member update for the channel must reach the roster and alert the admin.
+
+It also checks that setWebhook was called with the secret and with the
+allowed_updates computed from the handlers. Exits with status 1 on failure.
+"""
+import argparse
+import asyncio
+import json
+import os
+import socket
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import v8  # noqa: E402
+from telegram.ext import Application  # noqa: E402
+
+from benchmarks.stub_bot import STUB_TOKEN, StubRequest  # noqa: E402
+
+SECRET = "smoke-test-secret"
+USER = {"id": 4242, "is_bot": False, "first_name": "Smoke", "username": "smoke_user"}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def post(url: str, update: dict, secret: str) -> int:
+    request = urllib.request.Request(
+        url, data=json.dumps(update).encode(), method="POST",
+        headers={"Content-Type": "application/json", "X-Telegram-Bot-Api-Secret-Token": secret},
+    )
+    try:
+        with urllib.request.urlopen(request, timeout=5) as response:
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+
+def message_update(update_id: int, text: str) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id, "date": int(time.time()), "from": USER,
+            "chat": {"id": USER["id"], "type": "private", "first_name": USER["first_name"]},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(text)}] if text.startswith("/") else [],
+        },
+    }
+
+
+def chat_member_update(update_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "chat_member": {
+            "chat": {"id": v8.CHANNEL_ID, "type": "channel", "title": "Channel"},
+            "from": USER, "date": int(time.time()),
+            "old_chat_member": {"status": "left", "user": USER},
+            "new_chat_member": {"status": "member", "user": USER},
+        },
+    }
+
+
+async def wait_for(predicate, timeout: float = 5.0) -> bool:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if predicate():
+            return True
+        await asyncio.sleep(0.01)
+    return False
+
+
+async def run() -> list:
+    failures = []
+    stub = StubRequest()
+    application = v8.build_application(
+        Application.builder().token(STUB_TOKEN).request(stub).get_updates_request(StubRequest())
+    )
+    allowed_updates = v8.compute_allowed_updates(application)
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/{v8.WEBHOOK_PATH}"
+
+    await application.initialize()
+    await application.updater.start_webhook(
+        listen="127.0.0.1", port=port, url_path=v8.WEBHOOK_PATH,
+        webhook_url="https://bot.example.invalid/" + v8.WEBHOOK_PATH,
+        secret_token=SECRET, allowed_updates=allowed_updates,
+    )
+    await application.start()
+    try:
+        set_webhook = stub.calls_to("setWebhook")
+        if not set_webhook or set_webhook[-1].get("secret_token") != SECRET:
+            failures.append("setWebhook was not called with the secret token")
+        elif sorted(set_webhook[-1].get("allowed_updates", [])) != allowed_updates:
+            failures.append(f"setWebhook allowed_updates mismatch: {set_webhook[-1].get('allowed_updates')}")
+        print(f"allowed_updates: {', '.join(allowed_updates)}")
+
+        status = await asyncio.to_thread(post, url, message_update(1, "/start"), "wrong-secret")
+        print(f"wrong secret      -> HTTP {status}")
+        if status != 403:
+            failures.append(f"wrong secret token was answered with {status}, expected 403")
+
+        sent_before = len(stub.calls_to("sendMessage"))
+        start = time.perf_counter()
+        status = await asyncio.to_thread(post, url, message_update(2, "/start"), SECRET)
+        replied = await wait_for(lambda: len(stub.calls_to("sendMessage")) > sent_before)
+        print(f"/start            -> HTTP {status}, reply after {(time.perf_counter() - start) * 1000:.1f} ms")
+        if status != 200 or not replied:
+            failures.append("/start was not answered")
+
+        sent_before = len(stub.calls_to("sendMessage"))
+        status = await asyncio.to_thread(post, url, chat_member_update(3), SECRET)
+        alerted = await wait_for(lambda: any(
+            params.get("chat_id") == v8.ADMIN_ID for params in stub.calls_to("sendMessage")[sent_before:]
+        ))
+        in_roster = await wait_for(lambda: bool(
+            v8.db.read("SELECT 1 FROM channel_members WHERE user_id = ? AND status = 'member'", (USER["id"],))
+        ))
+        print(f"chat_member       -> HTTP {status}, admin alerted: {alerted}, roster updated: {in_roster}")
+        if status != 200 or not alerted or not in_roster:
+            failures.append("chat_member update was not fully processed")
+    finally:
+        await application.updater.stop()
+        await application.stop()
+        await application.shutdown()
+        await v8.async_db.close()
+    return failures
+
+
+def main():
+    argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter).parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        v8.db = v8.Database(os.path.join(tmp, "webhook.db"))
+        v8.setup_database()
+        failures = asyncio.run(run())
+        v8.db.close()
+
+    for failure in failures:
+        print(f"FAIL  {failure}")
+    if failures:
+        sys.exit(1)
+    print("OK    webhook intake works")
+
+
+if __name__ == "__main__":
+    main()
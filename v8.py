@@ -1,11 +1,28 @@
+import asyncio
+import atexit
+import gzip
 import logging
+import os
+import shutil
 import sqlite3
 import json
 import html
 import re
+import secrets
+import threading
+import unicodedata
+from functools import lru_cache, wraps
+from time import monotonic, perf_counter
+from concurrent.futures import ThreadPoolExecutor
+from bisect import bisect_left
+from collections import OrderedDict
+from itertools import chain
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+from queue import SimpleQueue
+from contextlib import contextmanager
 from datetime import datetime, time, timedelta, timezone
 from math import ceil
-from typing import Optional, Tuple, List
+from typing import Optional, Tuple, List, Dict, Iterable, Iterator, Callable, TypeVar, Awaitable
 
 from telegram import (
     Update,
@@ -17,6 +34,9 @@ from telegram import (
 )
 from telegram.ext import (
     Application,
+    ApplicationBuilder,
+    BaseHandler,
+    BaseUpdateProcessor,
     CommandHandler,
     ContextTypes,
     CallbackQueryHandler,
@@ -25,7 +45,8 @@ from telegram.ext import (
     ConversationHandler,
     filters,
 )
-from telegram.error import TelegramError, BadRequest, Forbidden
+from telegram.error import TelegramError, BadRequest, Forbidden, RetryAfter, NetworkError, TimedOut
+from telegram.request import BaseRequest, HTTPXRequest
 
 # --- CONFIGURATION ---
 # IMPORTANT: Replace these values with your actual data.
@@ -37,67 +58,828 @@ ADMIN_ID = 774713  # Replace with your Telegram User ID
 CHANNEL_ID = -1003094
 
   # Replace with your Channel ID (must start with -100)
+
+# Bot API endpoint; the token is appended. Point it at a local server (for example
+# benchmarks/fake_bot_api.py: "http://127.0.0.1:8081/bot") to test without Telegram.
+BOT_API_BASE_URL = "https://api.telegram.org/bot"
+
+# How updates reach the bot: "polling" (getUpdates) or "webhook" (Telegram POSTs them to us).
+UPDATE_MODE = "polling"
+# Webhook settings, only used when UPDATE_MODE = "webhook".
+# WEBHOOK_URL is the public HTTPS URL Telegram should call (typically a reverse proxy in
+# front of WEBHOOK_LISTEN:WEBHOOK_PORT). WEBHOOK_SECRET is checked against the
+# X-Telegram-Bot-Api-Secret-Token header of every request; leave it empty to generate
+# a random one on each start.
+WEBHOOK_URL = ""  # e.g. "https://bot.example.com/telegram"
+WEBHOOK_LISTEN = "127.0.0.1"
+WEBHOOK_PORT = 8443
+WEBHOOK_PATH = "telegram"
+WEBHOOK_SECRET = ""
+
+# Prometheus metrics are served on http://METRICS_LISTEN:METRICS_PORT/metrics.
+# Set METRICS_PORT = None to disable the endpoint (metrics are still collected).
+METRICS_LISTEN = "127.0.0.1"
+METRICS_PORT = 9464
+
+# Remove expired managed subscribers from the channel automatically (ban, then unban so
+# they can rejoin after renewing). The bot must be a channel admin with "Ban users".
+AUTO_REMOVE_EXPIRED = False
 # --- END CONFIGURATION ---
 
 # --- LOGGING SETUP ---
-logging.basicConfig(
-    format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    level=logging.INFO,
-    handlers=[
-        logging.FileHandler('bot.log'),
-        logging.StreamHandler()
-    ]
-)
+# Handlers only put records on a queue; a QueueListener thread formats and writes
+# them, so a log call never waits for the disk on the event loop thread.
+
+LOG_FILE = 'bot.log'
+LOG_LEVEL = logging.INFO
+LOG_FORMAT = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+LOG_JSON = False  # one JSON object per line in the log file instead of LOG_FORMAT
+# Rotation: by size unless LOG_ROTATE_WHEN is set (e.g. "midnight"); old files are gzipped.
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_ROTATE_WHEN = None
+LOG_BACKUP_COUNT = 10
+# Records per second let through (below ERROR) for noisy loggers; the rest are dropped
+# and counted. Matches the logger name and its children.
+LOG_RATE_LIMITS = {
+    f"{__name__}.broadcast": 5.0,
+    f"{__name__}.sends": 5.0,
+    f"{__name__}.search": 20.0,
+    f"{__name__}.removals": 5.0,
+    f"{__name__}.reconcile": 5.0,
+}
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as single-line JSON objects."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "time": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class RateLimitFilter(logging.Filter):
+    """Throttles records below ERROR per logger, as configured in `limits` (records/second)."""
+
+    def __init__(self, limits: dict):
+        super().__init__()
+        self.limits = limits
+        self._state: dict = {}  # logger name -> [tokens, last refill, suppressed count]
+        self._lock = threading.Lock()
+
+    def _limit_for(self, name: str) -> Optional[float]:
+        while name:
+            if name in self.limits:
+                return self.limits[name]
+            name = name.rpartition(".")[0]
+        return None
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.ERROR:
+            return True
+        rate = self._limit_for(record.name)
+        if rate is None:
+            return True
+        now = monotonic()
+        with self._lock:
+            state = self._state.setdefault(record.name, [rate, now, 0])
+            state[0] = min(rate, state[0] + (now - state[1]) * rate)
+            state[1] = now
+            if state[0] < 1:
+                state[2] += 1
+                return False
+            state[0] -= 1
+            suppressed, state[2] = state[2], 0
+        if suppressed:
+            record.msg = f"{record.getMessage()} [{suppressed} similar messages suppressed]"
+            record.args = None
+        return True
+
+def _gzip_rotator(source: str, dest: str):
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+def setup_logging() -> QueueListener:
+    """Routes all logging through a queue to a rotating, compressing file handler and stderr."""
+    if LOG_ROTATE_WHEN:
+        file_handler = TimedRotatingFileHandler(LOG_FILE, when=LOG_ROTATE_WHEN, backupCount=LOG_BACKUP_COUNT,
+                                                encoding="utf-8", delay=True)
+    else:
+        file_handler = RotatingFileHandler(LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT,
+                                           encoding="utf-8", delay=True)
+    file_handler.namer = lambda name: name + ".gz"
+    file_handler.rotator = _gzip_rotator
+    file_handler.setFormatter(JsonFormatter() if LOG_JSON else logging.Formatter(LOG_FORMAT))
+    stream_handler = logging.StreamHandler()
+    stream_handler.setFormatter(logging.Formatter(LOG_FORMAT))
+
+    queue_handler = QueueHandler(SimpleQueue())
+    queue_handler.addFilter(RateLimitFilter(LOG_RATE_LIMITS))
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    root.addHandler(queue_handler)
+
+    listener = QueueListener(queue_handler.queue, file_handler, stream_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)  # drains the queue on interpreter exit
+    return listener
+
+log_listener = setup_logging()
 logger = logging.getLogger(__name__)
+search_logger = logging.getLogger(f"{__name__}.search")
+send_logger = logging.getLogger(f"{__name__}.sends")
+broadcast_logger = logging.getLogger(f"{__name__}.broadcast")
+removal_logger = logging.getLogger(f"{__name__}.removals")
+reconcile_logger = logging.getLogger(f"{__name__}.reconcile")
+
+# --- METRICS ---
+# A small in-process implementation of Prometheus counters and histograms, rendered
+# in the text exposition format by the /metrics endpoint (see METRICS ENDPOINT).
+# Observations come from the event loop and from the database threads, so every
+# metric guards its samples with a lock.
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+DB_LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+JOB_DURATION_BUCKETS = (0.1, 0.5, 1.0, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0, 3600.0)
+
+def _format_labels(labelnames: Tuple[str, ...], values: tuple, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = (
+        (name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in pairs
+    )
+    return "{" + ",".join(f'{name}="{value}"' for name, value in escaped) + "}"
+
+class Counter:
+    """A monotonically increasing count, optionally split by labels."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: dict = {}
+        self._lock = threading.Lock()
+        metrics_registry.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in items]
+
+class Histogram:
+    """Cumulative bucket counts plus sum and count of observed values, optionally split by labels."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self._values: dict = {}  # labels -> [per-bucket counts..., +Inf count, sum]
+        self._lock = threading.Lock()
+        metrics_registry.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            entry[bisect_left(self.buckets, value)] += 1
+            entry[-1] += value
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        start = perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(perf_counter() - start, **labels)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(entry)) for key, entry in self._values.items())
+        lines = []
+        for key, entry in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), entry):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', le))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {entry[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+metrics_registry: List = []
+
+def render_metrics() -> str:
+    """All registered metrics in the Prometheus text exposition format (version 0.0.4)."""
+    lines = []
+    for metric in metrics_registry:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+HANDLER_DURATION = Histogram(
+    "bot_handler_duration_seconds", "Time spent in each update handler callback.", ("handler",))
+HANDLER_EXCEPTIONS = Counter(
+    "bot_handler_exceptions_total", "Exceptions that escaped an update handler callback.", ("handler",))
+DB_STATEMENT_DURATION = Histogram(
+    "bot_db_statement_duration_seconds", "SQLite statement execution time by normalized statement.",
+    ("statement",), DB_LATENCY_BUCKETS)
+API_REQUESTS = Counter(
+    "bot_api_requests_total", "Bot API requests by method and HTTP status (or 'network'/'timeout').", ("method", "code"))
+API_REQUEST_DURATION = Histogram(
+    "bot_api_request_duration_seconds", "Bot API request latency by method.", ("method",))
+DAILY_CHECK_DURATION = Histogram(
+    "bot_daily_check_duration_seconds", "Duration of the daily subscription check.", (), JOB_DURATION_BUCKETS)
+BROADCAST_DURATION = Histogram(
+    "bot_broadcast_duration_seconds", "Duration of broadcast job runs by outcome.", ("outcome",), JOB_DURATION_BUCKETS)
+BROADCAST_MESSAGES = Counter(
+    "bot_broadcast_messages_total", "Broadcast messages by delivery result.", ("result",))
+REMOVAL_ACTIONS = Counter(
+    "bot_channel_removal_actions_total", "Ban/unban calls of the expired-member removal worker.", ("action", "outcome"))
+MEMBERSHIP_CHECKS = Counter(
+    "bot_membership_checks_total", "Channel membership checks of the reconciliation job by result.", ("result",))
+OUTBOX_MESSAGES = Counter(
+    "bot_outbox_messages_total", "Outbox delivery attempts by priority class and result.", ("priority", "result"))
+
+class InstrumentedRequest(BaseRequest):
+    """Wraps a Bot API request backend and records per-method call counts, status codes and latency."""
+
+    def __init__(self, inner: BaseRequest):
+        self.inner = inner
+
+    @property
+    def read_timeout(self) -> Optional[float]:
+        return self.inner.read_timeout
+
+    async def initialize(self):
+        await self.inner.initialize()
+
+    async def shutdown(self):
+        await self.inner.shutdown()
+
+    async def do_request(self, url: str, method: str, request_data=None, read_timeout=BaseRequest.DEFAULT_NONE,
+                         write_timeout=BaseRequest.DEFAULT_NONE, connect_timeout=BaseRequest.DEFAULT_NONE,
+                         pool_timeout=BaseRequest.DEFAULT_NONE) -> Tuple[int, bytes]:
+        api_method = url.rsplit("/", 1)[-1]
+        start = perf_counter()
+        code = "network"
+        try:
+            status, payload = await self.inner.do_request(
+                url, method, request_data, read_timeout=read_timeout, write_timeout=write_timeout,
+                connect_timeout=connect_timeout, pool_timeout=pool_timeout,
+            )
+            code = str(status)
+            return status, payload
+        except TimedOut:
+            code = "timeout"
+            raise
+        finally:
+            API_REQUEST_DURATION.observe(perf_counter() - start, method=api_method)
+            API_REQUESTS.inc(method=api_method, code=code)
 
 # --- DATABASE SETUP ---
 DB_NAME = "subscribers.db"
 
+# Connection tuning. WAL lets readers run while a write is in progress, and with WAL
+# synchronous=NORMAL is still crash-safe (only the last commits may roll back on power loss).
+DB_BUSY_TIMEOUT_SECONDS = 5.0
+DB_CACHE_SIZE_KIB = 20000          # ~20 MB page cache per connection
+DB_MMAP_SIZE_BYTES = 256 * 1024 * 1024
+DB_STATEMENT_CACHE_SIZE = 256      # prepared statements kept per connection
+
+_SQL_COMMENT = re.compile(r"--[^\n]*")
+_SQL_WHITESPACE = re.compile(r"\s+")
+_SQL_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_SQL_NUMBER_LITERAL = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_SQL_PLACEHOLDER_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+@lru_cache(maxsize=1024)
+def normalize_sql(sql: str) -> str:
+    """A statement's fingerprint: comments dropped, whitespace collapsed, literals and placeholder lists folded."""
+    sql = _SQL_WHITESPACE.sub(" ", _SQL_COMMENT.sub("", sql)).strip()
+    sql = _SQL_STRING_LITERAL.sub("?", sql)
+    sql = _SQL_NUMBER_LITERAL.sub("?", sql)
+    return _SQL_PLACEHOLDER_LIST.sub("(?, ...)", sql)
+
+# Statements slower than this are logged together with their query plan.
+SLOW_QUERY_THRESHOLD_MS = 100
+slow_query_logger = logging.getLogger(f"{__name__}.slowquery")
+
+class QueryStats:
+    """Call count, total and worst duration per normalized statement."""
+
+    def __init__(self):
+        self._stats: dict = {}  # fingerprint -> [calls, total seconds, max seconds]
+        self._lock = threading.Lock()
+
+    def record(self, fingerprint: str, elapsed: float):
+        with self._lock:
+            entry = self._stats.get(fingerprint)
+            if entry is None:
+                self._stats[fingerprint] = [1, elapsed, elapsed]
+            else:
+                entry[0] += 1
+                entry[1] += elapsed
+                entry[2] = max(entry[2], elapsed)
+
+    def top(self, n: int = 10) -> List[Tuple[str, int, float, float]]:
+        """(fingerprint, calls, total seconds, max seconds), by total time."""
+        with self._lock:
+            items = [(fp, calls, total, worst) for fp, (calls, total, worst) in self._stats.items()]
+        return sorted(items, key=lambda item: item[2], reverse=True)[:n]
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+query_stats = QueryStats()
+
+def redact_params(params) -> str:
+    """Describes bound parameters by type and size only, so no user data reaches the log."""
+    def describe(value):
+        if value is None:
+            return "NULL"
+        if isinstance(value, (str, bytes)):
+            return f"<{type(value).__name__}:{len(value)}>"
+        return f"<{type(value).__name__}>"
+    if isinstance(params, dict):
+        return "{" + ", ".join(f"{key}: {describe(value)}" for key, value in params.items()) + "}"
+    return "(" + ", ".join(describe(value) for value in params) + ")"
+
+_EXPLAINABLE = re.compile(r"^\s*(SELECT|WITH|INSERT|UPDATE|DELETE|REPLACE)\b", re.IGNORECASE)
+
+def explain_statement(conn: sqlite3.Connection, sql: str, params) -> str:
+    """EXPLAIN QUERY PLAN output as an indented tree, or why it is unavailable."""
+    if not _EXPLAINABLE.match(sql):
+        return "(no plan for this statement type)"
+    try:
+        # Bypass TimedConnection so the EXPLAIN itself is not timed and reported.
+        rows = sqlite3.Connection.execute(conn, "EXPLAIN QUERY PLAN " + sql, params).fetchall()
+    except (sqlite3.Error, ValueError) as e:
+        return f"(plan unavailable: {e})"
+    depth = {0: 0}
+    lines = []
+    for node_id, parent_id, _, detail in rows:
+        depth[node_id] = depth.get(parent_id, 0) + 1
+        lines.append("  " * depth[node_id] + detail)
+    return "\n".join(lines)
+
+def report_statement(sql: str, params, elapsed: float, conn: sqlite3.Connection):
+    """Called after every statement run through a TimedConnection."""
+    fingerprint = normalize_sql(sql)
+    DB_STATEMENT_DURATION.observe(elapsed, statement=fingerprint)
+    query_stats.record(fingerprint, elapsed)
+    if elapsed * 1000 >= SLOW_QUERY_THRESHOLD_MS:
+        slow_query_logger.warning(
+            f"Slow query ({elapsed * 1000:.1f} ms): {fingerprint}\n"
+            f"  params: {redact_params(params)}\n"
+            f"{explain_statement(conn, sql, params)}"
+        )
+
+class TimedConnection(sqlite3.Connection):
+    """sqlite3 connection that reports how long each statement takes."""
+
+    def execute(self, sql: str, parameters=()):
+        start = perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            report_statement(sql, parameters, perf_counter() - start, self)
+
+    def executemany(self, sql: str, seq_of_parameters):
+        # The parameters may be a one-shot iterator; the first set is kept for EXPLAIN.
+        seq_of_parameters = iter(seq_of_parameters)
+        first = next(seq_of_parameters, None)
+        start = perf_counter()
+        try:
+            if first is None:
+                return super().executemany(sql, [])
+            return super().executemany(sql, chain((first,), seq_of_parameters))
+        finally:
+            report_statement(sql, first if first is not None else (), perf_counter() - start, self)
+
+    def fetch_all(self, sql: str, parameters=()) -> List[tuple]:
+        """execute() + fetchall() timed together; a SELECT does most of its work while fetching."""
+        start = perf_counter()
+        try:
+            return super().execute(sql, parameters).fetchall()
+        finally:
+            report_statement(sql, parameters, perf_counter() - start, self)
+
+class Database:
+    """Long-lived, tuned SQLite connections shared by the whole bot.
+
+    All writes go through a single writer connection guarded by a lock, so they never
+    contend with each other. Reads use one read-only connection per thread; in WAL mode
+    they see the last committed state and are not blocked by a running write.
+    Each connection keeps a cache of prepared statements, so the repeated queries in
+    this file are only compiled once.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._write_lock = threading.RLock()
+        self._writer: Optional[sqlite3.Connection] = None
+        self._local = threading.local()
+        self._readers: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+
+    def _connect(self, read_only: bool = False) -> sqlite3.Connection:
+        conn = sqlite3.connect(
+            self.path,
+            timeout=DB_BUSY_TIMEOUT_SECONDS,
+            isolation_level=None,  # transactions are managed explicitly
+            check_same_thread=False,
+            cached_statements=DB_STATEMENT_CACHE_SIZE,
+            factory=TimedConnection,
+        )
+        if not read_only:
+            conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        conn.execute(f"PRAGMA cache_size = -{DB_CACHE_SIZE_KIB}")
+        conn.execute(f"PRAGMA mmap_size = {DB_MMAP_SIZE_BYTES}")
+        conn.execute("PRAGMA temp_store = MEMORY")
+        if read_only:
+            conn.execute("PRAGMA query_only = ON")
+        return conn
+
+    @property
+    def writer(self) -> sqlite3.Connection:
+        if self._writer is None:
+            with self._write_lock:
+                if self._writer is None:
+                    self._writer = self._connect()
+        return self._writer
+
+    @property
+    def reader(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            self.writer  # make sure the file exists and is in WAL mode first
+            conn = self._connect(read_only=True)
+            self._local.conn = conn
+            with self._readers_lock:
+                self._readers.append(conn)
+        return conn
+
+    def read(self, query: str, params: tuple = ()) -> List[tuple]:
+        """Runs a read-only statement on this thread's reader connection."""
+        return self.reader.fetch_all(query, params)
+
+    def write(self, query: str, params: tuple = ()) -> List[tuple]:
+        """Runs a single statement in its own write transaction."""
+        with self.transaction() as conn:
+            return conn.fetch_all(query, params)
+
+    def write_many(self, query: str, seq_of_params: Iterable[tuple]) -> int:
+        """Runs one statement for every parameter tuple inside a single transaction."""
+        with self.transaction() as conn:
+            return conn.executemany(query, seq_of_params).rowcount
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Yields the writer connection inside BEGIN IMMEDIATE ... COMMIT."""
+        with self._write_lock:
+            conn = self.writer
+            if conn.in_transaction:
+                # Nested use from the same thread joins the outer transaction.
+                yield conn
+                return
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+
+    def close(self):
+        """Closes every connection opened by this instance."""
+        with self._readers_lock:
+            for conn in self._readers:
+                conn.close()
+            self._readers.clear()
+        self._local = threading.local()
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+
+db = Database(DB_NAME)
+
+# --- SCHEMA MIGRATIONS ---
+# Each step runs once, in order, inside the setup transaction; the applied version is
+# stored in PRAGMA user_version.
+
+def _migration_no_post_days_table(conn: sqlite3.Connection):
+    """Moves the JSON no_post_days columns into an indexed no_post_days table."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS no_post_days (
+            kind TEXT NOT NULL,                -- 'managed' or 'offline'
+            subscriber_id INTEGER NOT NULL,    -- subscribers.user_id or offline_subscribers.id
+            day TEXT NOT NULL,
+            PRIMARY KEY (kind, subscriber_id, day)
+        ) WITHOUT ROWID
+    """)
+    for kind, table, id_column in (("managed", "subscribers", "user_id"), ("offline", "offline_subscribers", "id")):
+        conn.execute(f"""
+            INSERT OR IGNORE INTO no_post_days (kind, subscriber_id, day)
+            SELECT '{kind}', t.{id_column}, j.value
+            FROM {table} AS t, json_each(CASE WHEN json_valid(t.no_post_days) THEN t.no_post_days ELSE '[]' END) AS j
+            WHERE j.type = 'text'
+        """)
+        # The legacy column is kept for older tooling but no longer maintained.
+        conn.execute(f"UPDATE {table} SET no_post_days = '[]' WHERE no_post_days != '[]'")
+
+def _migration_broadcast_jobs(conn: sqlite3.Connection):
+    """Adds persistent broadcast jobs with per-recipient delivery state."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS broadcast_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            text TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'running',   -- running, paused, cancelled, completed
+            created_at TEXT NOT NULL,
+            finished_at TEXT,
+            progress_chat_id INTEGER,
+            progress_message_id INTEGER
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS broadcast_recipients (
+            job_id INTEGER NOT NULL,
+            user_id INTEGER NOT NULL,
+            state TEXT NOT NULL DEFAULT 'pending',    -- pending, delivered, failed
+            error TEXT,
+            PRIMARY KEY (job_id, user_id)
+        ) WITHOUT ROWID
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_broadcast_recipients_state ON broadcast_recipients (job_id, state)")
+
+def _migration_user_list_indexes(conn: sqlite3.Connection):
+    """Indexes backing the keyset-paginated user list."""
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_subscribers_name ON subscribers (first_name, user_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_offline_subscribers_identifier ON offline_subscribers (identifier, id)")
+
+def _migration_countdown_indexes(conn: sqlite3.Connection):
+    """Partial indexes over the rows that still count down, keyed by remaining_days."""
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_subscribers_countdown
+        ON subscribers (remaining_days, first_name) WHERE is_active = 1 AND plan_days != -1
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_offline_subscribers_countdown
+        ON offline_subscribers (remaining_days, identifier) WHERE plan_days != -1
+    """)
+
+def _migration_channel_roster(conn: sqlite3.Connection):
+    """Adds the local channel-member roster and seeds it from the managed subscribers."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS channel_members (
+            user_id INTEGER PRIMARY KEY,
+            first_name TEXT,
+            last_name TEXT,
+            username TEXT,
+            search_name TEXT NOT NULL DEFAULT '',   -- normalize_search_text(first + last)
+            search_username TEXT,                   -- normalized username without '@'
+            status TEXT NOT NULL,                   -- last known ChatMember status, or 'unknown'
+            updated_at TEXT NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_channel_members_username ON channel_members (search_username)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS channel_member_trigrams (
+            trigram TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            PRIMARY KEY (trigram, user_id)
+        ) WITHOUT ROWID
+    """)
+    # Subscribers were approved after joining, but whether they are still in the channel
+    # is unknown until a membership event or a lookup confirms it.
+    for user_id, username, first_name in conn.execute("SELECT user_id, username, first_name FROM subscribers").fetchall():
+        upsert_roster_member(conn, user_id, html.unescape(first_name or ""), None, username, 'unknown', only_if_new=True)
+
+def _migration_posting_ledger(conn: sqlite3.Connection):
+    """Replaces the nightly remaining_days countdown with balances derived from a posting-day ledger."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS posting_days (
+            seq INTEGER PRIMARY KEY,           -- 1, 2, 3, ... in the order the days were recorded
+            day TEXT NOT NULL UNIQUE
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS subscription_extensions (
+            id INTEGER PRIMARY KEY,
+            kind TEXT NOT NULL,                -- 'managed' or 'offline'
+            subscriber_id INTEGER NOT NULL,
+            days INTEGER NOT NULL,
+            reason TEXT NOT NULL,              -- 'extension', 'lapse' or 'migration'
+            created_at TEXT NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_subscription_extensions_subscriber
+        ON subscription_extensions (kind, subscriber_id)
+    """)
+    conn.execute("ALTER TABLE admin_activity ADD COLUMN ledger_started TEXT")
+    conn.execute("UPDATE admin_activity SET ledger_started = ? WHERE id = 1", (datetime.now().strftime("%Y-%m-%d"),))
+
+    for kind, table, id_column in BALANCE_TABLES:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN start_seq INTEGER")
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN extension_days INTEGER NOT NULL DEFAULT 0")
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN expiry_seq INTEGER")
+        # Balances above the plan came from extensions; keep them as deltas so the audit
+        # below (which also derives start_seq from the legacy countdown) agrees with them.
+        conn.execute(f"""
+            INSERT INTO subscription_extensions (kind, subscriber_id, days, reason, created_at)
+            SELECT '{kind}', {id_column}, remaining_days - plan_days, 'migration', COALESCE(start_date, '')
+            FROM {table} WHERE plan_days != -1 AND remaining_days > plan_days
+        """)
+    audit_balances(conn, repair=True)
+
+    # remaining_days is no longer maintained; the views derive it in its old position.
+    conn.execute("DROP INDEX IF EXISTS idx_subscribers_countdown")
+    conn.execute("DROP INDEX IF EXISTS idx_offline_subscribers_countdown")
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_subscribers_expiry
+        ON subscribers (expiry_seq, first_name) WHERE is_active = 1 AND plan_days != -1
+    """)
+    conn.execute("""
+        CREATE INDEX IF NOT EXISTS idx_offline_subscribers_expiry
+        ON offline_subscribers (expiry_seq, identifier) WHERE plan_days != -1
+    """)
+    conn.execute(f"""
+        CREATE VIEW IF NOT EXISTS subscriber_balances AS
+        SELECT user_id, username, first_name, plan_days, {REMAINING_DAYS_SQL} AS remaining_days,
+               start_date, payment_info, is_active, no_post_days, start_seq, extension_days, expiry_seq
+        FROM subscribers
+    """)
+    conn.execute(f"""
+        CREATE VIEW IF NOT EXISTS offline_balances AS
+        SELECT id, identifier, plan_days, {REMAINING_DAYS_SQL} AS remaining_days,
+               start_date, payment_info, no_post_days, start_seq, extension_days, expiry_seq
+        FROM offline_subscribers
+    """)
+
+def _migration_expiry_digests(conn: sqlite3.Connection):
+    """Adds the admin's expiry digests: one message per daily run instead of one per user."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS expiry_digests (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at TEXT NOT NULL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS expiry_digest_entries (
+            digest_id INTEGER NOT NULL,
+            position INTEGER NOT NULL,             -- display order, by name
+            user_id INTEGER NOT NULL,
+            first_name TEXT,
+            selected INTEGER NOT NULL DEFAULT 0,
+            extended_days INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (digest_id, position)
+        ) WITHOUT ROWID
+    """)
+
+def _migration_removal_queue(conn: sqlite3.Connection):
+    """Adds the persistent queue and audit log of automatic channel removals."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS removal_queue (
+            user_id INTEGER PRIMARY KEY,
+            state TEXT NOT NULL DEFAULT 'pending',  -- pending, banned, done, failed, cancelled
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TEXT NOT NULL,
+            enqueued_at TEXT NOT NULL,
+            last_error TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_removal_queue_due ON removal_queue (state, next_attempt_at)")
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS removal_audit (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            action TEXT NOT NULL,                   -- ban, unban, cancel
+            outcome TEXT NOT NULL,                  -- ok, retry, failed
+            detail TEXT,
+            created_at TEXT NOT NULL
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_removal_audit_user ON removal_audit (user_id)")
+
+def _migration_outbox(conn: sqlite3.Connection):
+    """Adds the outbox of notifications written together with the state change they report."""
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS outbox (
+            id INTEGER PRIMARY KEY,
+            chat_id INTEGER NOT NULL,
+            priority INTEGER NOT NULL,              -- lower is delivered first
+            payload TEXT NOT NULL,                  -- JSON: text, parse_mode, reply_markup
+            dedup_key TEXT UNIQUE,
+            state TEXT NOT NULL DEFAULT 'pending',  -- pending, sent, failed
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            sent_at TEXT,
+            last_error TEXT
+        )
+    """)
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_pending ON outbox (priority, id) WHERE state = 'pending'")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_outbox_created ON outbox (created_at)")
+
+def _migration_broadcast_sources(conn: sqlite3.Connection):
+    """Broadcast jobs remember the admin's message they copy; `text` becomes its preview."""
+    conn.execute("ALTER TABLE broadcast_jobs ADD COLUMN source_chat_id INTEGER")
+    conn.execute("ALTER TABLE broadcast_jobs ADD COLUMN source_message_id INTEGER")
+
+SCHEMA_MIGRATIONS = [
+    (1, "no_post_days table", _migration_no_post_days_table),
+    (2, "broadcast jobs", _migration_broadcast_jobs),
+    (3, "user list indexes", _migration_user_list_indexes),
+    (4, "countdown indexes", _migration_countdown_indexes),
+    (5, "channel member roster", _migration_channel_roster),
+    (6, "posting-day ledger", _migration_posting_ledger),
+    (7, "expiry digests", _migration_expiry_digests),
+    (8, "channel removal queue", _migration_removal_queue),
+    (9, "notification outbox", _migration_outbox),
+    (10, "broadcast source messages", _migration_broadcast_sources),
+]
+
+def migrate_schema(conn: sqlite3.Connection):
+    """Applies all schema migrations newer than the database's user_version."""
+    version = conn.execute("PRAGMA user_version").fetchone()[0]
+    for target, description, migration in SCHEMA_MIGRATIONS:
+        if version < target:
+            logger.info(f"Applying schema migration {target}: {description}")
+            migration(conn)
+            conn.execute(f"PRAGMA user_version = {target}")
+
 def setup_database():
     """Initializes the SQLite database and creates the necessary tables."""
     try:
-        conn = sqlite3.connect(DB_NAME)
-        cursor = conn.cursor()
-
-        # Table for bot-managed, "online" subscribers
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS subscribers (
-                user_id INTEGER PRIMARY KEY,
-                username TEXT,
-                first_name TEXT,
-                plan_days INTEGER,
-                remaining_days INTEGER,
-                start_date TEXT,
-                payment_info TEXT,
-                is_active INTEGER DEFAULT 1,
-                no_post_days TEXT DEFAULT '[]'
-            )
-        """)
+        with db.transaction() as conn:
+            # Table for bot-managed, "online" subscribers
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS subscribers (
+                    user_id INTEGER PRIMARY KEY,
+                    username TEXT,
+                    first_name TEXT,
+                    plan_days INTEGER,
+                    remaining_days INTEGER,
+                    start_date TEXT,
+                    payment_info TEXT,
+                    is_active INTEGER DEFAULT 1,
+                    no_post_days TEXT DEFAULT '[]'
+                )
+            """)
+
+            # New table for admin's "offline" manual records
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS offline_subscribers (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    identifier TEXT NOT NULL,
+                    plan_days INTEGER,
+                    remaining_days INTEGER,
+                    start_date TEXT,
+                    payment_info TEXT,
+                    no_post_days TEXT DEFAULT '[]'
+                )
+            """)
 
-        # New table for admin's "offline" manual records
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS offline_subscribers (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                identifier TEXT NOT NULL,
-                plan_days INTEGER,
-                remaining_days INTEGER,
-                start_date TEXT,
-                payment_info TEXT,
-                no_post_days TEXT DEFAULT '[]'
-            )
-        """)
+            # Table to track admin posting activity
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS admin_activity (
+                    id INTEGER PRIMARY KEY,
+                    last_post_date TEXT
+                )
+            """)
 
-        # Table to track admin posting activity
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS admin_activity (
-                id INTEGER PRIMARY KEY,
-                last_post_date TEXT
-            )
-        """)
+            conn.execute("INSERT OR IGNORE INTO admin_activity (id, last_post_date) VALUES (1, NULL)")
+
+            migrate_schema(conn)
 
-        cursor.execute("INSERT OR IGNORE INTO admin_activity (id, last_post_date) VALUES (1, NULL)")
-        conn.commit()
-        conn.close()
+            for name, step in find_full_scans(conn):
+                logger.warning(f"Query plan regression: '{name}' does a full table scan ({step})")
         logger.info("Database setup complete.")
 
     except Exception as e:
@@ -158,33 +940,930 @@ def validate_days(days_text: str) -> Optional[int]:
 
 # --- DATABASE HELPER FUNCTIONS ---
 
+_READ_ONLY_PREFIXES = ("SELECT", "WITH", "EXPLAIN")
+
+def is_read_query(query: str) -> bool:
+    """Returns True if the statement can run on a read-only connection."""
+    return query.lstrip().upper().startswith(_READ_ONLY_PREFIXES)
+
 def db_query(query: str, params: tuple = ()) -> List[tuple]:
     """Executes a database query and returns results with error handling."""
     try:
-        with sqlite3.connect(DB_NAME) as conn:
-            cursor = conn.cursor()
-            cursor.execute(query, params)
-            conn.commit()
-            return cursor.fetchall()
+        if is_read_query(query):
+            return db.read(query, params)
+        return db.write(query, params)
     except Exception as e:
         logger.error(f"Database query error: {e}")
         return []
 
-def safe_json_loads(json_str: str) -> List[str]:
-    """Safely load JSON string, return empty list on error."""
+# --- ASYNC DATABASE ACCESS ---
+# Handlers must never touch SQLite on the event loop thread: a slow query or a lock wait
+# there would stall every other update. Reads run on a small thread pool; writes are queued
+# to a single writer task which commits everything queued so far in one transaction.
+
+DB_READ_WORKERS = 4
+DB_WRITE_BATCH_SIZE = 200
+
+T = TypeVar("T")
+WriteJob = Callable[[sqlite3.Connection], T]
+
+class AsyncDatabase:
+    """Non-blocking access to the global `db` for async handlers.
+
+    Queued writes are committed together in one transaction (group commit). If one of
+    them fails, the batch is replayed with a SAVEPOINT per write, so only that caller
+    gets the error while the rest of the batch still commits.
+    """
+
+    def __init__(self, read_workers: int = DB_READ_WORKERS, batch_size: int = DB_WRITE_BATCH_SIZE):
+        self.batch_size = batch_size
+        self._read_executor = ThreadPoolExecutor(max_workers=read_workers, thread_name_prefix="db-reader")
+        self._write_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-writer")
+        self._queue: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+
+    async def read(self, query: str, params: tuple = ()) -> List[tuple]:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._read_executor, db.read, query, params)
+
+    async def run_read(self, job: Callable[[sqlite3.Connection], T]) -> T:
+        """Runs `job(conn)` with a reader connection on the read pool."""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._read_executor, lambda: job(db.reader))
+
+    async def run_write(self, job: WriteJob) -> T:
+        """Queues `job(conn)` for the writer task and waits until its batch is committed."""
+        self._ensure_writer()
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((job, future))
+        return await future
+
+    async def write(self, query: str, params: tuple = ()) -> List[tuple]:
+        return await self.run_write(lambda conn: conn.execute(query, params).fetchall())
+
+    async def write_many(self, query: str, seq_of_params: Iterable[tuple]) -> int:
+        params = list(seq_of_params)
+        return await self.run_write(lambda conn: conn.executemany(query, params).rowcount)
+
+    def _ensure_writer(self):
+        if self._writer_task is None or self._writer_task.done():
+            self._queue = asyncio.Queue()
+            self._writer_task = asyncio.get_running_loop().create_task(self._writer_loop())
+
+    async def _writer_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            while len(batch) < self.batch_size and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+
+            try:
+                results = await loop.run_in_executor(self._write_executor, self._commit_batch, batch)
+            except Exception as e:
+                logger.error(f"Database write batch of {len(batch)} failed: {e}")
+                results = [(False, e)] * len(batch)
+
+            for (_, future), (ok, value) in zip(batch, results):
+                if future.done():
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    @staticmethod
+    def _commit_batch(batch: List[tuple]) -> List[tuple]:
+        try:
+            with db.transaction() as conn:
+                return [(True, job(conn)) for job, _ in batch]
+        except Exception:
+            if len(batch) == 1:
+                raise
+        # Something in the batch failed and the whole transaction was rolled back.
+        # Replay it with one SAVEPOINT per job so only the failing callers see an error.
+        results = []
+        with db.transaction() as conn:
+            for job, _ in batch:
+                conn.execute("SAVEPOINT write_job")
+                try:
+                    value = job(conn)
+                except Exception as e:
+                    conn.execute("ROLLBACK TO write_job")
+                    results.append((False, e))
+                else:
+                    results.append((True, value))
+                conn.execute("RELEASE write_job")
+        return results
+
+    async def close(self):
+        """Waits for queued writes to be committed and stops the writer task."""
+        if self._writer_task is not None and not self._writer_task.done():
+            # The queue is FIFO, so once this no-op is committed everything before it is too.
+            await self.run_write(lambda conn: None)
+            self._writer_task.cancel()
+        self._writer_task = None
+
+async_db = AsyncDatabase()
+
+async def db_read(query: str, params: tuple = ()) -> List[tuple]:
+    """Async counterpart of db_query for SELECTs; runs on the reader thread pool."""
     try:
-        if not json_str:
-            return []
-        return json.loads(json_str)
-    except (json.JSONDecodeError, TypeError):
+        return await async_db.read(query, params)
+    except Exception as e:
+        logger.error(f"Database query error: {e}")
         return []
 
-def safe_json_dumps(data: List[str]) -> str:
-    """Safely dump data to JSON string."""
+async def db_write(query: str, params: tuple = ()) -> List[tuple]:
+    """Async counterpart of db_query for writes; group-committed by the writer task."""
+    try:
+        return await async_db.write(query, params)
+    except Exception as e:
+        logger.error(f"Database query error: {e}")
+        return []
+
+# --- POSTING-DAY LEDGER ---
+# Every day the admin posts in the channel is recorded once in `posting_days` and gets
+# the next sequence number. A subscription stores the sequence number at its start and
+# the one at which it runs out:
+#
+#     expiry_seq = start_seq + plan_days + extension_days
+#     remaining  = max(0, expiry_seq - current posting seq)      (-1 for lifetime plans)
+#
+# extension_days is the sum of the deltas in `subscription_extensions`, so every balance
+# can be recomputed from the plan and the two ledgers (see audit_balances). Nothing has
+# to be decremented at night any more; the daily job only looks for threshold crossings.
+
+BALANCE_TABLES = (("managed", "subscribers", "user_id"), ("offline", "offline_subscribers", "id"))
+
+CURRENT_POSTING_SEQ_SQL = "(SELECT COALESCE(MAX(seq), 0) FROM posting_days)"
+REMAINING_DAYS_SQL = f"CASE WHEN plan_days = -1 THEN -1 ELSE MAX(0, expiry_seq - {CURRENT_POSTING_SEQ_SQL}) END"
+
+def current_posting_seq(conn: sqlite3.Connection) -> int:
+    return conn.execute(f"SELECT {CURRENT_POSTING_SEQ_SQL}").fetchone()[0]
+
+def record_posting_day(conn: sqlite3.Connection, day: str) -> bool:
+    """Adds `day` to the posting-day ledger; returns False if it was already recorded."""
+    conn.execute("UPDATE admin_activity SET last_post_date = ? WHERE id = 1", (day,))
+    return conn.execute("INSERT OR IGNORE INTO posting_days (day) VALUES (?)", (day,)).rowcount == 1
+
+# Posting days that went by after a balance ran out were not used; an extension counts
+# from today, as it did when remaining_days stopped at zero.
+LAPSED_DAYS_SQL = (f"CASE WHEN plan_days != -1 AND expiry_seq < {CURRENT_POSTING_SEQ_SQL} "
+                   f"THEN {CURRENT_POSTING_SEQ_SQL} - expiry_seq ELSE 0 END")
+
+def extend_subscriptions(conn: sqlite3.Connection, user_ids_sql: str, params: dict, days: int) -> int:
+    """Adds `days` to the managed subscriptions selected by `user_ids_sql`, reactivating them.
+
+    `user_ids_sql` is a SELECT returning user_ids, with named parameters from `params`.
+    The deltas are recorded and applied with set-based statements; returns the row count.
+    """
+    params = {**params, 'days': days, 'today': datetime.now().strftime("%Y-%m-%d")}
+    conn.execute(f"""
+        INSERT INTO subscription_extensions (kind, subscriber_id, days, reason, created_at)
+        SELECT 'managed', user_id, {LAPSED_DAYS_SQL}, 'lapse', :today FROM subscribers
+        WHERE user_id IN ({user_ids_sql}) AND {LAPSED_DAYS_SQL} > 0
+    """, params)
+    conn.execute(f"""
+        INSERT INTO subscription_extensions (kind, subscriber_id, days, reason, created_at)
+        SELECT 'managed', user_id, :days, 'extension', :today FROM subscribers
+        WHERE user_id IN ({user_ids_sql})
+    """, params)
+    return conn.execute(f"""
+        UPDATE subscribers
+        SET extension_days = extension_days + :days + {LAPSED_DAYS_SQL},
+            expiry_seq = expiry_seq + :days + {LAPSED_DAYS_SQL},
+            is_active = 1
+        WHERE user_id IN ({user_ids_sql})
+    """, params).rowcount
+
+def audit_balances(conn: sqlite3.Connection, repair: bool = False) -> Dict[str, int]:
+    """Checks every stored balance against the plan and the extension ledger.
+
+    Returns the number of disagreeing rows per kind; with `repair`, they are rewritten
+    from the ledgers. Rows without a start_seq (inserted by older tooling) are adopted
+    the way the ledger migration adopted the legacy remaining_days countdown.
+    """
+    mismatches = {}
+    for kind, table, id_column in BALANCE_TABLES:
+        extensions = f"""(SELECT COALESCE(SUM(e.days), 0) FROM subscription_extensions AS e
+                          WHERE e.kind = '{kind}' AND e.subscriber_id = {table}.{id_column})"""
+        start_seq = (f"COALESCE(start_seq, {CURRENT_POSTING_SEQ_SQL} "
+                     f"- MAX(0, COALESCE(plan_days, 0) - COALESCE(remaining_days, 0)))")
+        expiry_seq = f"{start_seq} + COALESCE(plan_days, 0) + {extensions}"
+        disagrees = f"start_seq IS NULL OR extension_days IS NOT {extensions} OR expiry_seq IS NOT {expiry_seq}"
+        mismatches[kind] = conn.execute(f"SELECT COUNT(*) FROM {table} WHERE {disagrees}").fetchone()[0]
+        if repair and mismatches[kind]:
+            conn.execute(f"""
+                UPDATE {table}
+                SET start_seq = {start_seq}, extension_days = {extensions}, expiry_seq = {expiry_seq}
+                WHERE {disagrees}
+            """)
+    return mismatches
+
+def no_post_days_of(conn: sqlite3.Connection, kind: str, subscriber_id: int, today: str) -> List[str]:
+    """All days (oldest first) on which the subscription was running but nothing was posted.
+
+    Days before the ledger started come from the legacy no_post_days table; later ones
+    are the calendar days from the start up to today (or until the balance ran out)
+    that are missing from the ledger.
+    """
+    days = {row[0] for row in conn.execute(LEGACY_NO_POST_DAYS_SQL, (kind, subscriber_id))}
+    _, table, id_column = next(entry for entry in BALANCE_TABLES if entry[0] == kind)
+    row = conn.execute(f"SELECT start_date, plan_days, expiry_seq FROM {table} WHERE {id_column} = ?",
+                       (subscriber_id,)).fetchone()
+    ledger_started = conn.execute("SELECT ledger_started FROM admin_activity WHERE id = 1").fetchone()[0]
+    if not row or row[1] == -1 or not row[0] or row[2] is None:
+        return sorted(days)
+
+    first = max(row[0], ledger_started or today)
+    end = today
+    if row[2] <= current_posting_seq(conn):
+        exhausted = conn.execute("SELECT day FROM posting_days WHERE seq = ?", (row[2],)).fetchone()
+        end = min(end, exhausted[0]) if exhausted else first  # ran out before the ledger began
+    try:
+        day = datetime.strptime(first, "%Y-%m-%d").date()
+        last = datetime.strptime(end, "%Y-%m-%d").date()
+    except ValueError:
+        return sorted(days)
+
+    posted = {r[0] for r in conn.execute(POSTING_DAYS_BETWEEN_SQL, (first, end))}
+    while day < last:
+        key = day.isoformat()
+        if key not in posted:
+            days.add(key)
+        day += timedelta(days=1)
+    return sorted(days)
+
+# Point lookups shared by several handlers. The *_balances views return the table's
+# columns in their usual order, with remaining_days derived from the ledger.
+SUBSCRIBER_BY_ID_SQL = "SELECT * FROM subscriber_balances WHERE user_id = ?"
+OFFLINE_RECORD_BY_ID_SQL = "SELECT * FROM offline_balances WHERE id = ?"
+SUBSCRIBER_NAME_SQL = "SELECT first_name FROM subscribers WHERE user_id = ?"
+OFFLINE_IDENTIFIER_SQL = "SELECT identifier FROM offline_subscribers WHERE id = ?"
+LEGACY_NO_POST_DAYS_SQL = "SELECT day FROM no_post_days WHERE kind = ? AND subscriber_id = ?"
+POSTING_DAYS_BETWEEN_SQL = "SELECT day FROM posting_days WHERE day >= ? AND day < ?"
+
+def save_managed_subscriber(conn: sqlite3.Connection, user_id: int, username: str, full_name: str,
+                            plan_days: int, start_date: str, payment_info: str):
+    """Creates or replaces a managed subscription; a re-approval starts a fresh history."""
+    start_seq = current_posting_seq(conn)
+    conn.execute(
+        """INSERT OR REPLACE INTO subscribers
+           (user_id, username, first_name, plan_days, start_date, payment_info, is_active,
+            start_seq, extension_days, expiry_seq)
+           VALUES (?, ?, ?, ?, ?, ?, 1, ?, 0, ?)""",
+        (user_id, username, full_name, plan_days, start_date, payment_info, start_seq, start_seq + plan_days)
+    )
+    conn.execute("DELETE FROM no_post_days WHERE kind = 'managed' AND subscriber_id = ?", (user_id,))
+    conn.execute("DELETE FROM subscription_extensions WHERE kind = 'managed' AND subscriber_id = ?", (user_id,))
+    return conn.execute(SUBSCRIBER_BY_ID_SQL, (user_id,)).fetchone()
+
+def extend_subscription(conn: sqlite3.Connection, user_id: int, days: int):
+    """Adds `days` to a managed subscription, reactivating it; returns the updated row."""
+    extend_subscriptions(conn, "SELECT :user_id", {'user_id': user_id}, days)
+    return conn.execute(SUBSCRIBER_BY_ID_SQL, (user_id,)).fetchone()
+
+# --- SUBSCRIBER CACHE ---
+# /status and the detail views read subscriber rows far more often than they change,
+# and reminder days produce sharp spikes. Rows are cached in a bounded LRU with a TTL;
+# every path that writes `subscribers` stores the new row (write-through), so the TTL
+# only guards against edits made outside the bot.
+
+SUBSCRIBER_CACHE_SIZE = 10000
+SUBSCRIBER_CACHE_TTL_SECONDS = 600
+
+_MISSING = object()
+
+class LRUCache:
+    """Bounded LRU mapping with a per-entry TTL and hit/miss counters."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.version = 0  # bumped by every write-through, see `fill`
+        self._entries: OrderedDict = OrderedDict()
+
+    def get(self, key):
+        """Returns the cached value or `_MISSING`."""
+        entry = self._entries.get(key)
+        if entry is None or entry[1] < monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return _MISSING
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, value, ttl: Optional[float] = None):
+        """Write-through update from a path that just changed the underlying data."""
+        self.version += 1
+        self._store(key, value, ttl)
+
+    def fill(self, key, value, version: int, ttl: Optional[float] = None):
+        """Stores a freshly read value, unless a write happened since the read began."""
+        if version == self.version:
+            self._store(key, value, ttl)
+
+    def invalidate(self, key):
+        self.version += 1
+        self._entries.pop(key, None)
+
+    def _store(self, key, value, ttl: Optional[float] = None):
+        self._entries[key] = (value, monotonic() + (self.ttl if ttl is None else ttl))
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def keys(self) -> List:
+        return list(self._entries)
+
+    def clear(self):
+        self.version += 1
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            'size': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+subscriber_cache = LRUCache(SUBSCRIBER_CACHE_SIZE, SUBSCRIBER_CACHE_TTL_SECONDS)
+
+async def get_subscriber(user_id: int) -> Optional[tuple]:
+    """Returns the subscribers row for `user_id` (or None), served from the cache when possible."""
+    row = subscriber_cache.get(user_id)
+    if row is not _MISSING:
+        return row
+    version = subscriber_cache.version
+    rows = await async_db.read(SUBSCRIBER_BY_ID_SQL, (user_id,))
+    row = rows[0] if rows else None
+    subscriber_cache.fill(user_id, row, version)
+    return row
+
+def reload_subscribers(conn: sqlite3.Connection, user_ids: List[int]) -> dict:
+    """Reads the current rows for `user_ids` (missing ones map to None), in chunks."""
+    rows = dict.fromkeys(user_ids)
+    for start in range(0, len(user_ids), 500):
+        chunk = user_ids[start:start + 500]
+        placeholders = ",".join("?" * len(chunk))
+        for row in conn.execute(f"SELECT * FROM subscriber_balances WHERE user_id IN ({placeholders})", chunk):
+            rows[row[0]] = row
+    return rows
+
+async def store_managed_subscriber(user_id: int, username: str, full_name: str,
+                                   plan_days: int, start_date: str, payment_info: str):
+    """Saves a managed subscription and updates the cache and dashboard stats."""
+    row = await async_db.run_write(
+        lambda conn: save_managed_subscriber(conn, user_id, username, full_name, plan_days, start_date, payment_info)
+    )
+    subscriber_cache.put(user_id, row)
+    stats_snapshot.invalidate()
+
+async def fetch_no_post_days(kind: str, subscriber_id: int, limit: int = 5) -> Tuple[List[str], int]:
+    """Returns the most recent no-post days (oldest first) and the total number."""
+    today = datetime.now().strftime("%Y-%m-%d")
     try:
-        return json.dumps(data)
-    except (TypeError, ValueError):
-        return "[]"
+        days = await async_db.run_read(lambda conn: no_post_days_of(conn, kind, subscriber_id, today))
+    except Exception as e:
+        logger.error(f"Database query error: {e}")
+        return [], 0
+    return days[-limit:], len(days)
+
+# --- BOT API RATE LIMITING ---
+# Telegram allows roughly 30 messages per second overall and about one per second into
+# the same chat. Every bulk sender goes through the shared limiter and pacer below.
+
+BOT_API_RATE_PER_SECOND = 30
+BOT_API_BURST = 30
+PER_CHAT_INTERVAL_SECONDS = 1.0
+SEND_MAX_ATTEMPTS = 5
+SEND_BACKOFF_BASE_SECONDS = 1.0
+
+class TokenBucket:
+    """Async token bucket; `pause` blocks every caller, e.g. after a RetryAfter."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated: Optional[float] = None
+        self._blocked_until = 0.0
+        self._lock = asyncio.Lock()
+
+    def pause(self, seconds: float):
+        loop_time = asyncio.get_running_loop().time()
+        self._blocked_until = max(self._blocked_until, loop_time + seconds)
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        async with self._lock:
+            while True:
+                now = loop.time()
+                if now < self._blocked_until:
+                    await asyncio.sleep(self._blocked_until - now)
+                    continue
+                if self._updated is not None:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+class ChatPacer:
+    """Keeps consecutive sends into the same chat at least `interval` seconds apart."""
+
+    def __init__(self, interval: float, max_tracked: int = 50000):
+        self.interval = interval
+        self.max_tracked = max_tracked
+        self._next_slot: dict = {}
+
+    async def wait(self, chat_id: int):
+        now = asyncio.get_running_loop().time()
+        if len(self._next_slot) > self.max_tracked:
+            self._next_slot = {k: v for k, v in self._next_slot.items() if v > now}
+        slot = max(now, self._next_slot.get(chat_id, now))
+        self._next_slot[chat_id] = slot + self.interval
+        if slot > now:
+            await asyncio.sleep(slot - now)
+
+bot_rate_limiter = TokenBucket(BOT_API_RATE_PER_SECOND, BOT_API_BURST)
+chat_pacer = ChatPacer(PER_CHAT_INTERVAL_SECONDS)
+
+def retry_after_seconds(error: RetryAfter) -> float:
+    """RetryAfter.retry_after is an int or a timedelta depending on the PTB version."""
+    value = error.retry_after
+    return value.total_seconds() if isinstance(value, timedelta) else float(value)
+
+async def send_with_retry(chat_id: int, send: Callable[[], Awaitable[T]], max_attempts: int = SEND_MAX_ATTEMPTS,
+                          pace_chat: bool = True) -> T:
+    """Runs a Bot API call for `chat_id` under the shared rate limits.
+
+    Flood-control errors wait the requested time and don't count as attempts; timeouts and
+    other network errors are retried with exponential backoff. BadRequest and Forbidden
+    are permanent and re-raised immediately. `pace_chat=False` skips the per-chat interval
+    for calls that don't post into the chat.
+    """
+    attempt = 1
+    while True:
+        if pace_chat:
+            await chat_pacer.wait(chat_id)
+        await bot_rate_limiter.acquire()
+        try:
+            return await send()
+        except RetryAfter as e:
+            delay = retry_after_seconds(e)
+            send_logger.warning(f"Flood control hit while sending to {chat_id}; pausing sends for {delay:.0f}s")
+            bot_rate_limiter.pause(delay)
+        except (BadRequest, Forbidden):
+            raise
+        except NetworkError as e:
+            if attempt >= max_attempts:
+                raise
+            delay = SEND_BACKOFF_BASE_SECONDS * 2 ** (attempt - 1)
+            send_logger.warning(f"Network error sending to {chat_id} (attempt {attempt}/{max_attempts}): {e}; retrying in {delay:.1f}s")
+            attempt += 1
+            await asyncio.sleep(delay)
+
+# --- BROADCAST ENGINE ---
+# Broadcasts are persisted as jobs with one row per recipient, so a restart resumes
+# where it stopped instead of re-sending to everyone. Delivery results are checkpointed
+# in batches; at most one batch can be re-sent after a crash.
+#
+# A job copies the admin's original message (copy_message), whatever its type: Telegram
+# duplicates it server-side, so media is uploaded once by the admin and fanned out by
+# reference, and text keeps its formatting entities. Jobs without a source message (from
+# before migration 10) send their stored text.
+
+BROADCAST_CONCURRENCY = 16
+BROADCAST_PROGRESS_INTERVAL_SECONDS = 5.0
+BROADCAST_CHECKPOINT_SIZE = 200
+
+# job_id -> Broadcast for jobs running in this process
+active_broadcasts: dict = {}
+
+BROADCAST_COUNTS_SQL = "SELECT state, COUNT(*) FROM broadcast_recipients WHERE job_id = ? GROUP BY state"
+PENDING_RECIPIENTS_SQL = "SELECT user_id FROM broadcast_recipients WHERE job_id = ? AND state = 'pending'"
+CHECKPOINT_RECIPIENT_SQL = "UPDATE broadcast_recipients SET state = ?, error = ? WHERE job_id = ? AND user_id = ?"
+
+BROADCAST_MEDIA_KINDS = ("photo", "video", "animation", "document", "audio", "voice", "video_note",
+                         "sticker", "poll", "location", "venue", "contact")
+
+def describe_message(message) -> str:
+    """Plain-text preview of a message for the job list, e.g. "[photo] caption"."""
+    kind = next((kind for kind in BROADCAST_MEDIA_KINDS if getattr(message, kind, None)), None)
+    body = message.text or message.caption or ""
+    if kind:
+        return f"[{kind}] {body}".strip()
+    return body or "[message]"
+
+def create_broadcast_job(conn: sqlite3.Connection, text: str,
+                         source: Optional[Tuple[int, int]] = None) -> Tuple[int, int]:
+    """Creates a job addressed to every active managed subscriber; returns (job_id, recipients).
+
+    `source` is the (chat_id, message_id) of the message to copy; without it `text` is sent.
+    """
+    source_chat_id, source_message_id = source or (None, None)
+    job_id = conn.execute(
+        """INSERT INTO broadcast_jobs (text, status, created_at, source_chat_id, source_message_id)
+           VALUES (?, 'running', ?, ?, ?)""",
+        (text, datetime.now().strftime("%Y-%m-%d %H:%M:%S"), source_chat_id, source_message_id)
+    ).lastrowid
+    recipients = conn.execute(
+        "INSERT INTO broadcast_recipients (job_id, user_id) SELECT ?, user_id FROM subscribers WHERE is_active = 1",
+        (job_id,)
+    ).rowcount
+    return job_id, recipients
+
+async def fetch_broadcast_counts(job_id: int) -> dict:
+    """Returns {'pending': n, 'delivered': n, 'failed': n} for a job."""
+    counts = {'pending': 0, 'delivered': 0, 'failed': 0}
+    for state, count in await db_read(BROADCAST_COUNTS_SQL, (job_id,)):
+        counts[state] = count
+    return counts
+
+class Broadcast:
+    """Delivers one persisted broadcast job with bounded concurrency.
+
+    Progress is reported by periodically editing the admin's status message.
+    """
+
+    def __init__(self, bot, job_id: int, text: str, progress_chat_id: Optional[int], progress_message_id: Optional[int],
+                 source: Optional[Tuple[int, int]] = None):
+        self.bot = bot
+        self.job_id = job_id
+        self.text = text
+        self.source = source
+        self.progress_chat_id = progress_chat_id
+        self.progress_message_id = progress_message_id
+        self.total = 0
+        self.sent = 0
+        self.failed = 0
+        self.cancelled = False
+        self._running = asyncio.Event()
+        self._running.set()
+        self._results: List[tuple] = []
+
+    @property
+    def paused(self) -> bool:
+        return not self._running.is_set()
+
+    def pause(self):
+        self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def cancel(self):
+        self.cancelled = True
+        self._running.set()
+
+    async def run(self):
+        active_broadcasts[self.job_id] = self
+        started = perf_counter()
+        outcome = "failed"
+        try:
+            await self._run()
+            outcome = "cancelled" if self.cancelled else "completed"
+        finally:
+            active_broadcasts.pop(self.job_id, None)
+            BROADCAST_DURATION.observe(perf_counter() - started, outcome=outcome)
+
+    async def _run(self):
+        counts = await fetch_broadcast_counts(self.job_id)
+        self.sent, self.failed = counts['delivered'], counts['failed']
+        self.total = sum(counts.values())
+
+        queue: asyncio.Queue = asyncio.Queue()
+        for (user_id,) in await db_read(PENDING_RECIPIENTS_SQL, (self.job_id,)):
+            queue.put_nowait(user_id)
+
+        started = datetime.now()
+        reporter = asyncio.create_task(self._report_progress())
+        try:
+            workers = [asyncio.create_task(self._worker(queue)) for _ in range(min(BROADCAST_CONCURRENCY, queue.qsize()))]
+            await asyncio.gather(*workers)
+        finally:
+            reporter.cancel()
+            await self._checkpoint()
+
+        elapsed = (datetime.now() - started).total_seconds()
+        if self.cancelled:
+            broadcast_logger.info(f"Broadcast job {self.job_id} cancelled after {elapsed:.1f}s: {self.sent} sent, {self.failed} failed")
+            await self._edit_progress(
+                f"Broadcast cancelled.\n- Sent successfully: {self.sent}\n- Failed: {self.failed}\n"
+                f"- Not sent: {self.total - self.sent - self.failed}"
+            )
+            return
+
+        await db_write(
+            "UPDATE broadcast_jobs SET status = 'completed', finished_at = ? WHERE id = ?",
+            (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), self.job_id)
+        )
+        broadcast_logger.info(f"Broadcast job {self.job_id} finished in {elapsed:.1f}s: {self.sent} sent, {self.failed} failed")
+        await self._edit_progress(
+            f"Broadcast complete.\n- Sent successfully: {self.sent}\n- Failed: {self.failed}"
+        )
+
+    async def _worker(self, queue: asyncio.Queue):
+        while True:
+            await self._running.wait()
+            if self.cancelled:
+                return
+            # Workers parked on a pause all wake at once; the queue may be drained by now.
+            try:
+                chat_id = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                await send_with_retry(chat_id, lambda: self._send(chat_id))
+                self.sent += 1
+                BROADCAST_MESSAGES.inc(result="delivered")
+                self._results.append(('delivered', None, self.job_id, chat_id))
+            except (Forbidden, BadRequest) as e:
+                broadcast_logger.warning(f"Failed to send broadcast to {chat_id}: {e}")
+                self.failed += 1
+                BROADCAST_MESSAGES.inc(result="rejected")
+                self._results.append(('failed', str(e)[:200], self.job_id, chat_id))
+            except Exception as e:
+                broadcast_logger.error(f"Unexpected error sending broadcast to {chat_id}: {e}")
+                self.failed += 1
+                BROADCAST_MESSAGES.inc(result="error")
+                self._results.append(('failed', str(e)[:200], self.job_id, chat_id))
+
+            if len(self._results) >= BROADCAST_CHECKPOINT_SIZE:
+                await self._checkpoint()
+
+    def _send(self, chat_id: int) -> Awaitable:
+        if self.source:
+            from_chat_id, message_id = self.source
+            return self.bot.copy_message(chat_id=chat_id, from_chat_id=from_chat_id, message_id=message_id)
+        return self.bot.send_message(chat_id=chat_id, text=self.text)
+
+    async def _checkpoint(self):
+        results, self._results = self._results, []
+        if not results:
+            return
+        try:
+            await async_db.write_many(CHECKPOINT_RECIPIENT_SQL, results)
+        except Exception as e:
+            broadcast_logger.error(f"Could not checkpoint broadcast job {self.job_id}: {e}")
+
+    async def _report_progress(self):
+        while True:
+            await asyncio.sleep(BROADCAST_PROGRESS_INTERVAL_SECONDS)
+            await self._checkpoint()
+            header = (f"⏸ Broadcast paused ({self.total} managed users)" if self.paused
+                      else f"📣 Broadcasting to {self.total} managed users...")
+            await self._edit_progress(
+                f"{header}\n"
+                f"- Sent: {self.sent}\n- Failed: {self.failed}\n"
+                f"- Pending: {self.total - self.sent - self.failed}"
+            )
+
+    async def _edit_progress(self, text: str):
+        if not self.progress_message_id:
+            return
+        try:
+            await send_with_retry(
+                self.progress_chat_id,
+                lambda: self.bot.edit_message_text(text, chat_id=self.progress_chat_id, message_id=self.progress_message_id)
+            )
+        except BadRequest as e:
+            if "not modified" not in str(e).lower():
+                broadcast_logger.warning(f"Could not update broadcast progress: {e}")
+        except Exception as e:
+            broadcast_logger.warning(f"Could not update broadcast progress: {e}")
+
+def start_broadcast_job(application: Application, job_id: int, text: str,
+                        progress_chat_id: Optional[int], progress_message_id: Optional[int],
+                        source: Optional[Tuple[int, int]] = None) -> Broadcast:
+    """Runs a persisted job as a background task of the application."""
+    broadcast = Broadcast(application.bot, job_id, text, progress_chat_id, progress_message_id, source)
+    active_broadcasts[job_id] = broadcast
+    application.create_task(broadcast.run())
+    return broadcast
+
+async def resume_broadcast_jobs(context: ContextTypes.DEFAULT_TYPE):
+    """Startup job: restarts broadcasts that were still running when the bot stopped."""
+    jobs = await db_read(
+        """SELECT id, text, progress_chat_id, progress_message_id, source_chat_id, source_message_id
+           FROM broadcast_jobs WHERE status = 'running'"""
+    )
+    for job_id, text, progress_chat_id, progress_message_id, source_chat_id, source_message_id in jobs:
+        if job_id not in active_broadcasts:
+            logger.info(f"Resuming broadcast job {job_id}")
+            source = (source_chat_id, source_message_id) if source_message_id else None
+            start_broadcast_job(context.application, job_id, text, progress_chat_id, progress_message_id, source)
+
+# --- BOT API LOOKUP CACHE ---
+# One approval used to call get_chat for the same user at every conversation step. Chat
+# and membership lookups are cached with a TTL; "not found" style errors are cached for a
+# shorter time, and concurrent lookups of the same key share one in-flight request.
+
+CHAT_CACHE_TTL_SECONDS = 900
+CHAT_MEMBER_CACHE_TTL_SECONDS = 120
+NEGATIVE_CACHE_TTL_SECONDS = 60
+API_CACHE_SIZE = 5000
+
+class _CachedError:
+    """Wraps a permanent lookup error so it can be cached and re-raised."""
+    __slots__ = ("error",)
+
+    def __init__(self, error: Exception):
+        self.error = error
+
+class AsyncLookupCache:
+    """TTL cache for Bot API lookups with negative caching and request coalescing."""
+
+    def __init__(self, maxsize: int, ttl: float, negative_ttl: float = NEGATIVE_CACHE_TTL_SECONDS):
+        self.negative_ttl = negative_ttl
+        self.coalesced = 0
+        self._cache = LRUCache(maxsize, ttl)
+        self._in_flight: dict = {}
+
+    async def get(self, key, fetch: Callable[[], Awaitable[T]]) -> T:
+        while True:
+            value = self._cache.get(key)
+            if value is not _MISSING:
+                if isinstance(value, _CachedError):
+                    raise value.error
+                return value
+
+            pending = self._in_flight.get(key)
+            if pending is None:
+                break
+            self.coalesced += 1
+            try:
+                return await asyncio.shield(pending)
+            except asyncio.CancelledError:
+                # The leading caller was cancelled, not this one: look it up again.
+                if not pending.cancelled():
+                    raise
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        version = self._cache.version
+        try:
+            value = await fetch()
+        except (BadRequest, Forbidden) as e:
+            # Unknown chat, user not in chat, bot blocked: asking again soon won't help.
+            self._cache.fill(key, _CachedError(e), version, ttl=self.negative_ttl)
+            future.set_exception(e)
+            future.exception()  # mark as retrieved when nobody else was waiting
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            future.exception()
+            raise
+        else:
+            self._cache.fill(key, value, version)
+            future.set_result(value)
+            return value
+        finally:
+            if not future.done():
+                # Cancelled mid-fetch: release the callers coalesced onto this lookup.
+                future.cancel()
+            del self._in_flight[key]
+
+    def put(self, key, value):
+        self._cache.put(key, value)
+
+    def invalidate(self, key):
+        self._cache.invalidate(key)
+
+    def stats(self) -> dict:
+        return dict(self._cache.stats(), coalesced=self.coalesced)
+
+chat_cache = AsyncLookupCache(API_CACHE_SIZE, CHAT_CACHE_TTL_SECONDS)
+chat_member_cache = AsyncLookupCache(API_CACHE_SIZE, CHAT_MEMBER_CACHE_TTL_SECONDS)
+
+async def cached_get_chat(bot, chat_id):
+    """bot.get_chat through the shared cache; `chat_id` may be an id or an @username."""
+    key = chat_id.lower() if isinstance(chat_id, str) else chat_id
+    return await chat_cache.get(key, lambda: bot.get_chat(chat_id))
+
+async def cached_get_chat_member(bot, chat_id: int, user_id: int, rate_limited: bool = False):
+    """bot.get_chat_member through the shared cache.
+
+    Bulk callers pass `rate_limited=True` so cache misses go through send_with_retry.
+    """
+    if rate_limited:
+        fetch = lambda: send_with_retry(user_id, lambda: bot.get_chat_member(chat_id, user_id), pace_chat=False)
+    else:
+        fetch = lambda: bot.get_chat_member(chat_id, user_id)
+    return await chat_member_cache.get((chat_id, user_id), fetch)
+
+# --- CHANNEL MEMBER ROSTER ---
+# The Bot API cannot list or search channel members, so the bot keeps its own roster,
+# fed by the ChatMemberUpdated events track_chats receives, the subscriber table and
+# successful API lookups. Names are normalized and indexed by trigram, which makes a
+# first-name search a few indexed lookups instead of an API round trip.
+
+ABSENT_MEMBER_STATUSES = ("left", "kicked", "banned")
+
+def normalize_search_text(text: Optional[str]) -> str:
+    """Case-folds, strips accents and punctuation, and collapses whitespace."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).casefold()
+    return " ".join(re.findall(r"\w+", text))
+
+def name_trigrams(normalized: str) -> set:
+    """Trigrams of every word padded with spaces, so 2-letter words and prefixes match too."""
+    grams = set()
+    for word in normalized.split():
+        padded = f" {word} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+def upsert_roster_member(conn: sqlite3.Connection, user_id: int, first_name: Optional[str], last_name: Optional[str],
+                         username: Optional[str], status: str, only_if_new: bool = False):
+    """Records a user's latest name, username and membership status, reindexing the name."""
+    if only_if_new and conn.execute("SELECT 1 FROM channel_members WHERE user_id = ?", (user_id,)).fetchone():
+        return
+    username = (username or "").lstrip("@")
+    if username in ("", "N/A"):
+        username = None
+    search_name = normalize_search_text(f"{first_name or ''} {last_name or ''}")
+    conn.execute(
+        """INSERT OR REPLACE INTO channel_members
+           (user_id, first_name, last_name, username, search_name, search_username, status, updated_at)
+           VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+        (user_id, first_name, last_name, username, search_name,
+         username.casefold() if username else None, status, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    )
+    conn.execute("DELETE FROM channel_member_trigrams WHERE user_id = ?", (user_id,))
+    conn.executemany(
+        "INSERT INTO channel_member_trigrams (trigram, user_id) VALUES (?, ?)",
+        ((gram, user_id) for gram in name_trigrams(search_name))
+    )
+
+async def record_roster_member(user: User, status: str):
+    """Async wrapper around upsert_roster_member for a telegram User."""
+    await async_db.run_write(
+        lambda conn: upsert_roster_member(conn, user.id, user.first_name, user.last_name, user.username, status)
+    )
+
+ROSTER_COLUMNS = "user_id, first_name, last_name, username, status"
+ROSTER_BY_USERNAME_SQL = f"SELECT {ROSTER_COLUMNS} FROM channel_members WHERE search_username = ?"
+
+def roster_trigram_sql(count: int) -> str:
+    """Roster rows whose name contains all `count` trigrams bound as parameters, plus that count."""
+    placeholders = ",".join("?" * count)
+    return f"""SELECT {ROSTER_COLUMNS}, search_name FROM channel_members
+               WHERE user_id IN (
+                   SELECT user_id FROM channel_member_trigrams WHERE trigram IN ({placeholders})
+                   GROUP BY user_id HAVING COUNT(*) = ?
+               )
+               ORDER BY updated_at DESC"""
+
+async def find_roster_candidates(first_name: Optional[str], username: Optional[str]) -> List[tuple]:
+    """Roster rows matching the username, or containing `first_name` as a whole word."""
+    if username:
+        rows = await db_read(ROSTER_BY_USERNAME_SQL, (username.lstrip("@").casefold(),))
+        if rows:
+            return rows
+
+    query = normalize_search_text(first_name)
+    grams = name_trigrams(query)
+    if not grams:
+        return []
+    rows = await db_read(roster_trigram_sql(len(grams)), (*grams, len(grams)))
+    # Trigrams only narrow the candidates down; confirm the whole-word match.
+    pattern = re.compile(r"\b" + re.escape(query) + r"\b")
+    return [row[:5] for row in rows if pattern.search(row[5])]
+
+async def search_roster(bot, first_name: Optional[str], username: Optional[str]) -> Optional[dict]:
+    """Finds a current channel member in the local roster.
+
+    Members whose status came from a membership event are returned directly; rows with
+    an unknown or stale status are confirmed with a (cached) get_chat_member call.
+    """
+    for user_id, roster_first, roster_last, roster_username, status in await find_roster_candidates(first_name, username):
+        if status in ABSENT_MEMBER_STATUSES:
+            continue
+        if status == 'unknown':
+            try:
+                member = await cached_get_chat_member(bot, CHANNEL_ID, user_id)
+            except TelegramError as e:
+                logger.info(f"Roster candidate {user_id} could not be verified: {e}")
+                continue
+            await record_roster_member(member.user, member.status)
+            if member.status in ABSENT_MEMBER_STATUSES:
+                continue
+        full_name = safe_text(" ".join(part for part in (roster_first, roster_last) if part) or "Unknown User")
+        return {
+            'user_id': user_id,
+            'full_name': full_name,
+            'username': safe_username(roster_username)
+        }
+    return None
 
 # --- Conversation States ---
 (SELECT_PLAN, CUSTOM_DAYS, GET_PAYMENT, GET_BROADCAST_MESSAGE, ADD_OFFLINE_USER_IDENTIFIER, GET_FIRST_NAME, GET_USERNAME) = range(7)
@@ -195,16 +1874,15 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     """Allows a subscriber to check their own subscription status."""
     try:
         user_id = update.effective_user.id
-        user_data = db_query("SELECT * FROM subscribers WHERE user_id = ?", (user_id,))
+        user = await get_subscriber(user_id)
 
-        if not user_data:
+        if not user:
             await update.message.reply_text("You are not currently subscribed or you are an offline record.")
             return
 
-        user = user_data[0]
         plan_days = "Lifetime" if user[3] == -1 else f"{user[3]} Days"
         remaining_days = "Infinite" if user[4] == -1 else str(user[4])
-        no_post_days = safe_json_loads(user[8])
+        no_post_days, no_post_total = await fetch_no_post_days('managed', user_id)
 
         message = (
             f"✨ Your Subscription Status ✨\n\n"
@@ -215,10 +1893,10 @@ async def status_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
 
         if no_post_days:
             message += "\nYour subscription was extended on these dates (no content posted):\n"
-            for day in no_post_days[-5:]:  # Show only last 5 dates
+            for day in no_post_days:  # Only the last 5 dates are fetched
                 message += f"- {day}\n"
-            if len(no_post_days) > 5:
-                message += f"... and {len(no_post_days) - 5} more dates\n"
+            if no_post_total > 5:
+                message += f"... and {no_post_total - 5} more dates\n"
 
         await update.message.reply_text(message, parse_mode='HTML')
 
@@ -252,6 +1930,7 @@ async def dashboard_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
             [InlineKeyboardButton("📊 View Stats", callback_data="stats")],
             [InlineKeyboardButton("⏳ View Expiring Soon", callback_data="expiring_soon")],
             [InlineKeyboardButton("🗣️ Broadcast Message", callback_data="broadcast")],
+            [InlineKeyboardButton("📬 Broadcast Jobs", callback_data="broadcast_jobs")],
             [InlineKeyboardButton("🔍 Check a User/Record", callback_data="check_user")],
             [InlineKeyboardButton("➕ Add Manual Entry", callback_data="add_manual_prompt")],
         ]
@@ -274,6 +1953,136 @@ async def dashboard_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
     except Exception as e:
         logger.error(f"Dashboard command error: {e}")
 
+async def cache_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Shows the hit rates of the in-process caches."""
+    try:
+        if update.effective_user.id != ADMIN_ID:
+            return
+
+        message = "🗄️ <b>Cache Statistics</b>\n"
+        caches = (
+            ("Subscribers", subscriber_cache),
+            ("Bot API: get_chat", chat_cache),
+            ("Bot API: get_chat_member", chat_member_cache),
+        )
+        for name, cache in caches:
+            stats = cache.stats()
+            message += (
+                f"\n<b>{name}</b>\n"
+                f"- Hit rate: {stats['hit_rate']:.1%} ({stats['hits']} hits, {stats['misses']} misses)\n"
+                f"- Entries: {stats['size']}\n"
+            )
+            if 'coalesced' in stats:
+                message += f"- Coalesced requests: {stats['coalesced']}\n"
+
+        await update.message.reply_text(message, parse_mode='HTML')
+    except Exception as e:
+        logger.error(f"Cache stats command error: {e}")
+
+DB_STATS_SHOWN = 10
+
+async def db_stats_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Shows the statements with the most total execution time. `/dbstats reset` clears the figures."""
+    try:
+        if update.effective_user.id != ADMIN_ID:
+            return
+
+        if context.args and context.args[0].lower() == "reset":
+            query_stats.reset()
+            await update.message.reply_text("Query statistics have been reset.")
+            return
+
+        top = query_stats.top(DB_STATS_SHOWN)
+        if not top:
+            await update.message.reply_text("No queries recorded yet.")
+            return
+
+        message = f"🐢 <b>Top {len(top)} Queries by Total Time</b>\n"
+        message += f"<i>Slow-query threshold: {SLOW_QUERY_THRESHOLD_MS} ms</i>\n"
+        for rank, (fingerprint, calls, total, worst) in enumerate(top, 1):
+            message += (
+                f"\n<b>{rank}.</b> <code>{html.escape(fingerprint[:160])}</code>\n"
+                f"- {calls} calls, {total * 1000:.1f} ms total, "
+                f"{total / calls * 1000:.2f} ms avg, {worst * 1000:.1f} ms max\n"
+            )
+
+        await update.message.reply_text(message, parse_mode='HTML')
+    except Exception as e:
+        logger.error(f"DB stats command error: {e}")
+
+REMOVAL_FAILURES_SHOWN = 5
+
+async def removals_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Shows the channel removal queue by state and the most recent failures."""
+    try:
+        if update.effective_user.id != ADMIN_ID:
+            return
+
+        counts = dict(await db_read("SELECT state, COUNT(*) FROM removal_queue GROUP BY state"))
+        failures = await db_read(
+            "SELECT user_id, last_error FROM removal_queue WHERE state = 'failed' "
+            "ORDER BY next_attempt_at DESC LIMIT ?",
+            (REMOVAL_FAILURES_SHOWN,)
+        )
+        message = (
+            f"🚪 <b>Channel Removal Queue</b>\n"
+            f"<i>Automatic removal is {'on' if AUTO_REMOVE_EXPIRED else 'off'}.</i>\n\n"
+            f"⏳ Pending: {counts.get('pending', 0) + counts.get('banned', 0)}\n"
+            f"✅ Removed: {counts.get('done', 0)}\n"
+            f"↩️ Cancelled (renewed): {counts.get('cancelled', 0)}\n"
+            f"❌ Failed: {counts.get('failed', 0)}\n"
+        )
+        if failures:
+            message += "\n<b>Recent failures:</b>\n"
+            for user_id, error in failures:
+                message += f"- <code>{user_id}</code>: {safe_text(error, 80)}\n"
+        await update.message.reply_text(message, parse_mode='HTML')
+    except Exception as e:
+        logger.error(f"Removals command error: {e}")
+
+async def audit_balances_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Recomputes every balance from the ledgers. `/auditbalances repair` also fixes the mismatches."""
+    try:
+        if update.effective_user.id != ADMIN_ID:
+            return
+
+        repair = bool(context.args) and context.args[0].lower() == "repair"
+        if repair:
+            mismatches = await async_db.run_write(lambda conn: audit_balances(conn, repair=True))
+            subscriber_cache.clear()
+            stats_snapshot.invalidate()
+        else:
+            mismatches = await async_db.run_read(audit_balances)
+
+        posting_days = await db_read(f"SELECT {CURRENT_POSTING_SEQ_SQL}")
+        message = (
+            f"🧮 <b>Balance Audit</b>\n\n"
+            f"Posting days recorded: {posting_days[0][0] if posting_days else 'N/A'}\n"
+            f"Managed rows out of line: {mismatches['managed']}\n"
+            f"Offline rows out of line: {mismatches['offline']}\n"
+        )
+        if repair and any(mismatches.values()):
+            message += "\n✅ Repaired from the ledgers."
+        elif any(mismatches.values()):
+            message += "\nRun <code>/auditbalances repair</code> to rewrite them from the ledgers."
+        await update.message.reply_text(message, parse_mode='HTML')
+    except Exception as e:
+        logger.error(f"Audit balances command error: {e}")
+
+async def reconcile_command(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Starts a membership reconciliation now; the report follows when it finishes."""
+    try:
+        if update.effective_user.id != ADMIN_ID:
+            return
+
+        if reconcile_lock.locked():
+            await update.message.reply_text("A reconciliation is already running.")
+            return
+        context.job_queue.run_once(reconcile_memberships, when=0, data={'always_report': True})
+        await update.message.reply_text("🔄 Reconciliation started. The report will follow when it finishes.")
+    except Exception as e:
+        logger.error(f"Reconcile command error: {e}")
+
 # --- CORE WORKFLOWS & CONVERSATIONS ---
 
 async def handle_first_name_input(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -395,27 +2204,40 @@ async def process_manual_user_detection(update: Update, context: ContextTypes.DE
 async def search_channel_member(context: ContextTypes.DEFAULT_TYPE, first_name: str, username: str = None) -> Optional[dict]:
     """
     Searches for a channel member.
-    NOTE: The most reliable method is searching by a public @username.
-    Searching by first_name is limited and may only find channel administrators.
+    The local roster is tried first (by username, then by first name). The Bot API is
+    only a fallback: it can resolve a public @username, but by first_name it can only
+    find channel administrators. `first_name` may be the HTML-escaped display value.
     """
     try:
-        logger.info(f"Searching for channel member - Name: {first_name}, Username: {username}")
+        search_logger.info(f"Searching for channel member - Name: {first_name}, Username: {username}")
+        # Match against the name as typed, not its escaped form ("O&#x27;Neil").
+        first_name = html.unescape(first_name or "")
+
+        # Method 0: Local roster (no API calls for members seen via membership events)
+        try:
+            found = await search_roster(context.bot, first_name, username)
+            if found:
+                search_logger.info(f"SUCCESS: Found {found['full_name']} ({found['user_id']}) in the local roster.")
+                return found
+        except Exception as e:
+            search_logger.error(f"Error searching the local roster: {e}")
 
         # Method 1: Search by username (most reliable)
         if username:
             try:
-                logger.info(f"Attempting to resolve username: @{username}")
-                user_info = await context.bot.get_chat(f"@{username}")
+                search_logger.info(f"Attempting to resolve username: @{username}")
+                user_info = await cached_get_chat(context.bot, f"@{username}")
 
                 if user_info.type != "private":
-                    logger.warning(f"Resolved @{username}, but it is not a user (type: {user_info.type})")
+                    search_logger.warning(f"Resolved @{username}, but it is not a user (type: {user_info.type})")
                 else:
                     try:
-                        logger.info(f"Checking membership for user ID: {user_info.id} in channel {CHANNEL_ID}")
-                        member = await context.bot.get_chat_member(CHANNEL_ID, user_info.id)
+                        search_logger.info(f"Checking membership for user ID: {user_info.id} in channel {CHANNEL_ID}")
+                        member = await cached_get_chat_member(context.bot, CHANNEL_ID, user_info.id)
 
-                        if member.status not in ["left", "kicked", "banned"]:
-                            logger.info(f"SUCCESS: Found user @{username} in channel.")
+                        await record_roster_member(member.user, member.status)
+                        if member.status not in ABSENT_MEMBER_STATUSES:
+                            search_logger.info(f"SUCCESS: Found user @{username} in channel.")
                             full_name, username_formatted = format_user_info(user_info)
                             return {
                                 'user_id': user_info.id,
@@ -423,25 +2245,25 @@ async def search_channel_member(context: ContextTypes.DEFAULT_TYPE, first_name:
                                 'username': username_formatted
                             }
                         else:
-                             logger.info(f"User @{username} (ID: {user_info.id}) exists but has status '{member.status}' in the channel.")
+                             search_logger.info(f"User @{username} (ID: {user_info.id}) exists but has status '{member.status}' in the channel.")
                     except BadRequest as e:
                         if "user not found" in str(e).lower():
-                            logger.info(f"User @{username} (ID: {user_info.id}) is not a member of the channel.")
+                            search_logger.info(f"User @{username} (ID: {user_info.id}) is not a member of the channel.")
                         else:
-                            logger.error(f"BadRequest when checking membership for {user_info.id}: {e}")
+                            search_logger.error(f"BadRequest when checking membership for {user_info.id}: {e}")
                     except Exception as e:
-                        logger.error(f"Error checking channel membership for {user_info.id}: {e}")
+                        search_logger.error(f"Error checking channel membership for {user_info.id}: {e}")
 
             except BadRequest as e:
                 if "user not found" in str(e).lower():
-                     logger.warning(f"Could not resolve username @{username}. User may not exist or has privacy settings.")
+                     search_logger.warning(f"Could not resolve username @{username}. User may not exist or has privacy settings.")
                 else:
-                    logger.error(f"BadRequest when resolving @{username}: {e}")
+                    search_logger.error(f"BadRequest when resolving @{username}: {e}")
             except Exception as e:
-                logger.error(f"Unexpected error resolving username @{username}: {e}")
+                search_logger.error(f"Unexpected error resolving username @{username}: {e}")
 
         # Method 2: Fallback search in channel administrators (by name)
-        logger.info("Username search failed or not provided. Falling back to searching administrators by name.")
+        search_logger.info("Username search failed or not provided. Falling back to searching administrators by name.")
         try:
             admins = await context.bot.get_chat_administrators(CHANNEL_ID)
             for admin in admins:
@@ -450,7 +2272,7 @@ async def search_channel_member(context: ContextTypes.DEFAULT_TYPE, first_name:
                     continue
 
                 if user.first_name and re.search(r'\b' + re.escape(first_name) + r'\b', user.first_name, re.IGNORECASE):
-                    logger.info(f"SUCCESS: Found matching administrator by name: {user.full_name}")
+                    search_logger.info(f"SUCCESS: Found matching administrator by name: {user.full_name}")
                     full_name, username_formatted = format_user_info(user)
                     return {
                         'user_id': user.id,
@@ -458,13 +2280,13 @@ async def search_channel_member(context: ContextTypes.DEFAULT_TYPE, first_name:
                         'username': username_formatted
                     }
         except Exception as e:
-            logger.error(f"Error getting or searching channel administrators: {e}")
+            search_logger.error(f"Error getting or searching channel administrators: {e}")
 
-        logger.warning(f"User not found using any method - Name: {first_name}, Username: {username}")
+        search_logger.warning(f"User not found using any method - Name: {first_name}, Username: {username}")
         return None
 
     except Exception as e:
-        logger.error(f"General error in search_channel_member: {e}")
+        search_logger.error(f"General error in search_channel_member: {e}")
         return None
 
 def create_user_plan_keyboard():
@@ -513,18 +2335,21 @@ def extract_status(chat_member_update: ChatMemberUpdated) -> Tuple[Optional[bool
         )
         return old_is_member, new_is_member
     except Exception as e:
-        logger.error(f"Extract status error: {e}")
+        search_logger.error(f"Extract status error: {e}")
         return None, None
 
 async def track_chats(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Tracks new members joining the channel."""
+    """Tracks new members joining the channel and keeps the member roster current."""
     try:
-        was_member, is_member = extract_status(update.chat_member)
-        if was_member is None:
-            return
+        new_member = update.chat_member.new_chat_member
+        user = new_member.user
+        chat_member_cache.put((update.chat_member.chat.id, user.id), new_member)
+        chat_cache.invalidate(user.id)
+        in_roster = update.chat_member.chat.id == CHANNEL_ID and not user.is_bot
 
-        user = update.chat_member.new_chat_member.user
-        if not was_member and is_member:
+        was_member, is_member = extract_status(update.chat_member)
+        alert = None
+        if was_member is not None and not was_member and is_member:
             full_name, username = format_user_info(user)
             logger.info(f"{full_name} ({user.id}) joined the channel.")
 
@@ -532,20 +2357,37 @@ async def track_chats(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 [InlineKeyboardButton(f"✅ Approve {full_name[:20]}", callback_data=f"approve:{user.id}")],
                 [InlineKeyboardButton("🔍 Check User Info", callback_data=f"info:{user.id}")],
             ]
-            reply_markup = InlineKeyboardMarkup(keyboard)
-
-            await context.bot.send_message(
-                chat_id=ADMIN_ID,
-                text=(
-                    f"🚨 <b>New Member Alert</b> 🚨\n\n"
-                    f"<b>Name:</b> {full_name}\n"
-                    f"<b>Username:</b> {username}\n"
-                    f"<b>User ID:</b> <code>{user.id}</code>\n\n"
-                    f"This user will be actively managed by the bot."
-                ),
-                reply_markup=reply_markup,
-                parse_mode='HTML'
+            alert = outbox_message(
+                ADMIN_ID,
+                f"🚨 <b>New Member Alert</b> 🚨\n\n"
+                f"<b>Name:</b> {full_name}\n"
+                f"<b>Username:</b> {username}\n"
+                f"<b>User ID:</b> <code>{user.id}</code>\n\n"
+                f"This user will be actively managed by the bot.",
+                OUTBOX_PRIORITY_ADMIN,
+                dedup_key=f"join:{update.update_id}",
+                parse_mode='HTML',
+                reply_markup=InlineKeyboardMarkup(keyboard)
             )
+        if not (in_roster or alert):
+            return
+
+        def record(conn: sqlite3.Connection) -> bool:
+            resumed = False
+            if in_roster:
+                upsert_roster_member(conn, user.id, user.first_name, user.last_name, user.username, new_member.status)
+            if alert:
+                # Deactivated by the reconciliation job while away: pick up where they left off.
+                resumed = conn.execute(RESUME_SUBSCRIPTION_SQL, (user.id,)).rowcount > 0
+                enqueue_messages(conn, [alert])
+            return resumed
+
+        if await async_db.run_write(record):
+            subscriber_cache.invalidate(user.id)
+            stats_snapshot.invalidate()
+            logger.info(f"Subscription of {user.id} resumed on rejoining.")
+        if alert:
+            wake_outbox(context)
     except Exception as e:
         logger.error(f"Track chats error: {e}")
 
@@ -572,7 +2414,7 @@ async def plan_selection_prompt(update: Update, context: ContextTypes.DEFAULT_TY
         context.user_data['user_to_add'] = user_id
 
         try:
-            user_info = await context.bot.get_chat(user_id)
+            user_info = await cached_get_chat(context.bot, user_id)
             full_name, username = format_user_info(user_info)
         except Exception as e:
             logger.error(f"Could not get user info for {user_id}: {e}")
@@ -608,7 +2450,7 @@ async def select_plan_callback(update: Update, context: ContextTypes.DEFAULT_TYP
         plan_text = "Lifetime" if plan_days == -1 else f"{plan_days} days"
 
         try:
-            user_info = await context.bot.get_chat(user_id)
+            user_info = await cached_get_chat(context.bot, user_id)
             full_name, _ = format_user_info(user_info)
         except:
             full_name = f"User {user_id}"
@@ -632,7 +2474,7 @@ async def select_custom_plan_callback(update: Update, context: ContextTypes.DEFA
 
         user_id = context.user_data.get('user_to_add')
         try:
-            user_info = await context.bot.get_chat(user_id)
+            user_info = await cached_get_chat(context.bot, user_id)
             full_name, _ = format_user_info(user_info)
         except:
             full_name = f"User {user_id}"
@@ -686,15 +2528,10 @@ async def handle_new_user_payment(update: Update, context: ContextTypes.DEFAULT_
         today = datetime.now().strftime("%Y-%m-%d")
 
         try:
-            user_info = await context.bot.get_chat(user_id)
+            user_info = await cached_get_chat(context.bot, user_id)
             full_name, username = format_user_info(user_info)
 
-            db_query(
-                """INSERT OR REPLACE INTO subscribers
-                   (user_id, username, first_name, plan_days, remaining_days, start_date, payment_info, is_active, no_post_days)
-                   VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?)""",
-                (user_id, username, full_name, plan_days, plan_days, today, payment_info, "[]")
-            )
+            await store_managed_subscriber(user_id, username, full_name, plan_days, today, payment_info)
 
             days_text = "Lifetime" if plan_days == -1 else f"{plan_days} days"
             await update.message.reply_text(
@@ -736,15 +2573,10 @@ async def handle_manual_payment_info(update: Update, context: ContextTypes.DEFAU
 
         if detected_as_active and user_id:
             try:
-                user_info = await context.bot.get_chat(user_id)
+                user_info = await cached_get_chat(context.bot, user_id)
                 full_name, username = format_user_info(user_info)
 
-                db_query(
-                    """INSERT OR REPLACE INTO subscribers
-                       (user_id, username, first_name, plan_days, remaining_days, start_date, payment_info, is_active, no_post_days)
-                       VALUES (?, ?, ?, ?, ?, ?, ?, 1, ?)""",
-                    (user_id, username, full_name, plan_days, plan_days, today, payment_info, "[]")
-                )
+                await store_managed_subscriber(user_id, username, full_name, plan_days, today, payment_info)
 
                 days_text = "Lifetime" if plan_days == -1 else f"{plan_days} days"
                 await update.message.reply_text(
@@ -761,12 +2593,13 @@ async def handle_manual_payment_info(update: Update, context: ContextTypes.DEFAU
                 await update.message.reply_text(f"An error occurred while adding the detected user: {str(e)}")
 
         elif offline_identifier:
-            db_query(
-                """INSERT INTO offline_subscribers
-                   (identifier, plan_days, remaining_days, start_date, payment_info, no_post_days)
-                   VALUES (?, ?, ?, ?, ?, ?)""",
-                (offline_identifier, plan_days, plan_days, today, payment_info, "[]")
+            await db_write(
+                f"""INSERT INTO offline_subscribers
+                    (identifier, plan_days, start_date, payment_info, start_seq, expiry_seq)
+                    VALUES (?, ?, ?, ?, {CURRENT_POSTING_SEQ_SQL}, {CURRENT_POSTING_SEQ_SQL} + ?)""",
+                (offline_identifier, plan_days, today, payment_info, plan_days)
             )
+            stats_snapshot.invalidate()
 
             days_text = "Lifetime" if plan_days == -1 else f"{plan_days} days"
             await update.message.reply_text(
@@ -789,6 +2622,85 @@ async def handle_manual_payment_info(update: Update, context: ContextTypes.DEFAU
         context.user_data.clear()
         return ConversationHandler.END
 
+# --- STATS SNAPSHOT ---
+# The dashboard figures come from one aggregate pass per table and are kept in memory.
+# Every path that changes subscriptions invalidates the snapshot, so the dashboard only
+# pays for a recount after something actually changed.
+
+EXPIRING_SOON_SHOWN = 10
+
+# "Expiring" means 1 to 3 posting days left; the range over expiry_seq is served by the
+# partial expiry indexes.
+EXPIRING_RANGE_SQL = f"expiry_seq BETWEEN {CURRENT_POSTING_SEQ_SQL} + 1 AND {CURRENT_POSTING_SEQ_SQL} + 3"
+MANAGED_EXPIRING_SQL = f"""
+    SELECT first_name, expiry_seq - {CURRENT_POSTING_SEQ_SQL} FROM subscribers
+    WHERE is_active = 1 AND plan_days != -1 AND {EXPIRING_RANGE_SQL} LIMIT ?
+"""
+OFFLINE_EXPIRING_SQL = f"""
+    SELECT identifier, expiry_seq - {CURRENT_POSTING_SEQ_SQL} FROM offline_subscribers
+    WHERE plan_days != -1 AND {EXPIRING_RANGE_SQL} LIMIT ?
+"""
+
+class StatsSnapshot:
+    """In-process cache of the admin dashboard statistics."""
+
+    def __init__(self):
+        self._data: Optional[dict] = None
+        self._generation = 0
+
+    def invalidate(self):
+        self._data = None
+        self._generation += 1
+
+    async def get(self) -> dict:
+        data = self._data
+        if data is None:
+            # An invalidate() during the refresh leaves _data unset; use what was computed.
+            data = await self.refresh()
+        return data
+
+    async def refresh(self) -> dict:
+        generation = self._generation
+        managed, offline, managed_expiring, offline_expiring = await asyncio.gather(
+            db_read(f"""
+                SELECT COUNT(*),
+                       COALESCE(SUM(is_active = 1), 0),
+                       COALESCE(SUM(is_active = 1 AND plan_days = -1), 0),
+                       COALESCE(SUM(is_active = 1 AND plan_days != -1 AND {EXPIRING_RANGE_SQL}), 0)
+                FROM subscribers
+            """),
+            db_read(f"""
+                SELECT COUNT(*),
+                       COALESCE(SUM(plan_days = -1), 0),
+                       COALESCE(SUM(plan_days != -1 AND {EXPIRING_RANGE_SQL}), 0)
+                FROM offline_subscribers
+            """),
+            db_read(MANAGED_EXPIRING_SQL, (EXPIRING_SOON_SHOWN,)),
+            db_read(OFFLINE_EXPIRING_SQL, (EXPIRING_SOON_SHOWN,)),
+        )
+        if not managed or not offline:
+            raise RuntimeError("Could not compute dashboard statistics")
+
+        managed_total, managed_active, managed_lifetime, managed_expiring_count = managed[0]
+        offline_total, offline_lifetime, offline_expiring_count = offline[0]
+        data = {
+            'listed_total': managed_total + offline_total,
+            'managed_active': managed_active,
+            'offline_active': offline_total,
+            'managed_lifetime': managed_lifetime,
+            'offline_lifetime': offline_lifetime,
+            'managed_expiring': managed_expiring_count,
+            'offline_expiring': offline_expiring_count,
+            'managed_expiring_sample': managed_expiring,
+            'offline_expiring_sample': offline_expiring,
+        }
+        # Don't publish figures that were invalidated while they were being computed.
+        if generation == self._generation:
+            self._data = data
+        return data
+
+stats_snapshot = StatsSnapshot()
+
 # --- DASHBOARD CALLBACK HANDLERS ---
 
 async def display_detailed_stats(update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -797,17 +2709,14 @@ async def display_detailed_stats(update: Update, context: ContextTypes.DEFAULT_T
         query = update.callback_query
         await query.answer()
 
-        managed_active = db_query("SELECT COUNT(*) FROM subscribers WHERE is_active = 1")[0][0]
-        offline_active = db_query("SELECT COUNT(*) FROM offline_subscribers")[0][0]
+        stats = await stats_snapshot.get()
+        managed_active, offline_active = stats['managed_active'], stats['offline_active']
         total_active = managed_active + offline_active
 
-        managed_lifetime = db_query("SELECT COUNT(*) FROM subscribers WHERE is_active = 1 AND plan_days = -1")[0][0]
-        offline_lifetime = db_query("SELECT COUNT(*) FROM offline_subscribers WHERE plan_days = -1")[0][0]
+        managed_lifetime, offline_lifetime = stats['managed_lifetime'], stats['offline_lifetime']
         total_lifetime = managed_lifetime + offline_lifetime
 
-        expiring_managed = db_query("SELECT COUNT(*) FROM subscribers WHERE remaining_days BETWEEN 1 AND 3 AND is_active = 1")[0][0]
-        expiring_offline = db_query("SELECT COUNT(*) FROM offline_subscribers WHERE remaining_days BETWEEN 1 AND 3")[0][0]
-        total_expiring = expiring_managed + expiring_offline
+        total_expiring = stats['managed_expiring'] + stats['offline_expiring']
 
         message = (
             f"📊 <b>Detailed Channel Stats</b>\n\n"
@@ -838,12 +2747,9 @@ async def dashboard_callbacks(update: Update, context: ContextTypes.DEFAULT_TYPE
         action = query.data
 
         if action == "expiring_soon":
-            managed_expiring = db_query(
-                "SELECT first_name, remaining_days FROM subscribers WHERE remaining_days BETWEEN 1 AND 3 AND is_active = 1"
-            )
-            offline_expiring = db_query(
-                "SELECT identifier, remaining_days FROM offline_subscribers WHERE remaining_days BETWEEN 1 AND 3"
-            )
+            stats = await stats_snapshot.get()
+            managed_expiring = stats['managed_expiring_sample']
+            offline_expiring = stats['offline_expiring_sample']
 
             message = "⏳ <b>Expiring Soon (3 days or less)</b>\n"
 
@@ -852,19 +2758,19 @@ async def dashboard_callbacks(update: Update, context: ContextTypes.DEFAULT_TYPE
 
             if managed_expiring:
                 message += "\n<b>Managed Members:</b>\n"
-                for user in managed_expiring[:10]:
+                for user in managed_expiring:
                     safe_name = safe_text(user[0], 30)
                     message += f"- {safe_name} - {user[1]} days left\n"
-                if len(managed_expiring) > 10:
-                    message += f"... and {len(managed_expiring) - 10} more\n"
+                if stats['managed_expiring'] > len(managed_expiring):
+                    message += f"... and {stats['managed_expiring'] - len(managed_expiring)} more\n"
 
             if offline_expiring:
                 message += "\n<b>Offline Records:</b>\n"
-                for rec in offline_expiring[:10]:
+                for rec in offline_expiring:
                     safe_identifier = safe_text(rec[0], 30)
                     message += f"- {safe_identifier} - {rec[1]} days left\n"
-                if len(offline_expiring) > 10:
-                    message += f"... and {len(offline_expiring) - 10} more\n"
+                if stats['offline_expiring'] > len(offline_expiring):
+                    message += f"... and {stats['offline_expiring'] - len(offline_expiring)} more\n"
 
             keyboard = [[InlineKeyboardButton("⬅️ Back to Dashboard", callback_data="back_to_dashboard")]]
             await query.edit_message_text(
@@ -887,7 +2793,9 @@ async def dashboard_conversation_starter(update: Update, context: ContextTypes.D
 
         if action == "broadcast":
             await query.edit_message_text(
-                "Please send the message you want to broadcast to all MANAGED subscribers."
+                "Please send the message you want to broadcast to all MANAGED subscribers.\n\n"
+                "Any message works (text, photo, video, document...); it is copied as is, formatting "
+                "included. Keep it until the broadcast has finished."
             )
             return GET_BROADCAST_MESSAGE
 
@@ -923,6 +2831,7 @@ async def back_to_dashboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
             [InlineKeyboardButton("📊 View Stats", callback_data="stats")],
             [InlineKeyboardButton("⏳ View Expiring Soon", callback_data="expiring_soon")],
             [InlineKeyboardButton("🗣️ Broadcast Message", callback_data="broadcast")],
+            [InlineKeyboardButton("📬 Broadcast Jobs", callback_data="broadcast_jobs")],
             [InlineKeyboardButton("🔍 Check a User/Record", callback_data="check_user")],
             [InlineKeyboardButton("➕ Add Manual Entry", callback_data="add_manual_prompt")],
         ]
@@ -937,30 +2846,24 @@ async def back_to_dashboard(update: Update, context: ContextTypes.DEFAULT_TYPE):
         logger.error(f"Back to dashboard error: {e}")
 
 async def handle_broadcast_message(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
-    """Sends the broadcast message to all managed users."""
+    """Creates a broadcast job for all managed users and starts it in the background."""
     try:
-        message_to_send = safe_text(update.message.text, 4000)
-        active_users = db_query("SELECT user_id FROM subscribers WHERE is_active = 1")
-
-        await update.message.reply_text(
-            f"Starting broadcast to {len(active_users)} managed users... This may take a moment."
+        message = update.message
+        source = (message.chat_id, message.message_id)
+        preview = describe_message(message)[:200]
+        job_id, recipients = await async_db.run_write(lambda conn: create_broadcast_job(conn, preview, source))
+
+        progress_message = await message.reply_text(
+            f"Starting broadcast to {recipients} managed users... "
+            f"This message will be updated with the progress."
         )
-
-        sent, failed = 0, 0
-        for user in active_users:
-            try:
-                await context.bot.send_message(chat_id=user[0], text=message_to_send)
-                sent += 1
-            except (Forbidden, BadRequest) as e:
-                logger.warning(f"Failed to send broadcast to {user[0]}: {e}")
-                failed += 1
-            except Exception as e:
-                logger.error(f"Unexpected error sending broadcast to {user[0]}: {e}")
-                failed += 1
-
-        await update.message.reply_text(
-            f"Broadcast complete.\n- Sent successfully: {sent}\n- Failed: {failed}"
+        await db_write(
+            "UPDATE broadcast_jobs SET progress_chat_id = ?, progress_message_id = ? WHERE id = ?",
+            (progress_message.chat_id, progress_message.message_id, job_id)
         )
+
+        start_broadcast_job(context.application, job_id, preview,
+                            progress_message.chat_id, progress_message.message_id, source)
         return ConversationHandler.END
 
     except Exception as e:
@@ -968,24 +2871,188 @@ async def handle_broadcast_message(update: Update, context: ContextTypes.DEFAULT
         await update.message.reply_text("Error processing broadcast message.")
         return ConversationHandler.END
 
+BROADCAST_JOBS_SHOWN = 5
+
+async def display_broadcast_jobs(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Lists the most recent broadcast jobs with delivery counts and controls."""
+    try:
+        query = update.callback_query
+        await query.answer()
+
+        jobs = await db_read(
+            "SELECT id, text, status, created_at FROM broadcast_jobs ORDER BY id DESC LIMIT ?",
+            (BROADCAST_JOBS_SHOWN,)
+        )
+
+        message = "📬 <b>Broadcast Jobs</b>\n"
+        keyboard = []
+        if not jobs:
+            message += "\nNo broadcasts yet."
+
+        for job_id, text, status, created_at in jobs:
+            counts = await fetch_broadcast_counts(job_id)
+            preview = safe_text(text, 30)
+            message += (
+                f"\n<b>#{job_id}</b> ({status}) - {created_at}\n"
+                f"<i>{preview}</i>\n"
+                f"✅ {counts['delivered']} delivered · ❌ {counts['failed']} failed · ⏳ {counts['pending']} pending\n"
+            )
+            if status == 'running':
+                keyboard.append([
+                    InlineKeyboardButton(f"⏸ Pause #{job_id}", callback_data=f"bjob:pause:{job_id}"),
+                    InlineKeyboardButton(f"✖️ Cancel #{job_id}", callback_data=f"bjob:cancel:{job_id}"),
+                ])
+            elif status == 'paused':
+                keyboard.append([
+                    InlineKeyboardButton(f"▶️ Resume #{job_id}", callback_data=f"bjob:resume:{job_id}"),
+                    InlineKeyboardButton(f"✖️ Cancel #{job_id}", callback_data=f"bjob:cancel:{job_id}"),
+                ])
+
+        keyboard.append([InlineKeyboardButton("🔄 Refresh", callback_data="broadcast_jobs")])
+        keyboard.append([InlineKeyboardButton("⬅️ Back to Dashboard", callback_data="back_to_dashboard")])
+        await query.edit_message_text(
+            message,
+            reply_markup=InlineKeyboardMarkup(keyboard),
+            parse_mode='HTML'
+        )
+    except BadRequest as e:
+        if "not modified" not in str(e).lower():
+            logger.error(f"Display broadcast jobs error: {e}")
+    except Exception as e:
+        logger.error(f"Display broadcast jobs error: {e}")
+        await query.edit_message_text("Error retrieving broadcast jobs.")
+
+async def broadcast_job_action(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handles the pause/resume/cancel buttons of the broadcast job list."""
+    try:
+        query = update.callback_query
+        _, action, job_id_str = query.data.split(':')
+        job_id = int(job_id_str)
+
+        job = await db_read(
+            """SELECT text, status, progress_chat_id, progress_message_id, source_chat_id, source_message_id
+               FROM broadcast_jobs WHERE id = ?""",
+            (job_id,)
+        )
+        if not job:
+            await query.answer("Broadcast job not found.", show_alert=True)
+            return
+        text, status, progress_chat_id, progress_message_id, source_chat_id, source_message_id = job[0]
+        broadcast = active_broadcasts.get(job_id)
+
+        if action == "pause" and status == 'running':
+            await db_write("UPDATE broadcast_jobs SET status = 'paused' WHERE id = ?", (job_id,))
+            if broadcast:
+                broadcast.pause()
+        elif action == "resume" and status == 'paused':
+            await db_write("UPDATE broadcast_jobs SET status = 'running' WHERE id = ?", (job_id,))
+            if broadcast:
+                broadcast.resume()
+            else:
+                source = (source_chat_id, source_message_id) if source_message_id else None
+                start_broadcast_job(context.application, job_id, text, progress_chat_id, progress_message_id, source)
+        elif action == "cancel" and status in ('running', 'paused'):
+            await db_write(
+                "UPDATE broadcast_jobs SET status = 'cancelled', finished_at = ? WHERE id = ?",
+                (datetime.now().strftime("%Y-%m-%d %H:%M:%S"), job_id)
+            )
+            if broadcast:
+                broadcast.cancel()
+        else:
+            await query.answer(f"Job #{job_id} is {status}.", show_alert=True)
+            return
+
+        logger.info(f"Broadcast job {job_id}: {action} requested by admin")
+        await display_broadcast_jobs(update, context)
+    except Exception as e:
+        logger.error(f"Broadcast job action error: {e}")
+        await query.edit_message_text("Error updating broadcast job.")
+
 # --- USER LIST FEATURE ---
 
 USERS_PER_PAGE = 8
 
-async def display_user_list(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int = 0):
+# The list is ordered by (kind, name, id): managed members by first_name, then offline
+# records by identifier. Pages are fetched by seeking past a cursor (the first or last
+# entry of the current page) instead of OFFSET, so every page costs the same.
+_USER_PAGE_QUERIES = {
+    # (direction, cursor kind) -> query; :name and :id describe the cursor entry.
+    ('next', None): """
+        SELECT * FROM (SELECT 'managed' AS kind, user_id AS entry_id, first_name AS name FROM subscribers
+                       ORDER BY first_name, user_id LIMIT :limit)
+        UNION ALL
+        SELECT * FROM (SELECT 'offline', id, identifier FROM offline_subscribers
+                       ORDER BY identifier, id LIMIT :limit)
+        ORDER BY kind, name, entry_id LIMIT :limit
+    """,
+    ('next', 'managed'): """
+        SELECT * FROM (SELECT 'managed' AS kind, user_id AS entry_id, first_name AS name FROM subscribers
+                       WHERE (first_name, user_id) > (:name, :id)
+                       ORDER BY first_name, user_id LIMIT :limit)
+        UNION ALL
+        SELECT * FROM (SELECT 'offline', id, identifier FROM offline_subscribers
+                       ORDER BY identifier, id LIMIT :limit)
+        ORDER BY kind, name, entry_id LIMIT :limit
+    """,
+    ('next', 'offline'): """
+        SELECT 'offline', id, identifier FROM offline_subscribers
+        WHERE (identifier, id) > (:name, :id)
+        ORDER BY identifier, id LIMIT :limit
+    """,
+    ('prev', 'managed'): """
+        SELECT 'managed', user_id, first_name FROM subscribers
+        WHERE (first_name, user_id) < (:name, :id)
+        ORDER BY first_name DESC, user_id DESC LIMIT :limit
+    """,
+    ('prev', 'offline'): """
+        SELECT * FROM (SELECT 'offline' AS kind, id AS entry_id, identifier AS name FROM offline_subscribers
+                       WHERE (identifier, id) < (:name, :id)
+                       ORDER BY identifier DESC, id DESC LIMIT :limit)
+        UNION ALL
+        SELECT * FROM (SELECT 'managed', user_id, first_name FROM subscribers
+                       ORDER BY first_name DESC, user_id DESC LIMIT :limit)
+        ORDER BY kind DESC, name DESC, entry_id DESC LIMIT :limit
+    """,
+}
+
+async def fetch_user_page(direction: str, cursor: Optional[Tuple[str, int]]) -> Tuple[List[tuple], bool]:
+    """Returns one page of (kind, id, name) entries and whether more exist in `direction`."""
+    params = {'limit': USERS_PER_PAGE + 1, 'name': None, 'id': None}
+    cursor_kind = None
+    if cursor:
+        cursor_kind, params['id'] = cursor
+        lookup = SUBSCRIBER_NAME_SQL if cursor_kind == 'managed' else OFFLINE_IDENTIFIER_SQL
+        rows = await db_read(lookup, (params['id'],))
+        if not rows:
+            return [], False
+        params['name'] = rows[0][0] or ""
+
+    rows = await db_read(_USER_PAGE_QUERIES[(direction, cursor_kind)], params)
+    has_more = len(rows) > USERS_PER_PAGE
+    rows = rows[:USERS_PER_PAGE]
+    if direction == 'prev':
+        rows.reverse()
+    return rows, has_more
+
+def _user_page_callback(direction: str, page: int, entry: tuple) -> str:
+    kind, entry_id, _ = entry
+    return f"user_page:{direction}:{page}:{kind[0]}:{entry_id}"
+
+async def display_user_list(update: Update, context: ContextTypes.DEFAULT_TYPE, page: int = 0,
+                            direction: str = 'next', cursor: Optional[Tuple[str, int]] = None):
     """Displays a paginated list of all users and records."""
     try:
         query = update.callback_query
         if query:
             await query.answer()
 
-        managed_users = db_query("SELECT user_id, first_name FROM subscribers ORDER BY first_name")
-        offline_users = db_query("SELECT id, identifier FROM offline_subscribers ORDER BY identifier")
-
-        all_users = [('managed', user_id, safe_text(name, 30)) for user_id, name in managed_users] + \
-                    [('offline', rec_id, safe_text(identifier, 30)) for rec_id, identifier in offline_users]
+        users_on_page, has_more = await fetch_user_page(direction, cursor)
+        if cursor and not users_on_page:
+            # The cursor entry is gone or the list shrank; start over from the first page.
+            page, direction, cursor = 0, 'next', None
+            users_on_page, has_more = await fetch_user_page(direction, cursor)
 
-        if not all_users:
+        if not users_on_page:
             keyboard = [[InlineKeyboardButton("⬅️ Back to Dashboard", callback_data="back_to_dashboard")]]
             message = "You have no subscribers or records yet."
             if query:
@@ -994,24 +3061,27 @@ async def display_user_list(update: Update, context: ContextTypes.DEFAULT_TYPE,
                 await update.message.reply_text(message, reply_markup=InlineKeyboardMarkup(keyboard))
             return
 
-        total_pages = ceil(len(all_users) / USERS_PER_PAGE)
-        start_index = page * USERS_PER_PAGE
-        end_index = start_index + USERS_PER_PAGE
-        users_on_page = all_users[start_index:end_index]
+        if direction == 'prev':
+            has_prev, has_next = has_more, True
+            page = max(page, 1) if has_prev else 0
+        else:
+            has_prev, has_next = page > 0, has_more
+        total_pages = max(page + 1 + int(has_next), ceil((await stats_snapshot.get())['listed_total'] / USERS_PER_PAGE))
 
         keyboard = []
         for user_type, user_id, name in users_on_page:
+            name = safe_text(name, 30)
             button_text = f"✅ {name}" if user_type == 'managed' else f"📝 {name}"
             keyboard.append([InlineKeyboardButton(button_text, callback_data=f"show_detail:{user_type}:{user_id}")])
 
         nav_row = []
-        if page > 0:
-            nav_row.append(InlineKeyboardButton("⬅️ Prev", callback_data=f"user_page:{page - 1}"))
+        if has_prev:
+            nav_row.append(InlineKeyboardButton("⬅️ Prev", callback_data=_user_page_callback('p', page - 1, users_on_page[0])))
 
         nav_row.append(InlineKeyboardButton(f"Page {page + 1}/{total_pages}", callback_data="noop"))
 
-        if page < total_pages - 1:
-            nav_row.append(InlineKeyboardButton("Next ➡️", callback_data=f"user_page:{page + 1}"))
+        if has_next:
+            nav_row.append(InlineKeyboardButton("Next ➡️", callback_data=_user_page_callback('n', page + 1, users_on_page[-1])))
 
         if nav_row:
             keyboard.append(nav_row)
@@ -1034,12 +3104,26 @@ async def display_user_list(update: Update, context: ContextTypes.DEFAULT_TYPE,
             await update.message.reply_text("Error displaying user list.")
 
 async def navigate_user_list_pages(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Handles the Prev/Next buttons for the user list."""
+    """Handles the Prev/Next buttons for the user list.
+
+    Callback data is `user_page:<n|p>:<page>:<m|o>:<id>`, where the kind and id identify
+    the last (next) or first (prev) entry of the page the button was on.
+    """
     try:
         query = update.callback_query
-        await query.answer()
-        page = int(query.data.split(':')[1])
-        await display_user_list(update, context, page=page)
+        parts = query.data.split(':')
+        if len(parts) != 5:
+            # Buttons from before keyset pagination; start from the first page.
+            await display_user_list(update, context)
+            return
+
+        _, direction, page, kind, entry_id = parts
+        await display_user_list(
+            update, context,
+            page=int(page),
+            direction='prev' if direction == 'p' else 'next',
+            cursor=('managed' if kind == 'm' else 'offline', int(entry_id))
+        )
     except Exception as e:
         logger.error(f"Navigate user list pages error: {e}")
         await query.edit_message_text("Error navigating pages.")
@@ -1059,15 +3143,14 @@ async def display_user_details(update: Update, context: ContextTypes.DEFAULT_TYP
         entry_id = int(entry_id_str)
 
         message = "Could not find the specified user or record."
-        no_post_days = []
+        no_post_days, no_post_total = [], 0
 
         if user_type == 'managed':
-            user_data = db_query("SELECT * FROM subscribers WHERE user_id = ?", (entry_id,))
-            if user_data:
-                user = user_data[0]
+            user = await get_subscriber(entry_id)
+            if user:
                 plan_days = "Lifetime" if user[3] == -1 else f"{user[3]} Days"
                 remaining_days = "Infinite" if user[4] == -1 else str(user[4])
-                no_post_days = safe_json_loads(user[8])
+                no_post_days, no_post_total = await fetch_no_post_days('managed', entry_id)
 
                 safe_name = safe_text(user[2], 50)
                 safe_username = safe_text(user[1], 50)
@@ -1085,12 +3168,12 @@ async def display_user_details(update: Update, context: ContextTypes.DEFAULT_TYP
                 )
 
         elif user_type == 'offline':
-            offline_data = db_query("SELECT * FROM offline_subscribers WHERE id = ?", (entry_id,))
+            offline_data = await db_read(OFFLINE_RECORD_BY_ID_SQL, (entry_id,))
             if offline_data:
                 rec = offline_data[0]
                 plan_days = "Lifetime" if rec[2] == -1 else f"{rec[2]} Days"
                 remaining_days = "Infinite" if rec[3] == -1 else str(rec[3])
-                no_post_days = safe_json_loads(rec[6])
+                no_post_days, no_post_total = await fetch_no_post_days('offline', entry_id)
 
                 safe_identifier = safe_text(rec[1], 50)
                 safe_payment = safe_text(rec[5], 100)
@@ -1106,11 +3189,10 @@ async def display_user_details(update: Update, context: ContextTypes.DEFAULT_TYP
 
         if no_post_days:
             message += "\n<b>Non-Posting Days:</b>\n"
-            display_days = no_post_days[-5:] if len(no_post_days) > 5 else no_post_days
-            for day in display_days:
+            for day in no_post_days:
                 message += f"- {day}\n"
-            if len(no_post_days) > 5:
-                message += f"... and {len(no_post_days) - 5} more dates\n"
+            if no_post_total > 5:
+                message += f"... and {no_post_total - 5} more dates\n"
 
         keyboard = [[InlineKeyboardButton("⬅️ Back to List", callback_data="check_user")]]
         await query.edit_message_text(
@@ -1242,7 +3324,7 @@ async def cancel_approval_handler(update: Update, context: ContextTypes.DEFAULT_
         user_id = context.user_data.get('user_to_add')
         if user_id:
             try:
-                user_info = await context.bot.get_chat(user_id)
+                user_info = await cached_get_chat(context.bot, user_id)
                 full_name, _ = format_user_info(user_info)
                 await query.edit_message_text(f"❌ Approval cancelled for {full_name}")
             except:
@@ -1270,103 +3352,692 @@ async def cancel_conversation(update: Update, context: ContextTypes.DEFAULT_TYPE
 
 # --- DAILY JOB & AUTOMATION ---
 
+# Balances are derived from the posting-day ledger (see POSTING-DAY LEDGER), so the job
+# only has to find the rows at a threshold; both lookups are range scans of the partial
+# expiry index. Running it twice, or skipping a night, leaves every balance intact.
+REMINDER_CANDIDATES_SQL = f"""
+    SELECT user_id, expiry_seq - {CURRENT_POSTING_SEQ_SQL} FROM subscribers
+    WHERE is_active = 1 AND plan_days != -1 AND {EXPIRING_RANGE_SQL}
+"""
+EXPIRED_SUBSCRIBERS_SQL = f"""
+    SELECT user_id, first_name FROM subscribers
+    WHERE is_active = 1 AND plan_days != -1 AND expiry_seq <= {CURRENT_POSTING_SEQ_SQL}
+"""
+DEACTIVATE_EXPIRED_SQL = f"""
+    UPDATE subscribers SET is_active = 0
+    WHERE is_active = 1 AND plan_days != -1 AND expiry_seq <= {CURRENT_POSTING_SEQ_SQL}
+"""
+
+def apply_daily_check(conn: sqlite3.Connection) -> Tuple[List[tuple], List[tuple]]:
+    """Finds the subscriptions at a threshold and deactivates the exhausted ones.
+
+    Must run inside a write transaction. Returns the reminder candidates as
+    (user_id, remaining_days) and the newly expired managed users as (user_id, first_name).
+    """
+    reminders = conn.execute(REMINDER_CANDIDATES_SQL).fetchall()
+    expired = conn.execute(EXPIRED_SUBSCRIBERS_SQL).fetchall()
+    conn.execute(DEACTIVATE_EXPIRED_SQL)
+
+    return reminders, expired
+
 async def daily_subscription_check(context: ContextTypes.DEFAULT_TYPE):
     """The daily job to update all subscriptions."""
+    started = perf_counter()
     try:
         logger.info("Running daily subscription check...")
-        today = datetime.now().strftime("%Y-%m-%d")
+        cached_ids = subscriber_cache.keys()
+
+        def run_check(conn: sqlite3.Connection):
+            reminders, expired = apply_daily_check(conn)
+            # Keyed on the posting day, so a second run on the same day doesn't remind twice.
+            seq = current_posting_seq(conn)
+            enqueue_messages(conn, (
+                outbox_message(
+                    user_id, f"👋 You have {remaining_days} days left on your subscription.",
+                    OUTBOX_PRIORITY_SUBSCRIBER, dedup_key=f"reminder:{user_id}:{seq}:{remaining_days}"
+                )
+                for user_id, remaining_days in reminders
+            ))
+            if expired:
+                digest_id = create_expiry_digest(conn, expired)
+                text, markup = expiry_digest_view(conn, digest_id, 0)
+                enqueue_message(conn, ADMIN_ID, text, OUTBOX_PRIORITY_ADMIN, dedup_key=f"digest:{digest_id}",
+                                parse_mode='HTML', reply_markup=markup)
+            if AUTO_REMOVE_EXPIRED and expired:
+                enqueue_removals(conn, [user_id for user_id, _ in expired])
+            prune_outbox(conn)
+            return reminders, expired, reload_subscribers(conn, cached_ids)
+
+        reminders, expired, refreshed = await async_db.run_write(run_check)
+        for user_id, row in refreshed.items():
+            subscriber_cache.put(user_id, row)
+        stats_snapshot.invalidate()
+        if reminders or expired:
+            wake_outbox(context)
+
+        if AUTO_REMOVE_EXPIRED and expired and context.job_queue:
+            context.job_queue.run_once(process_removal_queue, when=0)
+
+        # Warm the dashboard figures so the first look after the nightly run is instant.
+        await stats_snapshot.refresh()
+
+        logger.info(
+            f"Daily subscription check completed successfully "
+            f"({len(reminders)} reminders queued, {len(expired)} expired)."
+        )
 
-        last_post_result = db_query("SELECT last_post_date FROM admin_activity WHERE id = 1")
-        last_post_date = last_post_result[0][0] if last_post_result else None
-        admin_posted_today = last_post_date == today
+    except Exception as e:
+        logger.error(f"Daily subscription check failed: {e}")
+    finally:
+        DAILY_CHECK_DURATION.observe(perf_counter() - started)
 
-        # --- Process Managed Subscribers ---
-        managed_users = db_query(
-            "SELECT user_id, remaining_days, no_post_days FROM subscribers WHERE is_active = 1 AND plan_days != -1"
-        )
+async def admin_post_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Detects when the admin posts in the channel."""
+    try:
+        if update.effective_user.id == ADMIN_ID:
+            today = datetime.now().strftime("%Y-%m-%d")
+            recorded = await async_db.run_write(lambda conn: record_posting_day(conn, today))
+            if recorded:
+                # Every running balance just went down by one.
+                subscriber_cache.clear()
+                stats_snapshot.invalidate()
+                logger.info(f"Admin post detected; {today} recorded as a posting day.")
+    except Exception as e:
+        logger.error(f"Admin post handler error: {e}")
+
+# --- EXPIRY DIGEST ---
+# All expiries of one daily run go to the admin as a single message. The entries are
+# stored, so the message can be paged, names selected and extended in bulk; every bulk
+# action is one set-based write (see extend_subscriptions).
+
+EXPIRY_DIGEST_PAGE_SIZE = 8
+EXPIRY_DIGEST_EXTEND_DAYS = (7, 30)
+
+DIGEST_COUNTS_SQL = """
+    SELECT COUNT(*), COALESCE(SUM(selected), 0), COALESCE(SUM(extended_days > 0), 0)
+    FROM expiry_digest_entries WHERE digest_id = ?
+"""
+DIGEST_PAGE_SQL = """
+    SELECT position, user_id, first_name, selected, extended_days FROM expiry_digest_entries
+    WHERE digest_id = ? AND position >= ? ORDER BY position LIMIT ?
+"""
+
+def create_expiry_digest(conn: sqlite3.Connection, expired: List[tuple]) -> int:
+    """Stores the (user_id, first_name) pairs of one run as a digest; returns its id."""
+    digest_id = conn.execute(
+        "INSERT INTO expiry_digests (created_at) VALUES (?)", (datetime.now().strftime("%Y-%m-%d %H:%M"),)
+    ).lastrowid
+    ordered = sorted(expired, key=lambda row: ((row[1] or "").lower(), row[0]))
+    conn.executemany(
+        "INSERT INTO expiry_digest_entries (digest_id, position, user_id, first_name) VALUES (?, ?, ?, ?)",
+        ((digest_id, position, user_id, first_name) for position, (user_id, first_name) in enumerate(ordered))
+    )
+    return digest_id
+
+def extend_digest_entries(conn: sqlite3.Connection, digest_id: int, days: int, selected_only: bool) -> dict:
+    """Extends the not yet extended (and, optionally, selected) entries in one transaction.
+
+    Returns the refreshed subscriber rows of the extended users, keyed by user_id.
+    """
+    entries = "digest_id = :digest_id AND extended_days = 0" + (" AND selected = 1" if selected_only else "")
+    params = {'digest_id': digest_id}
+    user_ids = [row[0] for row in conn.execute(f"SELECT user_id FROM expiry_digest_entries WHERE {entries}", params)]
+    if not user_ids:
+        return {}
+    extend_subscriptions(conn, f"SELECT user_id FROM expiry_digest_entries WHERE {entries}", params, days)
+    conn.execute(f"UPDATE expiry_digest_entries SET extended_days = :days, selected = 0 WHERE {entries}",
+                 {**params, 'days': days})
+    return reload_subscribers(conn, user_ids)
+
+def expiry_digest_view(conn: sqlite3.Connection, digest_id: int, page: int) -> Tuple[str, InlineKeyboardMarkup]:
+    """The digest message and keyboard showing `page` (clamped to the available pages)."""
+    total, selected, extended = conn.execute(DIGEST_COUNTS_SQL, (digest_id,)).fetchone()
+    created = conn.execute("SELECT created_at FROM expiry_digests WHERE id = ?", (digest_id,)).fetchall()
+    pages = max(1, (total + EXPIRY_DIGEST_PAGE_SIZE - 1) // EXPIRY_DIGEST_PAGE_SIZE)
+    page = min(max(page, 0), pages - 1)
+    entries = conn.execute(
+        DIGEST_PAGE_SQL, (digest_id, page * EXPIRY_DIGEST_PAGE_SIZE, EXPIRY_DIGEST_PAGE_SIZE)
+    ).fetchall()
+
+    message = (
+        f"🔔 <b>Subscriptions Expired</b> 🔔\n"
+        f"<i>Daily check of {created[0][0] if created else 'N/A'}</i>\n\n"
+        f"<b>{total}</b> managed subscriptions have ended.\n"
+        f"✅ {extended} extended · ☑️ {selected} selected\n\n"
+        f"Tap names to select them, then extend the selection or everyone not yet extended.\n"
+        + ("🚪 They are being removed from the channel automatically." if AUTO_REMOVE_EXPIRED
+           else "⚠️ Remove users from the channel manually if needed.")
+    )
+
+    keyboard = []
+    for position, user_id, first_name, is_selected, extended_days in entries:
+        if extended_days:
+            label = f"✅ {first_name or user_id} (+{extended_days}d)"
+        else:
+            label = f"{'☑️' if is_selected else '▫️'} {first_name or user_id}"
+        keyboard.append([InlineKeyboardButton(label[:60], callback_data=f"digest:toggle:{digest_id}:{position}:{page}")])
+
+    if pages > 1:
+        nav = []
+        if page > 0:
+            nav.append(InlineKeyboardButton("⬅️ Prev", callback_data=f"digest:page:{digest_id}:{page - 1}:{page}"))
+        nav.append(InlineKeyboardButton(f"{page + 1}/{pages}", callback_data="noop:0"))
+        if page < pages - 1:
+            nav.append(InlineKeyboardButton("Next ➡️", callback_data=f"digest:page:{digest_id}:{page + 1}:{page}"))
+        keyboard.append(nav)
+
+    keyboard.append([
+        InlineKeyboardButton(f"Extend selected +{days}d", callback_data=f"digest:sel:{digest_id}:{days}:{page}")
+        for days in EXPIRY_DIGEST_EXTEND_DAYS
+    ])
+    keyboard.append([
+        InlineKeyboardButton(f"Extend all +{days}d", callback_data=f"digest:all:{digest_id}:{days}:{page}")
+        for days in EXPIRY_DIGEST_EXTEND_DAYS
+    ])
+    return message, InlineKeyboardMarkup(keyboard)
 
-        for user_id, remaining_days, no_post_days_json in managed_users:
+async def render_expiry_digest(digest_id: int, page: int) -> Tuple[str, InlineKeyboardMarkup]:
+    """Async wrapper around expiry_digest_view on the read pool."""
+    return await async_db.run_read(lambda conn: expiry_digest_view(conn, digest_id, page))
+
+async def expiry_digest_callback(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    """Handles paging, selection and the bulk extend buttons of an expiry digest."""
+    try:
+        query = update.callback_query
+        _, action, digest_id_str, arg_str, page_str = query.data.split(':')
+        digest_id, arg, page = int(digest_id_str), int(arg_str), int(page_str)
+
+        notice = None
+        if action == "page":
+            page = arg
+        elif action == "toggle":
+            toggled = await async_db.run_write(lambda conn: conn.execute(
+                """UPDATE expiry_digest_entries SET selected = 1 - selected
+                   WHERE digest_id = ? AND position = ? AND extended_days = 0""",
+                (digest_id, arg)
+            ).rowcount)
+            if not toggled:
+                await query.answer("Already extended.")
+                return
+        elif action in ("all", "sel"):
+            refreshed = await async_db.run_write(
+                lambda conn: extend_digest_entries(conn, digest_id, arg, selected_only=action == "sel")
+            )
+            if not refreshed:
+                await query.answer("Nothing selected to extend." if action == "sel" else "Everyone is already extended.")
+                return
+            for user_id, row in refreshed.items():
+                subscriber_cache.put(user_id, row)
+            stats_snapshot.invalidate()
+            logger.info(f"Expiry digest {digest_id}: {len(refreshed)} subscriptions extended by {arg} days")
+            notice = f"Extended {len(refreshed)} subscriptions by {arg} days."
+
+        await query.answer(notice)
+        text, markup = await render_expiry_digest(digest_id, page)
+        await query.edit_message_text(text, reply_markup=markup, parse_mode='HTML')
+    except BadRequest as e:
+        if "not modified" not in str(e).lower():
+            logger.error(f"Expiry digest callback error: {e}")
+    except Exception as e:
+        logger.error(f"Expiry digest callback error: {e}")
+        await query.edit_message_text("Error updating the expiry digest.")
+
+# --- CHANNEL ENFORCEMENT ---
+# With AUTO_REMOVE_EXPIRED, the daily check queues every newly expired member for
+# removal and a worker drains the queue: ban (which removes the member), then unban so a
+# renewed subscriber can rejoin. The queue is persistent, so a restart resumes where it
+# stopped. Calls share the Bot API rate limiter, transient failures are retried with
+# exponential backoff, and every action is written to removal_audit.
+
+REMOVAL_CONCURRENCY = 8
+REMOVAL_BATCH_SIZE = 500
+REMOVAL_CHECKPOINT_SIZE = 100
+REMOVAL_MAX_ATTEMPTS = 5
+REMOVAL_RETRY_BASE_SECONDS = 60
+REMOVAL_POLL_SECONDS = 60
+
+DUE_REMOVALS_SQL = """
+    SELECT q.user_id, q.state, q.attempts, COALESCE(s.is_active, 0) FROM removal_queue AS q
+    LEFT JOIN subscribers AS s ON s.user_id = q.user_id
+    WHERE q.state IN ('pending', 'banned') AND q.next_attempt_at <= ?
+    ORDER BY q.next_attempt_at LIMIT ?
+"""
+UPDATE_REMOVAL_SQL = """
+    UPDATE removal_queue SET state = ?, attempts = ?, next_attempt_at = ?, last_error = ? WHERE user_id = ?
+"""
+INSERT_REMOVAL_AUDIT_SQL = """
+    INSERT INTO removal_audit (user_id, action, outcome, detail, created_at) VALUES (?, ?, ?, ?, ?)
+"""
+
+removal_lock = asyncio.Lock()
+
+def enqueue_removals(conn: sqlite3.Connection, user_ids: List[int]) -> int:
+    """Queues members for removal, restarting any earlier entry; the admin is never queued."""
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return conn.executemany(
+        """INSERT OR REPLACE INTO removal_queue (user_id, state, attempts, next_attempt_at, enqueued_at)
+           VALUES (?, 'pending', 0, ?, ?)""",
+        ((user_id, now, now) for user_id in user_ids if user_id != ADMIN_ID)
+    ).rowcount
+
+class RemovalWorker:
+    """Works through the due removals with bounded concurrency, checkpointing in batches."""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.removed = 0
+        self.failed = 0
+        self.retrying = 0
+        self.cancelled = 0
+        self._updates: List[tuple] = []
+        self._audit: List[tuple] = []
+
+    async def run(self):
+        while True:
+            now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            due = await db_read(DUE_REMOVALS_SQL, (now, REMOVAL_BATCH_SIZE))
+            if not due:
+                return
+            queue: asyncio.Queue = asyncio.Queue()
+            for row in due:
+                queue.put_nowait(row)
             try:
-                no_post_days = safe_json_loads(no_post_days_json)
-                new_remaining_days = remaining_days
-
-                if admin_posted_today:
-                    new_remaining_days = max(0, remaining_days - 1)
-                    db_query(
-                        "UPDATE subscribers SET remaining_days = ? WHERE user_id = ?",
-                        (new_remaining_days, user_id)
-                    )
-                else:
-                    if today not in no_post_days:
-                        no_post_days.append(today)
-                        db_query(
-                            "UPDATE subscribers SET no_post_days = ? WHERE user_id = ?",
-                            (safe_json_dumps(no_post_days), user_id)
-                        )
-
-                if new_remaining_days in [1, 2, 3]:
-                    try:
-                        await context.bot.send_message(
-                            user_id,
-                            f"👋 You have {new_remaining_days} days left on your subscription."
-                        )
-                    except Exception as e:
-                        logger.warning(f"Could not send reminder to {user_id}: {e}")
-
-                if new_remaining_days <= 0:
-                    user_info_result = db_query("SELECT first_name FROM subscribers WHERE user_id = ?", (user_id,))
-                    if user_info_result:
-                        user_name = safe_text(user_info_result[0][0], 30)
-                        keyboard = [[InlineKeyboardButton("📝 Extend Subscription", callback_data=f"extend:{user_id}:7")]]
-                        await context.bot.send_message(
-                            ADMIN_ID,
-                            f"🔔 <b>Subscription Expired</b> 🔔\n\n"
-                            f"Managed user <b>{user_name}</b> (<code>{user_id}</code>) subscription has ended.\n\n"
-                            f"⚠️ <b>Action Required:</b>\n"
-                            f"• Manually remove user from channel if needed\n"
-                            f"• Or extend their subscription below.",
-                            reply_markup=InlineKeyboardMarkup(keyboard),
-                            parse_mode='HTML'
-                        )
-                    db_query("UPDATE subscribers SET is_active = 0 WHERE user_id = ?", (user_id,))
+                workers = [asyncio.create_task(self._worker(queue)) for _ in range(min(REMOVAL_CONCURRENCY, len(due)))]
+                await asyncio.gather(*workers)
+            finally:
+                await self._checkpoint()
+            # Rows that are retried later are no longer due, so a short batch means we're done.
+            if len(due) < REMOVAL_BATCH_SIZE:
+                return
+
+    async def _worker(self, queue: asyncio.Queue):
+        while not queue.empty():
+            await self._remove(*queue.get_nowait())
+            if len(self._updates) >= REMOVAL_CHECKPOINT_SIZE:
+                await self._checkpoint()
+
+    async def _remove(self, user_id: int, state: str, attempts: int, is_active: int):
+        if state == 'pending' and is_active:
+            # Renewed or extended since it was queued.
+            self._record(user_id, 'cancelled', attempts, None, 'cancel', 'ok', "subscription is active again")
+            self.cancelled += 1
+            return
 
-            except Exception as e:
-                logger.error(f"Error processing managed user {user_id}: {e}")
+        action = 'ban' if state == 'pending' else 'unban'
+        try:
+            # Membership changes post nothing into the channel, so only the global limit applies.
+            if state == 'pending':
+                await send_with_retry(user_id, lambda: self.bot.ban_chat_member(CHANNEL_ID, user_id), pace_chat=False)
+                self._log(user_id, 'ban', 'ok')
+                state, action = 'banned', 'unban'
+            await send_with_retry(
+                user_id, lambda: self.bot.unban_chat_member(CHANNEL_ID, user_id, only_if_banned=True),
+                pace_chat=False
+            )
+            self._record(user_id, 'done', attempts, None, 'unban', 'ok')
+            self.removed += 1
+        except (BadRequest, Forbidden) as e:
+            removal_logger.warning(f"Could not {action} {user_id} in the channel: {e}")
+            self._record(user_id, 'failed', attempts + 1, str(e)[:200], action, 'failed', str(e)[:200])
+            self.failed += 1
+        except Exception as e:
+            attempts += 1
+            if attempts >= REMOVAL_MAX_ATTEMPTS:
+                removal_logger.error(f"Giving up removing {user_id} after {attempts} attempts: {e}")
+                self._record(user_id, 'failed', attempts, str(e)[:200], action, 'failed', str(e)[:200])
+                self.failed += 1
+                return
+            delay = REMOVAL_RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+            removal_logger.warning(f"Removal of {user_id} failed ({action}, attempt {attempts}): {e}; retrying in {delay}s")
+            self._record(user_id, state, attempts, str(e)[:200], action, 'retry', str(e)[:200], delay)
+            self.retrying += 1
+
+    def _log(self, user_id: int, action: str, outcome: str, detail: Optional[str] = None):
+        REMOVAL_ACTIONS.inc(action=action, outcome=outcome)
+        self._audit.append((user_id, action, outcome, detail, datetime.now().strftime("%Y-%m-%d %H:%M:%S")))
+
+    def _record(self, user_id: int, state: str, attempts: int, error: Optional[str],
+                action: str, outcome: str, detail: Optional[str] = None, retry_in: float = 0):
+        self._log(user_id, action, outcome, detail)
+        next_attempt = (datetime.now() + timedelta(seconds=retry_in)).strftime("%Y-%m-%d %H:%M:%S")
+        self._updates.append((state, attempts, next_attempt, error, user_id))
+
+    async def _checkpoint(self):
+        updates, self._updates = self._updates, []
+        audit, self._audit = self._audit, []
+        if not updates and not audit:
+            return
 
-        # --- Process Offline Records ---
-        offline_records = db_query(
-            "SELECT id, remaining_days, no_post_days FROM offline_subscribers WHERE plan_days != -1"
+        def write(conn: sqlite3.Connection):
+            conn.executemany(UPDATE_REMOVAL_SQL, updates)
+            conn.executemany(INSERT_REMOVAL_AUDIT_SQL, audit)
+
+        await async_db.run_write(write)
+
+async def process_removal_queue(context: ContextTypes.DEFAULT_TYPE):
+    """Job callback: drains the due removals, unless a drain is already running."""
+    if removal_lock.locked():
+        return
+    async with removal_lock:
+        worker = RemovalWorker(context.bot)
+        started = perf_counter()
+        try:
+            await worker.run()
+        except Exception as e:
+            removal_logger.error(f"Removal worker stopped: {e}")
+        if not (worker.removed or worker.failed):
+            return
+        removal_logger.info(
+            f"Removal worker finished in {perf_counter() - started:.1f}s: {worker.removed} removed, "
+            f"{worker.failed} failed, {worker.retrying} to retry, {worker.cancelled} cancelled"
+        )
+        summary = (
+            f"🚪 <b>Channel Cleanup</b>\n\n"
+            f"Removed: {worker.removed}\n"
+            f"Failed: {worker.failed}\n"
+            f"Retrying later: {worker.retrying}\n\n"
+            f"Use /removals to see the queue."
         )
+        try:
+            await async_db.run_write(lambda conn: enqueue_message(
+                conn, ADMIN_ID, summary, OUTBOX_PRIORITY_ADMIN, parse_mode='HTML'
+            ))
+            wake_outbox(context)
+        except Exception as e:
+            removal_logger.error(f"Could not queue the cleanup summary: {e}")
+
+# --- OUTBOX ---
+# Notifications that follow a state change (reminders, the expiry digest, join alerts,
+# error pings) are written to the outbox in the same transaction as the change and
+# delivered by a background dispatcher, so the code path that triggered them never waits
+# on Telegram and nothing is lost if a send fails or the process dies. Delivery is
+# at-least-once: a row is marked sent only after Telegram accepted it, so a crash can
+# re-send at most one checkpoint batch. A dedup key makes enqueueing twice a no-op.
+
+OUTBOX_PRIORITY_ADMIN = 0
+OUTBOX_PRIORITY_SUBSCRIBER = 1
+OUTBOX_PRIORITY_NAMES = {OUTBOX_PRIORITY_ADMIN: "admin", OUTBOX_PRIORITY_SUBSCRIBER: "subscriber"}
+
+OUTBOX_CONCURRENCY = 8
+OUTBOX_BATCH_SIZE = 200
+OUTBOX_CHECKPOINT_SIZE = 50
+OUTBOX_MAX_ATTEMPTS = 6
+OUTBOX_RETRY_BASE_SECONDS = 30
+OUTBOX_POLL_SECONDS = 10
+OUTBOX_RETENTION_DAYS = 14
+
+INSERT_OUTBOX_SQL = """
+    INSERT INTO outbox (chat_id, priority, payload, dedup_key, next_attempt_at, created_at)
+    VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (dedup_key) DO NOTHING
+"""
+DUE_OUTBOX_SQL = """
+    SELECT id, chat_id, priority, payload, attempts FROM outbox
+    WHERE state = 'pending' AND next_attempt_at <= ? ORDER BY priority, id LIMIT ?
+"""
+UPDATE_OUTBOX_SQL = """
+    UPDATE outbox SET state = ?, attempts = ?, next_attempt_at = ?, sent_at = ?, last_error = ? WHERE id = ?
+"""
+PRUNE_OUTBOX_SQL = "DELETE FROM outbox WHERE created_at < ? AND state != 'pending'"
+
+outbox_lock = asyncio.Lock()
+
+def outbox_message(chat_id: int, text: str, priority: int, dedup_key: Optional[str] = None,
+                   parse_mode: Optional[str] = None, reply_markup: Optional[InlineKeyboardMarkup] = None) -> tuple:
+    """One outbox row for enqueue_messages."""
+    payload = json.dumps({
+        "text": text,
+        "parse_mode": parse_mode,
+        "reply_markup": reply_markup.to_dict() if reply_markup else None,
+    })
+    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    return chat_id, priority, payload, dedup_key, now, now
+
+def enqueue_messages(conn: sqlite3.Connection, messages: Iterable[tuple]) -> int:
+    """Adds outbox_message rows in the caller's transaction; rows with a used dedup key are skipped."""
+    return conn.executemany(INSERT_OUTBOX_SQL, messages).rowcount
+
+def enqueue_message(conn: sqlite3.Connection, chat_id: int, text: str, priority: int, **kwargs) -> bool:
+    """Adds one message to the outbox; False if its dedup key was already used."""
+    return enqueue_messages(conn, [outbox_message(chat_id, text, priority, **kwargs)]) > 0
+
+def prune_outbox(conn: sqlite3.Connection) -> int:
+    """Deletes delivered and failed rows older than OUTBOX_RETENTION_DAYS."""
+    cutoff = (datetime.now() - timedelta(days=OUTBOX_RETENTION_DAYS)).strftime("%Y-%m-%d %H:%M:%S")
+    return conn.execute(PRUNE_OUTBOX_SQL, (cutoff,)).rowcount
+
+def wake_outbox(context: ContextTypes.DEFAULT_TYPE):
+    """Starts a dispatcher run now rather than at the next poll."""
+    if context.job_queue:
+        context.job_queue.run_once(process_outbox, when=0)
+
+class OutboxDispatcher:
+    """Delivers the due outbox rows, most urgent first, checkpointing in batches."""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.sent = 0
+        self.failed = 0
+        self.retrying = 0
+        self._updates: List[tuple] = []
+
+    async def run(self):
+        while True:
+            now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            due = await db_read(DUE_OUTBOX_SQL, (now, OUTBOX_BATCH_SIZE))
+            if not due:
+                return
+            queue: asyncio.Queue = asyncio.Queue()
+            for row in due:
+                queue.put_nowait(row)
+            try:
+                workers = [asyncio.create_task(self._worker(queue)) for _ in range(min(OUTBOX_CONCURRENCY, len(due)))]
+                await asyncio.gather(*workers)
+            finally:
+                await self._checkpoint()
+            if len(due) < OUTBOX_BATCH_SIZE:
+                return
+
+    async def _worker(self, queue: asyncio.Queue):
+        while not queue.empty():
+            await self._deliver(*queue.get_nowait())
+            if len(self._updates) >= OUTBOX_CHECKPOINT_SIZE:
+                await self._checkpoint()
+
+    async def _deliver(self, outbox_id: int, chat_id: int, priority: int, payload: str, attempts: int):
+        label = OUTBOX_PRIORITY_NAMES.get(priority, str(priority))
+        message = json.loads(payload)
+        markup = message.get("reply_markup")
+        try:
+            await send_with_retry(chat_id, lambda: self.bot.send_message(
+                chat_id, message["text"], parse_mode=message.get("parse_mode"),
+                reply_markup=InlineKeyboardMarkup.de_json(markup, self.bot) if markup else None
+            ))
+            now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            self._updates.append(('sent', attempts + 1, now, now, None, outbox_id))
+            OUTBOX_MESSAGES.inc(priority=label, result='sent')
+            self.sent += 1
+        except (BadRequest, Forbidden) as e:
+            send_logger.warning(f"Outbox message {outbox_id} to {chat_id} failed permanently: {e}")
+            self._fail(outbox_id, attempts + 1, e, label)
+        except Exception as e:
+            attempts += 1
+            if attempts >= OUTBOX_MAX_ATTEMPTS:
+                send_logger.error(f"Giving up on outbox message {outbox_id} to {chat_id} after {attempts} attempts: {e}")
+                self._fail(outbox_id, attempts, e, label)
+                return
+            delay = OUTBOX_RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+            send_logger.warning(f"Outbox message {outbox_id} to {chat_id} failed (attempt {attempts}): {e}; retrying in {delay}s")
+            next_attempt = (datetime.now() + timedelta(seconds=delay)).strftime("%Y-%m-%d %H:%M:%S")
+            self._updates.append(('pending', attempts, next_attempt, None, str(e)[:200], outbox_id))
+            OUTBOX_MESSAGES.inc(priority=label, result='retry')
+            self.retrying += 1
+
+    def _fail(self, outbox_id: int, attempts: int, error: Exception, label: str):
+        now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self._updates.append(('failed', attempts, now, None, str(error)[:200], outbox_id))
+        OUTBOX_MESSAGES.inc(priority=label, result='failed')
+        self.failed += 1
+
+    async def _checkpoint(self):
+        updates, self._updates = self._updates, []
+        if updates:
+            await async_db.write_many(UPDATE_OUTBOX_SQL, updates)
+
+async def process_outbox(context: ContextTypes.DEFAULT_TYPE):
+    """Job callback: delivers the due outbox messages, unless a run is already in progress."""
+    if outbox_lock.locked():
+        return
+    async with outbox_lock:
+        dispatcher = OutboxDispatcher(context.bot)
+        started = perf_counter()
+        try:
+            await dispatcher.run()
+        except Exception as e:
+            send_logger.error(f"Outbox dispatcher stopped: {e}")
+        if dispatcher.sent or dispatcher.failed or dispatcher.retrying:
+            logger.info(
+                f"Outbox: {dispatcher.sent} sent, {dispatcher.failed} failed, {dispatcher.retrying} to retry "
+                f"in {perf_counter() - started:.1f}s"
+            )
 
-        for rec_id, remaining_days, no_post_days_json in offline_records:
+# --- MEMBERSHIP RECONCILIATION ---
+# track_chats only learns what the ChatMemberUpdated events tell it; an event missed
+# while the bot was down leaves a subscriber marked active after they left, and the
+# roster with a stale status. A nightly job walks the active subscribers in user_id
+# order, checks each one with get_chat_member (cached, under the shared rate limiter,
+# RECONCILE_CONCURRENCY at a time) and writes the corrections once per chunk: departed
+# subscribers are deactivated and roster rows take the observed status. Deactivation
+# keeps the balance, and track_chats resumes the subscription if they rejoin in time.
+
+RECONCILE_CHUNK_SIZE = 200
+RECONCILE_CONCURRENCY = 8
+RECONCILE_REPORT_SHOWN = 10
+RECONCILE_TIME = time(hour=3, minute=0, tzinfo=timezone.utc)
+
+ACTIVE_SUBSCRIBER_CHUNK_SQL = """
+    SELECT s.user_id, s.first_name, m.status FROM subscribers AS s
+    LEFT JOIN channel_members AS m ON m.user_id = s.user_id
+    WHERE s.is_active = 1 AND s.user_id > ? ORDER BY s.user_id LIMIT ?
+"""
+DEACTIVATE_DEPARTED_SQL = "UPDATE subscribers SET is_active = 0 WHERE user_id = ? AND is_active = 1"
+RESUME_SUBSCRIPTION_SQL = f"""
+    UPDATE subscribers SET is_active = 1
+    WHERE user_id = ? AND is_active = 0 AND (plan_days = -1 OR expiry_seq > {CURRENT_POSTING_SEQ_SQL})
+"""
+
+reconcile_lock = asyncio.Lock()
+
+def is_channel_member(member: ChatMember) -> bool:
+    """False for users who left or were removed, including restricted non-members."""
+    if member.status == ChatMember.RESTRICTED:
+        return bool(getattr(member, "is_member", True))
+    return member.status not in ABSENT_MEMBER_STATUSES
+
+class MembershipReconciler:
+    """Checks every active subscriber against the channel and corrects the drift."""
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.checked = 0
+        self.errors = 0
+        self.roster_updated = 0
+        self.departed: List[tuple] = []  # (user_id, first_name, status)
+        self._semaphore = asyncio.Semaphore(RECONCILE_CONCURRENCY)
+
+    async def run(self):
+        after = 0
+        while True:
+            chunk = await db_read(ACTIVE_SUBSCRIBER_CHUNK_SQL, (after, RECONCILE_CHUNK_SIZE))
+            if not chunk:
+                return
+            members = await asyncio.gather(*(self._check(user_id) for user_id, _, _ in chunk))
+            await self._apply(chunk, members)
+            if len(chunk) < RECONCILE_CHUNK_SIZE:
+                return
+            after = chunk[-1][0]
+
+    async def _check(self, user_id: int) -> Optional[ChatMember]:
+        async with self._semaphore:
             try:
-                no_post_days = safe_json_loads(no_post_days_json)
+                return await cached_get_chat_member(self.bot, CHANNEL_ID, user_id, rate_limited=True)
+            except Exception as e:
+                reconcile_logger.warning(f"Could not check channel membership of {user_id}: {e}")
+                MEMBERSHIP_CHECKS.inc(result="error")
+                self.errors += 1
+                return None
+
+    async def _apply(self, chunk: List[tuple], members: List[Optional[ChatMember]]):
+        departed, roster = [], []
+        for (user_id, first_name, roster_status), member in zip(chunk, members):
+            if member is None:
+                continue
+            self.checked += 1
+            present = is_channel_member(member)
+            MEMBERSHIP_CHECKS.inc(result="member" if present else "departed")
+            if not present:
+                departed.append((user_id, first_name, member.status))
+            if member.status != roster_status:
+                roster.append(member)
+        if not departed and not roster:
+            return
 
-                if admin_posted_today:
-                    new_remaining_days = max(0, remaining_days - 1)
-                    db_query("UPDATE offline_subscribers SET remaining_days = ? WHERE id = ?", (new_remaining_days, rec_id))
-                else:
-                    if today not in no_post_days:
-                        no_post_days.append(today)
-                        db_query("UPDATE offline_subscribers SET no_post_days = ? WHERE id = ?", (safe_json_dumps(no_post_days), rec_id))
+        def write(conn: sqlite3.Connection):
+            for member in roster:
+                user = member.user
+                upsert_roster_member(conn, user.id, user.first_name, user.last_name, user.username, member.status)
+            conn.executemany(DEACTIVATE_DEPARTED_SQL, ((user_id,) for user_id, _, _ in departed))
 
-            except Exception as e:
-                logger.error(f"Error processing offline record {rec_id}: {e}")
+        await async_db.run_write(write)
+        for user_id, _, _ in departed:
+            subscriber_cache.invalidate(user_id)
+        self.departed.extend(departed)
+        self.roster_updated += len(roster)
 
-        logger.info("Daily subscription check completed successfully.")
+    def report(self, elapsed: float) -> str:
+        message = (
+            f"🔄 <b>Membership Reconciliation</b>\n\n"
+            f"Checked: {self.checked} active subscribers in {elapsed:.0f}s\n"
+            f"Left the channel (deactivated): {len(self.departed)}\n"
+            f"Roster entries corrected: {self.roster_updated}\n"
+            f"Lookup errors: {self.errors}\n"
+        )
+        for user_id, first_name, status in self.departed[:RECONCILE_REPORT_SHOWN]:
+            message += f"\n- {safe_text(first_name or 'Unknown', 30)} (<code>{user_id}</code>): {status}"
+        if len(self.departed) > RECONCILE_REPORT_SHOWN:
+            message += f"\n...and {len(self.departed) - RECONCILE_REPORT_SHOWN} more"
+        return message
 
-    except Exception as e:
-        logger.error(f"Daily subscription check failed: {e}")
+async def reconcile_memberships(context: ContextTypes.DEFAULT_TYPE):
+    """Job callback: reconciles active subscribers with the channel, unless a run is in progress.
 
-async def admin_post_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    """Detects when the admin posts in the channel."""
-    try:
-        if update.effective_user.id == ADMIN_ID:
-            today = datetime.now().strftime("%Y-%m-%d")
-            db_query("UPDATE admin_activity SET last_post_date = ? WHERE id = 1", (today,))
-            logger.info(f"Admin post detected on {today}.")
-    except Exception as e:
-        logger.error(f"Admin post handler error: {e}")
+    The report is only sent when something drifted, or always for runs started by /reconcile.
+    """
+    if reconcile_lock.locked():
+        return
+    always_report = bool(context.job and context.job.data)
+    async with reconcile_lock:
+        reconciler = MembershipReconciler(context.bot)
+        started = perf_counter()
+        try:
+            await reconciler.run()
+        except Exception as e:
+            reconcile_logger.error(f"Membership reconciliation stopped: {e}")
+        elapsed = perf_counter() - started
+        if reconciler.departed:
+            stats_snapshot.invalidate()
+        logger.info(
+            f"Membership reconciliation finished in {elapsed:.1f}s: {reconciler.checked} checked, "
+            f"{len(reconciler.departed)} departed, {reconciler.roster_updated} roster fixes, {reconciler.errors} errors"
+        )
+        if not (reconciler.departed or reconciler.errors or always_report):
+            return
+        try:
+            await async_db.run_write(lambda conn: enqueue_message(
+                conn, ADMIN_ID, reconciler.report(elapsed), OUTBOX_PRIORITY_ADMIN, parse_mode='HTML'
+            ))
+            wake_outbox(context)
+        except Exception as e:
+            reconcile_logger.error(f"Could not queue the reconciliation report: {e}")
 
 # --- GENERAL CALLBACK QUERY HANDLER ---
 
@@ -1382,15 +4053,10 @@ async def general_button_handler(update: Update, context: ContextTypes.DEFAULT_T
         if action == "extend" and len(parts) >= 3:
             user_id, days = int(parts[1]), int(parts[2])
 
-            user_info_result = db_query("SELECT first_name FROM subscribers WHERE user_id = ?", (user_id,))
-            user_name = "Unknown User"
-            if user_info_result:
-                user_name = safe_text(user_info_result[0][0], 30)
-
-            db_query(
-                "UPDATE subscribers SET remaining_days = remaining_days + ?, is_active = 1 WHERE user_id = ?",
-                (days, user_id)
-            )
+            user = await async_db.run_write(lambda conn: extend_subscription(conn, user_id, days))
+            subscriber_cache.put(user_id, user)
+            stats_snapshot.invalidate()
+            user_name = safe_text(user[2], 30) if user else "Unknown User"
             await query.edit_message_text(
                 f"✅ <b>Subscription Extended</b>\n\n"
                 f"User: <b>{user_name}</b> (<code>{user_id}</code>)\n"
@@ -1401,10 +4067,10 @@ async def general_button_handler(update: Update, context: ContextTypes.DEFAULT_T
         elif action == "info" and len(parts) >= 2:
             user_id = int(parts[1])
             try:
-                user_info = await context.bot.get_chat(user_id)
+                user_info = await cached_get_chat(context.bot, user_id)
                 full_name, username = format_user_info(user_info)
 
-                existing_user = db_query("SELECT * FROM subscribers WHERE user_id = ?", (user_id,))
+                existing_user = await get_subscriber(user_id)
 
                 message = (
                     f"👤 <b>User Information</b>\n\n"
@@ -1452,21 +4118,380 @@ async def error_handler(update: object, context: ContextTypes.DEFAULT_TYPE) -> N
     try:
         if isinstance(update, Update) and update.effective_message:
             error_message = f"An error occurred: {str(context.error)}"
-            await context.bot.send_message(
-                chat_id=ADMIN_ID,
-                text=f"🚨 Bot Error:\n<code>{error_message[:500]}</code>",
-                parse_mode='HTML'
-            )
+            # The same error is reported at most once a minute.
+            dedup_key = f"error:{datetime.now().strftime('%Y-%m-%d %H:%M')}:{error_message[:200]}"
+            await async_db.run_write(lambda conn: enqueue_message(
+                conn, ADMIN_ID, f"🚨 Bot Error:\n<code>{error_message[:500]}</code>", OUTBOX_PRIORITY_ADMIN,
+                dedup_key=dedup_key, parse_mode='HTML'
+            ))
+            wake_outbox(context)
     except Exception as e:
-        logger.error(f"Error sending error notification: {e}")
+        logger.error(f"Error queueing error notification: {e}")
+
+# --- QUERY PLAN CHECKS ---
+# Every query on a latency-sensitive path, with representative parameters. Bulk
+# statements that touch every row by design (stats aggregates, the balance audit,
+# broadcast job creation) are deliberately not listed.
+
+def hot_queries() -> List[Tuple[str, str, object]]:
+    """Returns (name, sql, params) for the queries that must never scan a whole table."""
+    page_params = {'limit': USERS_PER_PAGE + 1, 'name': '', 'id': 0}
+    queries = [
+        ("subscriber by id", SUBSCRIBER_BY_ID_SQL, (1,)),
+        ("offline record by id", OFFLINE_RECORD_BY_ID_SQL, (1,)),
+        ("subscriber name", SUBSCRIBER_NAME_SQL, (1,)),
+        ("offline identifier", OFFLINE_IDENTIFIER_SQL, (1,)),
+        ("legacy no-post days", LEGACY_NO_POST_DAYS_SQL, ('managed', 1)),
+        ("posting days in range", POSTING_DAYS_BETWEEN_SQL, ('2024-01-01', '2024-02-01')),
+        ("expiring soon (managed)", MANAGED_EXPIRING_SQL, (EXPIRING_SOON_SHOWN,)),
+        ("expiring soon (offline)", OFFLINE_EXPIRING_SQL, (EXPIRING_SOON_SHOWN,)),
+        ("reminder candidates", REMINDER_CANDIDATES_SQL, ()),
+        ("expired subscribers", EXPIRED_SUBSCRIBERS_SQL, ()),
+        ("deactivate expired", DEACTIVATE_EXPIRED_SQL, ()),
+        ("expiry digest counts", DIGEST_COUNTS_SQL, (1,)),
+        ("expiry digest page", DIGEST_PAGE_SQL, (1, 0, EXPIRY_DIGEST_PAGE_SIZE)),
+        ("due channel removals", DUE_REMOVALS_SQL, ('2024-01-01 00:00:00', REMOVAL_BATCH_SIZE)),
+        ("due outbox messages", DUE_OUTBOX_SQL, ('2024-01-01 00:00:00', OUTBOX_BATCH_SIZE)),
+        ("active subscriber chunk", ACTIVE_SUBSCRIBER_CHUNK_SQL, (0, RECONCILE_CHUNK_SIZE)),
+        ("resume subscription", RESUME_SUBSCRIPTION_SQL, (1,)),
+        ("broadcast counts", BROADCAST_COUNTS_SQL, (1,)),
+        ("broadcast pending recipients", PENDING_RECIPIENTS_SQL, (1,)),
+        ("broadcast checkpoint", CHECKPOINT_RECIPIENT_SQL, ('delivered', None, 1, 1)),
+        ("roster by username", ROSTER_BY_USERNAME_SQL, ('someone',)),
+        ("roster by name", roster_trigram_sql(3), (' an', 'ann', 'nn ', 3)),
+    ]
+    for (direction, kind), sql in _USER_PAGE_QUERIES.items():
+        queries.append((f"user list page ({direction}, {kind or 'start'})", sql, page_params))
+    return queries
+
+# SQLite 3.36+ prints "SCAN subscribers" (or just the alias), older versions
+# "SCAN TABLE subscribers [AS s]". "SCAN ... USING [COVERING] INDEX" is deliberately
+# not a full scan: the hot queries walk an index in order under a LIMIT (user list
+# pages) or a partial index (pending outbox), so they stop early.
+_FULL_TABLE_SCAN = re.compile(r"^SCAN (?:TABLE )?(\w+)(?: AS \w+)?$")
+
+def find_full_scans(conn: sqlite3.Connection) -> List[Tuple[str, str]]:
+    """Runs EXPLAIN QUERY PLAN on every hot query; returns (name, plan step) for table scans."""
+    offenders = []
+    for name, sql, params in hot_queries():
+        for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params):
+            if _FULL_TABLE_SCAN.match(row[3]):
+                offenders.append((name, row[3]))
+    return offenders
+
+# --- UPDATE INTAKE ---
+# Updates are processed concurrently, so a slow member search or broadcast no longer
+# holds up everyone else's /status. Updates from the same user in the same chat still
+# run strictly one after another: the conversation handlers are keyed per (user, chat)
+# and would otherwise see their state change underneath them.
+
+# Same-key updates waiting for their turn also occupy a slot, hence the generous limit.
+MAX_CONCURRENT_UPDATES = 64
+
+class KeyedUpdateProcessor(BaseUpdateProcessor):
+    """Runs updates concurrently while serializing those that share a (user, chat) key."""
+
+    def __init__(self, max_concurrent_updates: int = MAX_CONCURRENT_UPDATES):
+        super().__init__(max_concurrent_updates)
+        self._locks = {}  # key -> [asyncio.Lock, number of updates holding or waiting for it]
+
+    @staticmethod
+    def update_key(update: object) -> Optional[Tuple[Optional[int], Optional[int]]]:
+        """(user id, chat id) of an update, or None if it belongs to neither."""
+        if not isinstance(update, Update):
+            return None
+        user, chat = update.effective_user, update.effective_chat
+        if user is None and chat is None:
+            return None
+        return (user.id if user else None, chat.id if chat else None)
+
+    async def do_process_update(self, update: object, coroutine: Awaitable):
+        key = self.update_key(update)
+        if key is None:
+            await coroutine
+            return
+
+        entry = self._locks.setdefault(key, [asyncio.Lock(), 0])
+        entry[1] += 1
+        try:
+            # asyncio.Lock wakes waiters in FIFO order, so same-key updates keep their order.
+            async with entry[0]:
+                await coroutine
+        finally:
+            entry[1] -= 1
+            if not entry[1]:
+                del self._locks[key]
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+def handler_update_types(handler: BaseHandler) -> Optional[set]:
+    """The Update fields a handler can react to, or None if that is not known."""
+    if isinstance(handler, ConversationHandler):
+        types = set()
+        children = list(handler.entry_points) + list(handler.fallbacks)
+        for state_handlers in handler.states.values():
+            children.extend(state_handlers)
+        for child in children:
+            child_types = handler_update_types(child)
+            if child_types is None:
+                return None
+            types |= child_types
+        return types
+    if isinstance(handler, CallbackQueryHandler):
+        return {Update.CALLBACK_QUERY}
+    if isinstance(handler, ChatMemberHandler):
+        return {
+            ChatMemberHandler.MY_CHAT_MEMBER: {Update.MY_CHAT_MEMBER},
+            ChatMemberHandler.CHAT_MEMBER: {Update.CHAT_MEMBER},
+        }.get(handler.chat_member_types, {Update.MY_CHAT_MEMBER, Update.CHAT_MEMBER})
+    if isinstance(handler, CommandHandler):
+        return {Update.MESSAGE}
+    if isinstance(handler, MessageHandler):
+        # Admin posts in the channel arrive as channel_post, everything else as message.
+        # Edits are deliberately not subscribed to: no handler is meant to re-run on them.
+        return {Update.MESSAGE, Update.CHANNEL_POST}
+    return None
+
+def compute_allowed_updates(application: Application) -> List[str]:
+    """The allowed_updates list covering exactly the registered handlers.
+
+    Falls back to Update.ALL_TYPES if a handler type is not recognised, so a new kind of
+    handler can never silently stop receiving its updates.
+    """
+    allowed = set()
+    for group in application.handlers.values():
+        for handler in group:
+            types = handler_update_types(handler)
+            if types is None:
+                logger.warning(f"Unknown handler type {type(handler).__name__}; subscribing to all update types.")
+                return list(Update.ALL_TYPES)
+            allowed |= types
+    return sorted(allowed)
+
+def run_application(application: Application):
+    """Starts receiving updates in the configured UPDATE_MODE."""
+    allowed_updates = compute_allowed_updates(application)
+    logger.info(f"Subscribing to update types: {', '.join(allowed_updates)}")
+
+    if UPDATE_MODE == "webhook":
+        if not WEBHOOK_URL:
+            raise ValueError("UPDATE_MODE is 'webhook' but WEBHOOK_URL is not set.")
+        secret = WEBHOOK_SECRET or secrets.token_urlsafe(32)
+        logger.info(f"Starting webhook listener on {WEBHOOK_LISTEN}:{WEBHOOK_PORT}/{WEBHOOK_PATH}")
+        application.run_webhook(
+            listen=WEBHOOK_LISTEN,
+            port=WEBHOOK_PORT,
+            url_path=WEBHOOK_PATH,
+            webhook_url=WEBHOOK_URL,
+            secret_token=secret,
+            allowed_updates=allowed_updates,
+        )
+    elif UPDATE_MODE == "polling":
+        application.run_polling(allowed_updates=allowed_updates)
+    else:
+        raise ValueError(f"Unknown UPDATE_MODE {UPDATE_MODE!r}; use 'polling' or 'webhook'.")
+
+# --- METRICS ENDPOINT ---
+
+def iter_handlers(handlers: Iterable[BaseHandler]) -> Iterator[BaseHandler]:
+    """Every handler, with conversation handlers replaced by their entry, state and fallback handlers."""
+    for handler in handlers:
+        if isinstance(handler, ConversationHandler):
+            yield from iter_handlers(handler.entry_points)
+            for state_handlers in handler.states.values():
+                yield from iter_handlers(state_handlers)
+            yield from iter_handlers(handler.fallbacks)
+        else:
+            yield handler
+
+def timed_callback(name: str, callback: Callable) -> Callable:
+    """Wraps a handler callback so its duration and escaping exceptions are recorded."""
+    @wraps(callback)
+    async def wrapper(update, context):
+        start = perf_counter()
+        try:
+            return await callback(update, context)
+        except Exception:
+            HANDLER_EXCEPTIONS.inc(handler=name)
+            raise
+        finally:
+            HANDLER_DURATION.observe(perf_counter() - start, handler=name)
+    wrapper.instrumented = True
+    return wrapper
+
+def instrument_handlers(application: Application):
+    """Times every registered handler callback, labelled by the callback's name."""
+    for group in application.handlers.values():
+        for handler in iter_handlers(group):
+            if not getattr(handler.callback, "instrumented", False):
+                handler.callback = timed_callback(handler.callback.__name__, handler.callback)
+
+async def _serve_metrics(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), timeout=5)
+        while (await asyncio.wait_for(reader.readline(), timeout=5)) not in (b"\r\n", b"\n", b""):
+            pass
+        parts = request_line.decode("latin-1").split()
+        if len(parts) >= 2 and parts[0] == "GET" and parts[1].split("?")[0] == "/metrics":
+            status, body = "200 OK", render_metrics().encode()
+        else:
+            status, body = "404 Not Found", b"Not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+            f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError) as e:
+        logger.debug(f"Metrics request aborted: {e}")
+    finally:
+        writer.close()
+
+metrics_server: Optional[asyncio.AbstractServer] = None
+
+async def start_metrics_server():
+    """Serves /metrics on METRICS_LISTEN:METRICS_PORT unless METRICS_PORT is None."""
+    global metrics_server
+    if METRICS_PORT is None or metrics_server is not None:
+        return
+    try:
+        metrics_server = await asyncio.start_server(_serve_metrics, METRICS_LISTEN, METRICS_PORT)
+        logger.info(f"Serving metrics on http://{METRICS_LISTEN}:{METRICS_PORT}/metrics")
+    except OSError as e:
+        logger.error(f"Could not start the metrics endpoint: {e}")
+
+async def stop_metrics_server():
+    global metrics_server
+    if metrics_server is not None:
+        metrics_server.close()
+        await metrics_server.wait_closed()
+        metrics_server = None
 
 # --- MAIN APPLICATION SETUP ---
 
+async def post_init(application: Application):
+    await start_metrics_server()
+
+async def post_shutdown(application: Application):
+    """Flushes queued database writes and closes the connections on shutdown."""
+    await stop_metrics_server()
+    await async_db.close()
+    db.close()
+
+def build_application(builder: Optional[ApplicationBuilder] = None, concurrent: bool = True) -> Application:
+    """Builds the application and registers every handler.
+
+    `builder` lets tools swap in their own request objects or token; by default the
+    configured BOT_TOKEN is used. `concurrent=False` restores one-at-a-time processing.
+    """
+    if builder is None:
+        builder = (
+            Application.builder()
+            .token(BOT_TOKEN)
+            .base_url(BOT_API_BASE_URL)
+            .request(InstrumentedRequest(HTTPXRequest(connection_pool_size=256)))
+            .get_updates_request(InstrumentedRequest(HTTPXRequest()))
+            .post_init(post_init)
+        )
+    if concurrent:
+        builder = builder.concurrent_updates(KeyedUpdateProcessor())
+    application = builder.post_shutdown(post_shutdown).build()
+
+    # Conversation handler for manual/offline dashboard operations
+    dashboard_conv_handler = ConversationHandler(
+        entry_points=[
+            CallbackQueryHandler(dashboard_conversation_starter, pattern="^(broadcast|add_manual_prompt)$")
+        ],
+        states={
+            GET_FIRST_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_first_name_input)],
+            GET_USERNAME: [
+                MessageHandler(filters.TEXT & ~filters.COMMAND, handle_username_input),
+                CommandHandler('nousername', handle_username_input)
+            ],
+            SELECT_PLAN: [
+                CallbackQueryHandler(select_offline_plan_callback, pattern="^offline_plan:(7|14|30|-1)$"),
+                CallbackQueryHandler(select_offline_custom_plan_callback, pattern="^offline_plan:custom$"),
+                CallbackQueryHandler(cancel_offline_handler, pattern="^cancel_offline$"),
+                CallbackQueryHandler(select_plan_callback, pattern="^user_plan:(7|14|30|-1)$"),
+                CallbackQueryHandler(select_custom_plan_callback, pattern="^user_plan:custom$"),
+                CallbackQueryHandler(handle_detection_choice, pattern="^(create_offline|retry_search|cancel_manual)$")
+            ],
+            CUSTOM_DAYS: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_custom_days_input)],
+            GET_PAYMENT: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_manual_payment_info)],
+            GET_BROADCAST_MESSAGE: [MessageHandler(~filters.COMMAND, handle_broadcast_message)],
+        },
+        fallbacks=[
+            CommandHandler('cancel', cancel_conversation),
+            CallbackQueryHandler(cancel_approval_handler, pattern="^cancel_approval$"),
+        ],
+        per_message=False, per_user=True, per_chat=True
+    )
+
+    # Conversation handler specifically for approving new users
+    approve_conv_handler = ConversationHandler(
+        entry_points=[
+            CallbackQueryHandler(plan_selection_prompt, pattern="^approve:.*")
+        ],
+        states={
+            SELECT_PLAN: [
+                CallbackQueryHandler(select_plan_callback, pattern="^user_plan:(7|14|30|-1)$"),
+                CallbackQueryHandler(select_custom_plan_callback, pattern="^user_plan:custom$")
+            ],
+            CUSTOM_DAYS: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_custom_days_input)],
+            GET_PAYMENT: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_new_user_payment)], # MODIFIED
+        },
+        fallbacks=[
+            CommandHandler('cancel', cancel_conversation),
+            CallbackQueryHandler(cancel_approval_handler, pattern="^cancel_approval$"),
+        ],
+        per_message=False, per_user=True, per_chat=True
+    )
+
+    # Add handlers
+    application.add_handler(CommandHandler("start", start_command))
+    application.add_handler(CommandHandler("status", status_command))
+    application.add_handler(CommandHandler("dashboard", dashboard_command))
+    application.add_handler(CommandHandler("cachestats", cache_stats_command))
+    application.add_handler(CommandHandler("dbstats", db_stats_command))
+    application.add_handler(CommandHandler("auditbalances", audit_balances_command))
+    application.add_handler(CommandHandler("removals", removals_command))
+    application.add_handler(CommandHandler("reconcile", reconcile_command))
+
+    application.add_handler(dashboard_conv_handler)
+    application.add_handler(approve_conv_handler)
+
+    application.add_handler(CallbackQueryHandler(display_user_list, pattern="^check_user$"))
+    application.add_handler(CallbackQueryHandler(navigate_user_list_pages, pattern="^user_page:.*"))
+    application.add_handler(CallbackQueryHandler(display_user_details, pattern="^show_detail:.*"))
+
+    application.add_handler(CallbackQueryHandler(display_detailed_stats, pattern="^stats$"))
+    application.add_handler(CallbackQueryHandler(back_to_dashboard, pattern="^back_to_dashboard$"))
+    application.add_handler(CallbackQueryHandler(dashboard_callbacks, pattern="^expiring_soon$"))
+    application.add_handler(CallbackQueryHandler(display_broadcast_jobs, pattern="^broadcast_jobs$"))
+    application.add_handler(CallbackQueryHandler(broadcast_job_action, pattern="^bjob:(pause|resume|cancel):\\d+$"))
+
+    application.add_handler(CallbackQueryHandler(
+        expiry_digest_callback, pattern="^digest:(page|toggle|all|sel):\\d+:\\d+:\\d+$"
+    ))
+    application.add_handler(CallbackQueryHandler(general_button_handler, pattern="^(extend|info|dismiss_info|noop):.*"))
+    application.add_handler(ChatMemberHandler(track_chats, ChatMemberHandler.CHAT_MEMBER))
+    application.add_handler(
+        MessageHandler(filters.Chat(chat_id=CHANNEL_ID) & filters.User(user_id=ADMIN_ID), admin_post_handler)
+    )
+
+    application.add_error_handler(error_handler)
+    instrument_handlers(application)
+
+    return application
+
 def main():
     """Start the bot."""
     try:
         setup_database()
-        application = Application.builder().token(BOT_TOKEN).build()
+        application = build_application()
 
         if not application.job_queue:
             logger.error("JobQueue is not available. Install `python-telegram-bot[job-queue]`")
@@ -1476,83 +4501,16 @@ def main():
             daily_subscription_check,
             time=time(hour=0, minute=1, tzinfo=timezone.utc)
         )
-
-        # Conversation handler for manual/offline dashboard operations
-        dashboard_conv_handler = ConversationHandler(
-            entry_points=[
-                CallbackQueryHandler(dashboard_conversation_starter, pattern="^(broadcast|add_manual_prompt)$")
-            ],
-            states={
-                GET_FIRST_NAME: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_first_name_input)],
-                GET_USERNAME: [
-                    MessageHandler(filters.TEXT & ~filters.COMMAND, handle_username_input),
-                    CommandHandler('nousername', handle_username_input)
-                ],
-                SELECT_PLAN: [
-                    CallbackQueryHandler(select_offline_plan_callback, pattern="^offline_plan:(7|14|30|-1)$"),
-                    CallbackQueryHandler(select_offline_custom_plan_callback, pattern="^offline_plan:custom$"),
-                    CallbackQueryHandler(cancel_offline_handler, pattern="^cancel_offline$"),
-                    CallbackQueryHandler(select_plan_callback, pattern="^user_plan:(7|14|30|-1)$"),
-                    CallbackQueryHandler(select_custom_plan_callback, pattern="^user_plan:custom$"),
-                    CallbackQueryHandler(handle_detection_choice, pattern="^(create_offline|retry_search|cancel_manual)$")
-                ],
-                CUSTOM_DAYS: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_custom_days_input)],
-                GET_PAYMENT: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_manual_payment_info)],
-                GET_BROADCAST_MESSAGE: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_broadcast_message)],
-            },
-            fallbacks=[
-                CommandHandler('cancel', cancel_conversation),
-                CallbackQueryHandler(cancel_approval_handler, pattern="^cancel_approval$"),
-            ],
-            per_message=False, per_user=True, per_chat=True
-        )
-
-        # Conversation handler specifically for approving new users
-        approve_conv_handler = ConversationHandler(
-            entry_points=[
-                CallbackQueryHandler(plan_selection_prompt, pattern="^approve:.*")
-            ],
-            states={
-                SELECT_PLAN: [
-                    CallbackQueryHandler(select_plan_callback, pattern="^user_plan:(7|14|30|-1)$"),
-                    CallbackQueryHandler(select_custom_plan_callback, pattern="^user_plan:custom$")
-                ],
-                CUSTOM_DAYS: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_custom_days_input)],
-                GET_PAYMENT: [MessageHandler(filters.TEXT & ~filters.COMMAND, handle_new_user_payment)], # MODIFIED
-            },
-            fallbacks=[
-                CommandHandler('cancel', cancel_conversation),
-                CallbackQueryHandler(cancel_approval_handler, pattern="^cancel_approval$"),
-            ],
-            per_message=False, per_user=True, per_chat=True
-        )
-
-        # Add handlers
-        application.add_handler(CommandHandler("start", start_command))
-        application.add_handler(CommandHandler("status", status_command))
-        application.add_handler(CommandHandler("dashboard", dashboard_command))
-
-        application.add_handler(dashboard_conv_handler)
-        application.add_handler(approve_conv_handler)
-
-        application.add_handler(CallbackQueryHandler(display_user_list, pattern="^check_user$"))
-        application.add_handler(CallbackQueryHandler(navigate_user_list_pages, pattern="^user_page:.*"))
-        application.add_handler(CallbackQueryHandler(display_user_details, pattern="^show_detail:.*"))
-
-        application.add_handler(CallbackQueryHandler(display_detailed_stats, pattern="^stats$"))
-        application.add_handler(CallbackQueryHandler(back_to_dashboard, pattern="^back_to_dashboard$"))
-        application.add_handler(CallbackQueryHandler(dashboard_callbacks, pattern="^expiring_soon$"))
-
-        application.add_handler(CallbackQueryHandler(general_button_handler, pattern="^(extend|info|dismiss_info|noop):.*"))
-        application.add_handler(ChatMemberHandler(track_chats, ChatMemberHandler.CHAT_MEMBER))
-        application.add_handler(
-            MessageHandler(filters.Chat(chat_id=CHANNEL_ID) & filters.User(user_id=ADMIN_ID), admin_post_handler)
-        )
-
-        application.add_error_handler(error_handler)
+        application.job_queue.run_once(resume_broadcast_jobs, when=1)
+        application.job_queue.run_repeating(process_outbox, interval=OUTBOX_POLL_SECONDS, first=1)
+        application.job_queue.run_daily(reconcile_memberships, time=RECONCILE_TIME)
+        if AUTO_REMOVE_EXPIRED:
+            application.job_queue.run_repeating(
+                process_removal_queue, interval=REMOVAL_POLL_SECONDS, first=REMOVAL_POLL_SECONDS
+            )
 
         logger.info("Starting bot...")
-        application.run_polling(allowed_updates=Update.ALL_TYPES)
+        run_application(application)
 
     except Exception as e:
         logger.error(f"Failed to start bot: {e}")